@@ -0,0 +1,334 @@
+"""
+Benchmark suite for loading, dosing, staging, treatment plans and reports.
+
+Runs on synthetic protocol databases and patient cohorts generated from a fixed
+seed, so results are comparable between runs and machines:
+
+    python benchmarks/bench.py -o tulos.json
+    python benchmarks/bench.py --koot 10,1000 -o uusi.json --vertaa tulos.json
+
+With --vertaa the run is compared to an earlier result file and the exit status
+is 1 if any benchmark got slower than the threshold (default 30 %).
+"""
+import argparse
+import csv
+import glob
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from oncology_helper import logic
+from oncology_helper.batch import kasittele
+from oncology_helper.data import TNM_DATA, ProtokollaVarasto, Tietokanta
+from oncology_helper.logic import (laske_annos_mg, laske_bsa, laske_cockcroft_gault, laske_maarays,
+                                   laske_stage_rintasyopa, maarita_hoitosuunnitelma_rintasyopa)
+from oncology_helper.report import muodosta_raportti
+from oncology_helper.staging import koodi
+
+TULOSVERSIO = 1
+
+# (name, unit, dose range, tablet strengths) of the synthetic drugs
+_LAAKEPOHJAT: List[Tuple[str, str, Tuple[float, float], List[str]]] = [
+    ("Syklofosfamidi", "mg/m2", (500, 1000), []),
+    ("Doksorubisiini", "mg/m2", (25, 60), []),
+    ("Karboplatiini", "AUC", (4, 6), []),
+    ("Paklitakseli", "mg/m2", (80, 175), []),
+    ("Pembrolitsumabi", "mg/kg", (2, 2), []),
+    ("Bleomysiini", "mg (kiinteä)", (15, 30), []),
+    ("Kapesitabiini", "mg/m2", (1000, 1250), ["500 mg", "150 mg"]),
+    ("Prednisoloni", "mg", (40, 100), ["20 mg", "5 mg"]),
+    ("Etoposidi (PO)", "mg/m2", (50, 100), ["50 mg", "100 mg"]),
+]
+
+def luo_protokollat(n: int, siemen: int = 1) -> Dict[str, Any]:
+    """Synthetic med_data.json contents with `n` protocols of 1-5 drugs."""
+    rnd = random.Random(siemen)
+    data = {}
+    for i in range(n):
+        laakkeet = []
+        for nimi, yks, (lo, hi), koot in rnd.sample(_LAAKEPOHJAT, rnd.randint(1, 5)):
+            laake = {"nimi": nimi, "annos": round(rnd.uniform(lo, hi)), "yksikkö": yks,
+                     "reseptiohje": "iv", "max_mg": None, "päivät": rnd.choice(["D1", "D1-5", "D1, D8", "D1-14"])}
+            if koot:
+                laake["tablettikoot"] = koot
+            laakkeet.append(laake)
+        data[f"Protokolla {i:06d}"] = {
+            "sykli": rnd.choice(["14 vrk", "21 vrk", "28 vrk"]),
+            "kontrollit": "PVK, Krea, ALAT",
+            "esilääkitys": "Antiemeetit",
+            "lääkkeet": laakkeet,
+        }
+    return data
+
+def luo_kohortti(n: int, protokollat: List[str], siemen: int = 1) -> List[Dict[str, Any]]:
+    """Synthetic patient rows in the batch input format."""
+    rnd = random.Random(siemen)
+    return [{
+        "id": i,
+        "pituus": round(rnd.uniform(150, 200), 1),
+        "paino": round(rnd.uniform(40, 130), 1),
+        "ika": rnd.randint(20, 90),
+        "krea": rnd.randint(40, 200),
+        "sukupuoli": rnd.choice(["Mies", "Nainen"]),
+        "protokolla": rnd.choice(protokollat),
+    } for i in range(n)]
+
+def mittaa(fn: Callable[[], Any], operaatiot: int, toistot: int,
+           valmistele: Optional[Callable[[], Any]] = None, min_aika: float = 0.05) -> Dict[str, Any]:
+    """
+    Times `fn` `toistot` times (after an optional untimed `valmistele` each time).
+
+    Without `valmistele`, fast functions are called several times per run so
+    that a run takes at least `min_aika` seconds, as `timeit` does.
+
+    Returns:
+        Dict[str, Any]: Counts, min/median wall time of one call and the
+        per-operation time of the fastest run.
+    """
+    kierrokset = 1
+    if valmistele is None:
+        t = time.perf_counter()
+        fn()
+        kesto = time.perf_counter() - t
+        if kesto < min_aika:
+            kierrokset = int(min_aika / max(kesto, 1e-9)) + 1
+
+    ajat = []
+    for _ in range(toistot):
+        if valmistele is not None:
+            valmistele()
+        t = time.perf_counter()
+        for _ in range(kierrokset):
+            fn()
+        ajat.append((time.perf_counter() - t) / kierrokset)
+    return {
+        "operaatiot": operaatiot,
+        "toistot": toistot,
+        "kierrokset": kierrokset,
+        "min_s": min(ajat),
+        "mediaani_s": statistics.median(ajat),
+        "per_op_us": min(ajat) / max(operaatiot, 1) * 1e6,
+    }
+
+def _lataus(polku: str, koko: int, toistot: int) -> Dict[str, Dict[str, Any]]:
+    def poista_sivuindeksi():
+        for sivu in [polku + ".idx"] + glob.glob(glob.escape(polku) + ".*.snap"):
+            if os.path.exists(sivu):
+                os.remove(sivu)
+
+    def kaanna_kaikki():
+        for _ in Tietokanta.data.values():
+            pass
+
+    return {
+        f"lataa_kylma[{koko}]": mittaa(lambda: Tietokanta.lataa(polku), 1, toistot, poista_sivuindeksi),
+        f"lataa_lammin[{koko}]": mittaa(lambda: Tietokanta.lataa(polku), 1, toistot),
+        f"avaa_json[{koko}]": mittaa(lambda: ProtokollaVarasto.avaa(polku), 1, toistot),
+        f"kaanna_kaikki[{koko}]": mittaa(kaanna_kaikki, koko, toistot, lambda: Tietokanta.lataa(polku)),
+    }
+
+def _annostus(protokollat, kohortti, toistot) -> Dict[str, Dict[str, Any]]:
+    def potilaittain():
+        for r in kohortti:
+            bsa = laske_bsa(r["pituus"], r["paino"])
+            gfr = laske_cockcroft_gault(r["ika"], r["paino"], r["krea"], r["sukupuoli"])
+            for med in protokollat[r["protokolla"]].laakkeet:
+                mg = laske_annos_mg(med.annos, med.yksikko, bsa, r["paino"], gfr)
+                laske_maarays(mg, med.vahvuudet[0] if med.vahvuudet else None)
+
+    syote = io.StringIO()
+    w = csv.DictWriter(syote, fieldnames=list(kohortti[0]))
+    w.writeheader()
+    w.writerows(kohortti)
+    syote = syote.getvalue()
+
+    def eraajo():
+        kasittele(io.StringIO(syote), io.StringIO(), protokollat, "csv", "jsonl")
+
+    tulokset = {
+        "annostus_potilas": mittaa(potilaittain, len(kohortti), toistot),
+        "annostus_eraajo": mittaa(eraajo, len(kohortti), toistot),
+    }
+
+    try:
+        from oncology_helper.dosing import laske_kohortti
+    except ImportError:
+        return tulokset
+
+    ryhmat: Dict[str, List[Dict[str, Any]]] = {}
+    for r in kohortti:
+        ryhmat.setdefault(r["protokolla"], []).append(r)
+
+    def kohorteittain():
+        for nimi, rivit in ryhmat.items():
+            laske_kohortti([r["pituus"] for r in rivit], [r["paino"] for r in rivit],
+                           [r["ika"] for r in rivit], [r["krea"] for r in rivit],
+                           [r["sukupuoli"] for r in rivit], protokollat[nimi])
+
+    tulokset["annostus_kohortti_numpy"] = mittaa(kohorteittain, len(kohortti), toistot)
+
+    from oncology_helper.logic import safe_float
+    from oncology_helper.parsing import jasenna_luvut
+    # Weights as a Finnish CSV column ("80,5")
+    painot = [str(r["paino"]).replace(".", ",") for r in kohortti]
+    tulokset["jasennys_safe_float"] = mittaa(lambda: [safe_float(p) for p in painot], len(painot), toistot)
+    tulokset["jasennys_numpy"] = mittaa(lambda: jasenna_luvut(painot), len(painot), toistot)
+    return tulokset
+
+def _luokitus(n: int, toistot: int, siemen: int) -> Dict[str, Dict[str, Any]]:
+    rnd = random.Random(siemen)
+    tnm = TNM_DATA["Rintasyöpä"]
+    # Codes ("T1c"), as the staging view and batch pass them; the precomputed plans are keyed by code
+    syotteet = [(koodi(rnd.choice(tnm["L1"])), koodi(rnd.choice(tnm["L2"])), koodi(rnd.choice(tnm["L3"])))
+                for _ in range(n)]
+    suunnitelmat = [
+        (laske_stage_rintasyopa(t, n_, m), t, n_, m,
+         rnd.choice(["Positiivinen", "Negatiivinen"]), rnd.choice(["Positiivinen", "Negatiivinen"]),
+         rnd.choice(["Matala (<20%)", "Korkea (>=20%)"]), rnd.choice(["-", "Neoadjuvantti", "Adjuvantti"]))
+        for t, n_, m in syotteet
+    ]
+
+    def luokittele():
+        for t, n_, m in syotteet:
+            laske_stage_rintasyopa(t, n_, m)
+
+    def suunnittele():
+        for s in suunnitelmat:
+            maarita_hoitosuunnitelma_rintasyopa(*s)
+
+    tulokset = {
+        "stage_rintasyopa": mittaa(luokittele, n, toistot),
+        "hoitosuunnitelma_kylma": mittaa(suunnittele, n, toistot, logic.tyhjenna_hoitosuunnitelma_valimuisti),
+        "hoitosuunnitelma_lammin": mittaa(suunnittele, n, toistot),
+    }
+    logic.esilaske_hoitosuunnitelmat()
+    tulokset["hoitosuunnitelma_esilaskettu"] = mittaa(suunnittele, n, toistot)
+    logic.tyhjenna_hoitosuunnitelma_valimuisti()
+    return tulokset
+
+def _raportit(protokollat, kohortti, toistot) -> Dict[str, Dict[str, Any]]:
+    syotteet = []
+    for r in kohortti:
+        p = protokollat[r["protokolla"]]
+        rivit = [{"med": med, "maarays": 100, "vahvuus": med.tablettikoot[0] if med.tablettikoot else None}
+                 for med in p.laakkeet]
+        syotteet.append((r["protokolla"], p, p.kontrollit, rivit))
+
+    def raportoi():
+        for s in syotteet:
+            muodosta_raportti(*s)
+
+    return {"raportti": mittaa(raportoi, len(syotteet), toistot)}
+
+def _metatiedot(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                                text=True, cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ""
+    meta = {
+        "versio": TULOSVERSIO,
+        "aika": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "alusta": platform.platform(),
+        "koot": args.koot,
+        "potilaat": args.potilaat,
+        "toistot": args.toistot,
+        "siemen": args.siemen,
+    }
+    if "numpy" in sys.modules:
+        meta["numpy"] = sys.modules["numpy"].__version__
+    return meta
+
+def aja(args: argparse.Namespace) -> Dict[str, Any]:
+    """Runs the whole suite and returns the result document."""
+    tila = {k: getattr(Tietokanta, k) for k in ("data", "polku", "_tila", "_virhetila", "_tarkistettu")}
+    tulokset: Dict[str, Dict[str, Any]] = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            for koko in args.koot:
+                polku = os.path.join(tmp, f"med_data_{koko}.json")
+                with open(polku, "w", encoding="utf-8") as f:
+                    json.dump(luo_protokollat(koko, args.siemen), f, ensure_ascii=False, indent=4)
+                # Large files get fewer repeats; the loads already take long enough to time
+                tulokset.update(_lataus(polku, koko, args.toistot if koko <= 10000 else max(1, args.toistot // 3)))
+
+            Tietokanta.lataa(os.path.join(tmp, f"med_data_{min(args.koot)}.json"))
+            protokollat = dict(Tietokanta.data.items())
+            kohortti = luo_kohortti(args.potilaat, list(protokollat), args.siemen)
+            tulokset.update(_annostus(protokollat, kohortti, args.toistot))
+            tulokset.update(_raportit(protokollat, kohortti, args.toistot))
+            tulokset.update(_luokitus(args.potilaat, args.toistot, args.siemen))
+    finally:
+        for k, v in tila.items():
+            setattr(Tietokanta, k, v)
+    return {"meta": _metatiedot(args), "tulokset": tulokset}
+
+def vertaa(vanha: Dict[str, Any], uusi: Dict[str, Any], kynnys: float = 1.3) -> List[Dict[str, Any]]:
+    """
+    Compares two result documents by per-operation time of the fastest run.
+
+    Args:
+        vanha: Baseline results.
+        uusi: New results.
+        kynnys: Slowdown ratio (new / old) above which a benchmark counts as a regression.
+
+    Returns:
+        List[Dict[str, Any]]: One entry per benchmark present in both, with
+        "nimi", "vanha_us", "uusi_us", "suhde" and "heikentynyt".
+    """
+    rivit = []
+    for nimi, u in uusi["tulokset"].items():
+        v = vanha["tulokset"].get(nimi)
+        if v is None:
+            continue
+        suhde = u["per_op_us"] / v["per_op_us"] if v["per_op_us"] > 0 else float("inf")
+        rivit.append({"nimi": nimi, "vanha_us": v["per_op_us"], "uusi_us": u["per_op_us"],
+                      "suhde": suhde, "heikentynyt": suhde > kynnys})
+    return rivit
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Suorituskykymittaukset synteettisellä datalla.")
+    parser.add_argument("--koot", default="10,1000,100000",
+                        type=lambda s: [int(x) for x in s.split(",")],
+                        help="Protokollatietokantojen koot (oletus 10,1000,100000)")
+    parser.add_argument("--potilaat", type=int, default=5000, help="Synteettisen kohortin koko")
+    parser.add_argument("--toistot", type=int, default=5, help="Toistot per mittaus (nopein raportoidaan)")
+    parser.add_argument("--siemen", type=int, default=1)
+    parser.add_argument("-o", "--ulos", help="Tallenna tulokset JSON-tiedostoon")
+    parser.add_argument("--vertaa", help="Aiempi tulostiedosto, johon verrataan")
+    parser.add_argument("--kynnys", type=float, default=1.3,
+                        help="Hidastumissuhde, jonka ylitys on regressio (oletus 1.3)")
+    args = parser.parse_args(argv)
+
+    tulos = aja(args)
+    if args.ulos:
+        with open(args.ulos, "w", encoding="utf-8") as f:
+            json.dump(tulos, f, ensure_ascii=False, indent=2)
+
+    if not args.vertaa:
+        for nimi, r in tulos["tulokset"].items():
+            print(f"{nimi:32} {r['per_op_us']:12.2f} us/op  (min {r['min_s'] * 1e3:.1f} ms, n={r['operaatiot']})")
+        return 0
+
+    with open(args.vertaa, encoding="utf-8") as f:
+        vanha = json.load(f)
+    rivit = vertaa(vanha, tulos, args.kynnys)
+    for r in rivit:
+        merkki = "  HIDASTUI" if r["heikentynyt"] else ""
+        print(f"{r['nimi']:32} {r['vanha_us']:12.2f} -> {r['uusi_us']:12.2f} us/op  x{r['suhde']:.2f}{merkki}")
+    return 1 if any(r["heikentynyt"] for r in rivit) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
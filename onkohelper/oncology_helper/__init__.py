@@ -0,0 +1,46 @@
+"""
+Onkologian Työpöytä core: dose calculations, protocol data and reports.
+
+Importing the package costs only this file. The names below are imported from
+their modules on first access, and the GUI (`main`, `ui`) and numpy (`dosing`)
+modules are loaded only by callers that import them explicitly.
+"""
+import importlib
+from typing import Any, Dict, List
+
+__version__ = "2.3"
+
+# Public name -> defining module
+_VIENNIT: Dict[str, str] = {
+    "Tietokanta": "data",
+    "Tietokantaversio": "data",
+    "TNM_DATA": "data",
+    "ProtokollaKatalogi": "catalog",
+    "AnnosLoki": "audit",
+    "AikatauluIndeksi": "schedule",
+    "Laake": "models",
+    "Protokolla": "models",
+    "Yksikko": "models",
+    "safe_float": "logic",
+    "laske_bsa": "logic",
+    "laske_cockcroft_gault": "logic",
+    "laske_annos_mg": "logic",
+    "laske_maarays": "logic",
+    "laske_stage_rintasyopa": "logic",
+    "maarita_hoitosuunnitelma_rintasyopa": "logic",
+    "muodosta_raportti": "report",
+    "laske_stage": "staging",
+}
+
+__all__ = sorted(_VIENNIT)
+
+def __getattr__(nimi: str) -> Any:
+    moduuli = _VIENNIT.get(nimi)
+    if moduuli is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {nimi!r}")
+    arvo = getattr(importlib.import_module(f"{__name__}.{moduuli}"), nimi)
+    globals()[nimi] = arvo
+    return arvo
+
+def __dir__() -> List[str]:
+    return sorted(set(globals()) | set(_VIENNIT))
@@ -0,0 +1,319 @@
+"""
+Append-only audit log of dose calculations.
+
+Every calculation (and every manual override of a prescribed dose) made in the
+calculator views is recorded as one JSON line. `AnnosLoki.kirjaa` only queues
+the entry; a background thread appends queued entries in batches and fsyncs
+the log at most every `fsync_vali` seconds, so the UIs never wait for the disk.
+
+An SQLite index beside the log (`<log>.idx`) maps (patient, date) to byte
+offsets in the log, so a patient's history is a few seeks even in a log of
+millions of entries. The log is the source of truth: the index is always filled
+by reading the log itself from the last indexed offset, so it catches up after
+a crash, sees entries other processes appended, and can be deleted at any time.
+"""
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional
+
+_SKEEMA = """
+CREATE TABLE IF NOT EXISTS meta (avain TEXT PRIMARY KEY, arvo INTEGER);
+CREATE TABLE IF NOT EXISTS merkinta (
+    potilas TEXT NOT NULL,
+    paiva TEXT NOT NULL,
+    siirto INTEGER NOT NULL,
+    pituus INTEGER NOT NULL,
+    PRIMARY KEY (potilas, paiva, siirto)
+) WITHOUT ROWID;
+"""
+
+# Bytes read per step when indexing the log
+_LUKUKOKO = 1 << 20
+
+class AnnosLoki:
+    """
+    Append-only JSONL audit log with a patient/date index.
+
+    Entries are written by one background thread per log object; lookups may
+    come from any thread.
+    """
+
+    def __init__(self, polku: str, kirjoitusvali: float = 0.5, fsync_vali: float = 5.0, puskuri: int = 1000):
+        """
+        Args:
+            polku: Log file path; created if missing.
+            kirjoitusvali: Seconds queued entries may wait before being written.
+            fsync_vali: Minimum seconds between fsyncs of the log.
+            puskuri: Queue length that triggers a write before `kirjoitusvali`.
+        """
+        self.polku = polku
+        self.kirjoitusvali = kirjoitusvali
+        self.fsync_vali = fsync_vali
+        self.puskuri = puskuri
+        self._jono: List[bytes] = []
+        self._ehto = threading.Condition()
+        # Serializes writing, indexing and reading of the files
+        self._lukko = threading.Lock()
+        self._suljettu = False
+        # A failed write left a partial line at the end of the log
+        self._kesken = False
+        self._fsync_aika = time.monotonic()
+
+        hakemisto = os.path.dirname(os.path.abspath(polku))
+        os.makedirs(hakemisto, exist_ok=True)
+        # Unbuffered: a failed write leaves nothing behind to be written twice on retry
+        self._loki = open(polku, "ab", buffering=0)
+        self._indeksi = sqlite3.connect(polku + ".idx", check_same_thread=False, isolation_level=None)
+        # The index is rebuilt from the log if lost, so it need not be durable itself
+        self._indeksi.execute("PRAGMA journal_mode=WAL")
+        self._indeksi.execute("PRAGMA synchronous=OFF")
+        self._indeksi.executescript(_SKEEMA)
+        with self._lukko:
+            self._korjaa_loppu()
+            self._indeksoi()
+
+        self._saie = threading.Thread(target=self._kirjoittaja, name="AnnosLoki", daemon=True)
+        self._saie.start()
+
+    def kirjaa(self, merkinta: Dict[str, Any]) -> None:
+        """
+        Queues one entry. Never blocks on I/O.
+
+        Args:
+            merkinta: JSON-compatible dict. "aika" (ISO time) is added if
+                missing; "potilas" is the patient identifier used by the index.
+        """
+        if "aika" not in merkinta:
+            merkinta = dict(merkinta, aika=datetime.now().isoformat(timespec="seconds"))
+        rivi = json.dumps(merkinta, ensure_ascii=False).encode("utf-8") + b"\n"
+        with self._ehto:
+            if self._suljettu:
+                raise ValueError("Loki on suljettu")
+            self._jono.append(rivi)
+            if len(self._jono) >= self.puskuri:
+                self._ehto.notify()
+
+    def kirjoita(self, fsync: bool = True) -> None:
+        """
+        Writes queued entries now (and fsyncs the log).
+
+        Raises:
+            OSError: If the log cannot be written; the entries stay queued.
+        """
+        self._kirjoita_jono(fsync)
+
+    def historia(self, potilas: str, alku: Optional[str] = None, loppu: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        Returns a patient's entries in log order.
+
+        Args:
+            potilas: Patient identifier.
+            alku: First date to include ("YYYY-MM-DD").
+            loppu: Last date to include ("YYYY-MM-DD").
+
+        Returns:
+            List[Dict[str, Any]]: The entries, including ones still queued.
+        """
+        self.kirjoita(fsync=False)
+        with self._lukko:
+            # Also picks up entries other processes appended
+            self._indeksoi()
+            siirrot = self._indeksi.execute(
+                "SELECT siirto, pituus FROM merkinta WHERE potilas = ? AND paiva BETWEEN ? AND ? ORDER BY siirto",
+                (potilas, alku or "", loppu or "9999-12-31"),
+            ).fetchall()
+            tulos = []
+            with open(self.polku, "rb") as f:
+                for siirto, pituus in siirrot:
+                    f.seek(siirto)
+                    tulos.append(json.loads(f.read(pituus)))
+        return tulos
+
+    def sulje(self) -> None:
+        """Writes and fsyncs queued entries and closes the files."""
+        with self._ehto:
+            if self._suljettu:
+                return
+            self._suljettu = True
+            self._ehto.notify()
+        self._saie.join()
+        try:
+            self._kirjoita_jono(fsync=True)
+        finally:
+            with self._lukko:
+                self._loki.close()
+                self._indeksi.close()
+
+    def _kirjoittaja(self) -> None:
+        while True:
+            with self._ehto:
+                if not self._jono and not self._suljettu:
+                    self._ehto.wait(self.kirjoitusvali)
+                if self._suljettu:
+                    return
+                if not self._jono:
+                    continue
+            try:
+                self._kirjoita_jono(time.monotonic() - self._fsync_aika >= self.fsync_vali)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Virhe kirjoitettaessa annoslokia ({self.polku}): {e}")
+                # The entries stay queued; wait before retrying
+                with self._ehto:
+                    if not self._suljettu:
+                        self._ehto.wait(self.kirjoitusvali)
+
+    def _kirjoita_jono(self, fsync: bool) -> None:
+        # The queue is taken under the file lock, so batches reach the log in queue order
+        with self._lukko:
+            with self._ehto:
+                rivit, self._jono = self._jono, []
+            self._kirjoita(rivit, fsync)
+
+    def _kirjoita(self, rivit: List[bytes], fsync: bool) -> None:
+        if rivit:
+            data = b"".join(rivit)
+            kirjoitettu = 0
+            try:
+                if self._kesken:
+                    # End the partial line so the batch starts on a line of its own
+                    _kirjoita_osa(self._loki, b"\n")
+                    self._kesken = False
+                # One append per batch; O_APPEND keeps batches from several processes whole.
+                # An unbuffered write can still be short, so the rest is written until done
+                while kirjoitettu < len(data):
+                    kirjoitettu += _kirjoita_osa(self._loki, data[kirjoitettu:])
+            except OSError:
+                if kirjoitettu:
+                    self._kesken = data[kirjoitettu - 1:kirjoitettu] != b"\n"
+                # Entries not written whole go back to the front of the queue; audit entries are not dropped
+                with self._ehto:
+                    self._jono[:0] = rivit[data.count(b"\n", 0, kirjoitettu):]
+                raise
+        if fsync:
+            os.fsync(self._loki.fileno())
+            self._fsync_aika = time.monotonic()
+        if rivit:
+            self._indeksoi()
+
+    def _korjaa_loppu(self) -> None:
+        # A crash mid-write can leave a partial last line; end it so the next entry starts clean
+        koko = os.path.getsize(self.polku)
+        if koko:
+            with open(self.polku, "rb") as f:
+                f.seek(koko - 1)
+                if f.read(1) != b"\n":
+                    _kirjoita_osa(self._loki, b"\n")
+
+    def _indeksoi(self) -> None:
+        """Indexes the log from the last indexed offset to its end."""
+        c = self._indeksi
+        c.execute("BEGIN IMMEDIATE")
+        try:
+            rivi = c.execute("SELECT arvo FROM meta WHERE avain = 'pituus'").fetchone()
+            siirto = rivi[0] if rivi else 0
+            koko = os.path.getsize(self.polku)
+            if koko < siirto:
+                # The log was replaced or truncated: start over
+                c.execute("DELETE FROM merkinta")
+                siirto = 0
+            with open(self.polku, "rb") as f:
+                f.seek(siirto)
+                loppu = b""
+                while True:
+                    lohko = f.read(_LUKUKOKO)
+                    if not lohko:
+                        break
+                    data = loppu + lohko
+                    viimeinen = data.rfind(b"\n") + 1
+                    c.executemany("INSERT OR IGNORE INTO merkinta VALUES (?, ?, ?, ?)",
+                                  _avaimet(data[:viimeinen], siirto))
+                    siirto += viimeinen
+                    loppu = data[viimeinen:]
+            c.execute("INSERT OR REPLACE INTO meta VALUES ('pituus', ?)", (siirto,))
+            c.execute("COMMIT")
+        except BaseException:
+            c.execute("ROLLBACK")
+            raise
+
+def _kirjoita_osa(f: BinaryIO, data: bytes) -> int:
+    """Writes `data` to an unbuffered file and returns how many bytes were written (at least one)."""
+    n = f.write(data)
+    if not n:
+        raise OSError(f"Kirjoitus ei edennyt ({getattr(f, 'name', '?')})")
+    return n
+
+def _avaimet(data: bytes, siirto: int) -> Iterable[tuple]:
+    """(patient, date, offset, length) for each complete line of `data`."""
+    alku = 0
+    while alku < len(data):
+        loppu = data.index(b"\n", alku) + 1
+        try:
+            m = json.loads(data[alku:loppu])
+            yield str(m.get("potilas") or ""), str(m.get("aika") or "")[:10], siirto + alku, loppu - alku
+        except (ValueError, AttributeError):
+            # Partial line from a crash, or not an entry
+            pass
+        alku = loppu
+
+def laskentamerkinta(lahde: str, tapahtuma: str, potilas: str, protokolla: str,
+                     potilastiedot: Dict[str, Any], bsa: float, gfr: float,
+                     laakkeet: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Builds the audit entry of one calculation.
+
+    Args:
+        lahde: Where the calculation was made ("tk", "streamlit").
+        tapahtuma: "laskenta" for a new calculation, "muutos" for a manual override.
+        potilas: Patient identifier ("" if not entered).
+        protokolla: Protocol name.
+        potilastiedot: Inputs (pituus, paino, ika, krea, sukupuoli).
+        bsa: BSA in m2.
+        gfr: GFR in mL/min.
+        laakkeet: One dict per drug with "nimi", "annos", "yksikkö", "vahvuus",
+            "mg" (calculated), "laskettu" (rounded prescription) and "määräys"
+            (the prescription shown, possibly edited).
+
+    Returns:
+        Dict[str, Any]: Entry for `AnnosLoki.kirjaa`; each drug gets "muutettu".
+    """
+    return {
+        "potilas": potilas,
+        "lähde": lahde,
+        "tapahtuma": tapahtuma,
+        "protokolla": protokolla,
+        **potilastiedot,
+        "bsa": round(bsa, 4),
+        "gfr": round(gfr, 2),
+        "lääkkeet": [dict(l, muutettu=str(l["määräys"]).strip() != str(l["laskettu"])) for l in laakkeet],
+    }
+
+_OLETUS: Optional[AnnosLoki] = None
+_OLETUS_LUKKO = threading.Lock()
+_OLETUS_VIRHE = False
+
+def oletusloki() -> Optional[AnnosLoki]:
+    """
+    The application's audit log: $ONKOHELPER_ANNOSLOKI, or
+    ~/.onkohelper/annosloki.jsonl. Opened on first use and closed at exit.
+
+    Returns:
+        Optional[AnnosLoki]: The log, or None if it cannot be opened (the
+        calculators keep working without it).
+    """
+    global _OLETUS, _OLETUS_VIRHE
+    with _OLETUS_LUKKO:
+        if _OLETUS is None and not _OLETUS_VIRHE:
+            polku = os.environ.get("ONKOHELPER_ANNOSLOKI") or os.path.join(
+                os.path.expanduser("~"), ".onkohelper", "annosloki.jsonl")
+            try:
+                _OLETUS = AnnosLoki(polku)
+                atexit.register(_OLETUS.sulje)
+            except (OSError, sqlite3.Error) as e:
+                _OLETUS_VIRHE = True
+                print(f"Virhe avattaessa annoslokia ({polku}): {e}")
+        return _OLETUS
@@ -0,0 +1,312 @@
+"""
+Headless batch dosing: patient CSV/JSONL in, dose reports out.
+
+Rows are streamed one at a time, so memory use does not grow with the input
+size. This module must not import tkinter or streamlit.
+
+Input columns: pituus, paino, ika, krea, sukupuoli, protokolla
+(optional: id, labrat). The "luokitus" task reads t, n, m instead
+(optional: id, tauti, er, her2, ki67, hoitolinja), and the "aikataulu" task
+protokolla, alkupvm (optional: id, syklit).
+"""
+import argparse
+import csv
+import json
+import sys
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Any, Iterator, TextIO, Tuple, Union
+
+from oncology_helper.data import Tietokanta
+from oncology_helper.logic import (lue_luku, laske_bsa, laske_cockcroft_gault, laske_annos_mg, laske_maarays,
+                                   maarita_hoitosuunnitelma_rintasyopa)
+from oncology_helper.models import KAIKKI_VAHVUUDET
+from oncology_helper.report import muodosta_raportti
+from oncology_helper.schedule import jasenna_pvm, laajenna_hoidot
+from oncology_helper.staging import laske_stage
+from oncology_helper.timing import ajasta
+
+class Virheellinen(NamedTuple):
+    """An input row that could not be read; `kasittele_rivi` reports it as a failed row."""
+    virhe: str
+
+def lue_potilaat(f: TextIO, muoto: str = "csv") -> Iterator[Union[Dict[str, Any], Virheellinen]]:
+    """
+    Streams patient rows from a CSV or JSONL file.
+
+    Args:
+        f: Open text file.
+        muoto: "csv" or "jsonl". The CSV delimiter (",", ";" or tab) is detected from the header.
+
+    Yields:
+        Dict[str, Any]: One patient row, or `Virheellinen` for a JSONL line that
+        is not valid JSON or not an object.
+    """
+    if muoto == "jsonl":
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rivi = json.loads(line)
+            except ValueError as e:
+                yield Virheellinen(f"Virheellinen JSON: {e}")
+                continue
+            yield rivi if isinstance(rivi, dict) else Virheellinen("Rivi ei ole JSON-objekti")
+        return
+
+    header = f.readline()
+    delimiter = max([",", ";", "\t"], key=header.count)
+    fieldnames = [c.strip() for c in next(csv.reader([header], delimiter=delimiter))]
+    yield from csv.DictReader(f, fieldnames=fieldnames, delimiter=delimiter)
+
+@ajasta("annokset.potilas")
+def laske_potilas(rivi: Dict[str, Any], protokollat: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Calculates all doses and the report for one patient row.
+
+    Tablet drugs combine all listed strengths, as the calculator views do by default.
+
+    Args:
+        rivi: Patient row (see module docstring for columns).
+        protokollat: Protocol data, e.g. `Tietokanta.data`.
+
+    Returns:
+        Dict[str, Any]: Structured result with "bsa", "gfr", "lääkkeet" and "raportti".
+
+    Raises:
+        ValueError: If the protocol is unknown, or pituus, paino, ika or krea is
+            missing, not a number or not positive.
+    """
+    nimi = str(rivi.get("protokolla") or "").strip()
+    if nimi not in protokollat:
+        raise ValueError(f"Tuntematon protokolla: {nimi!r}")
+    protokolla = protokollat[nimi]
+
+    paino = lue_luku(rivi, "paino")
+    bsa = laske_bsa(lue_luku(rivi, "pituus"), paino)
+    gfr = laske_cockcroft_gault(lue_luku(rivi, "ika"), paino, lue_luku(rivi, "krea"),
+                                str(rivi.get("sukupuoli") or "Mies").strip())
+
+    laakkeet: List[Dict[str, Any]] = []
+    raporttirivit: List[Dict[str, Any]] = []
+    for med in protokolla.laakkeet:
+        vahvuus = med.tablettikoot[0] if med.tablettikoot else None
+        if len(med.tablettikoot) > 1:
+            # Combine all strengths; the combination tables are cached per strength set
+            vahvuus = KAIKKI_VAHVUUDET
+        mg = laske_annos_mg(med.annos, med.yksikko, bsa, paino, gfr)
+        fin = laske_maarays(mg, med.vahvuudet_valinnalle(vahvuus))
+        laakkeet.append({"nimi": med.nimi, "mg": mg, "määräys": fin, "vahvuus": vahvuus,
+                         "päivät": med.paivat})
+        raporttirivit.append({"med": med, "maarays": fin, "vahvuus": vahvuus})
+
+    labrat = rivi.get("labrat") or protokolla.kontrollit
+    return {
+        "id": rivi.get("id"),
+        "protokolla": nimi,
+        "bsa": bsa,
+        "gfr": gfr,
+        "lääkkeet": laakkeet,
+        "raportti": muodosta_raportti(nimi, protokolla, labrat, raporttirivit),
+    }
+
+def luokittele_potilas(rivi: Dict[str, Any], protokollat: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Stage group (and breast cancer treatment plan) for one registry row.
+
+    Args:
+        rivi: Row with "t", "n", "m" (codes or full selection labels),
+            optionally "tauti" (a TNM disease of TNM_DATA, default "Rintasyöpä")
+            and "er", "her2", "ki67" and "hoitolinja" for the breast cancer plan.
+        protokollat: Unused; present so all row tasks share one signature.
+
+    Returns:
+        Dict[str, Any]: "id", "tauti", "t", "n", "m", "stage", "suunnitelma"
+        (None without receptor data) and "raportti" (text form).
+
+    Raises:
+        ValueError: If T, N or M is missing or the disease has no stage rules.
+    """
+    tauti = str(rivi.get("tauti") or "").strip() or "Rintasyöpä"
+    tnm = []
+    for k in ("t", "n", "m"):
+        arvo = str(rivi.get(k) or "").split(":")[0].strip()
+        if not arvo:
+            raise ValueError(f"Puuttuva kenttä: {k}")
+        tnm.append(arvo)
+    t, n, m = tnm
+    stage = laske_stage(tauti, t, n, m)
+
+    suunnitelma = None
+    if tauti == "Rintasyöpä" and rivi.get("er") and rivi.get("her2") and rivi.get("ki67"):
+        suunnitelma = maarita_hoitosuunnitelma_rintasyopa(stage, t, n, m, str(rivi["er"]), str(rivi["her2"]),
+                                                          str(rivi["ki67"]), rivi.get("hoitolinja"))
+    raportti = f"{t} {n} {m}: {stage}"
+    if suunnitelma:
+        raportti += "\n" + suunnitelma
+    return {"id": rivi.get("id"), "tauti": tauti, "t": t, "n": n, "m": m, "stage": stage,
+            "suunnitelma": suunnitelma, "raportti": raportti}
+
+def aikatauluta_potilas(rivi: Dict[str, Any], protokollat: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Dated administration days of one patient's treatment course.
+
+    Args:
+        rivi: Row with "protokolla", "alkupvm" (day 1 of the first cycle,
+            "YYYY-MM-DD" or "d.m.yyyy") and optionally "id" and "syklit" (default 1).
+        protokollat: Protocol data, e.g. `Tietokanta.data`.
+
+    Returns:
+        Dict[str, Any]: "id", "protokolla", "antojaksot" (laake, sykli, alku,
+        loppu per interval) and "raportti" (text form).
+
+    Raises:
+        ValueError: If the protocol is unknown, the date or cycle count is invalid,
+            or several cycles are asked of a protocol without a cycle length.
+    """
+    nimi = str(rivi.get("protokolla") or "").strip()
+    if nimi not in protokollat:
+        raise ValueError(f"Tuntematon protokolla: {nimi!r}")
+    try:
+        syklit = lue_luku(rivi, "syklit") if rivi.get("syklit") not in (None, "") else 1.0
+    except ValueError:
+        syklit = 0.0
+    if syklit < 1 or not syklit.is_integer():
+        raise ValueError(f"Virheellinen syklimäärä: {rivi.get('syklit')!r}")
+    syklit = int(syklit)
+    potilas = str(rivi.get("id") or "")
+    jaksot = list(laajenna_hoidot([(potilas, protokollat[nimi], jasenna_pvm(rivi.get("alkupvm") or ""), syklit)]))
+
+    raportti = [f"{potilas or '-'}: {nimi}"]
+    for j in jaksot:
+        paivat = f"{j.alku:%d.%m.%Y}" if j.alku == j.loppu else f"{j.alku:%d.%m.%Y}-{j.loppu:%d.%m.%Y}"
+        raportti.append(f"  Sykli {j.sykli}: {j.laake} {paivat}")
+    return {"id": rivi.get("id"), "protokolla": nimi,
+            "antojaksot": [{"laake": j.laake, "sykli": j.sykli, "alku": j.alku.isoformat(),
+                            "loppu": j.loppu.isoformat()} for j in jaksot],
+            "raportti": "\n".join(raportti)}
+
+# Row tasks: name -> function(row, protocols) returning a result dict with "raportti"
+TEHTAVAT: Dict[str, Callable[[Dict[str, Any], Dict[str, Any]], Dict[str, Any]]] = {
+    "annokset": laske_potilas,
+    "luokitus": luokittele_potilas,
+    "aikataulu": aikatauluta_potilas,
+}
+
+def kasittele_rivi(i: int, rivi: Union[Dict[str, Any], Virheellinen], protokollat: Dict[str, Any],
+                   muoto_ulos: str = "teksti", tehtava: str = "annokset") -> Tuple[Optional[str], Optional[str]]:
+    """
+    Runs one row task and formats its output record.
+
+    Args:
+        i: Row number (1-based), for error messages.
+        rivi: Input row, or `Virheellinen` for an unreadable one.
+        protokollat: Protocol data, e.g. `Tietokanta.data`.
+        muoto_ulos: "teksti" or "jsonl".
+        tehtava: Key of `TEHTAVAT`.
+
+    Returns:
+        Tuple[Optional[str], Optional[str]]: (output record or None, error message or None).
+    """
+    try:
+        if isinstance(rivi, Virheellinen):
+            raise ValueError(rivi.virhe)
+        tulos = TEHTAVAT[tehtava](rivi, protokollat)
+    except ValueError as e:
+        virhe = f"Rivi {i}: {e}"
+        if muoto_ulos == "jsonl":
+            tunniste = None if isinstance(rivi, Virheellinen) else rivi.get("id")
+            return json.dumps({"rivi": i, "id": tunniste, "virhe": str(e)}, ensure_ascii=False) + "\n", virhe
+        return None, virhe
+
+    if muoto_ulos == "jsonl":
+        return json.dumps(tulos, ensure_ascii=False) + "\n", None
+    return tulos["raportti"], None
+
+def kirjoita_tulokset(ulos: TextIO, tulokset: Iterable[Tuple[Optional[str], Optional[str]]],
+                      muoto_ulos: str = "teksti", virheet: Optional[TextIO] = None) -> Tuple[int, int]:
+    """
+    Writes `kasittele_rivi` results in order.
+
+    Returns:
+        Tuple[int, int]: (rows written, rows failed).
+    """
+    virheet = virheet or sys.stderr
+    ok = 0
+    failed = 0
+    for tietue, virhe in tulokset:
+        if virhe is not None:
+            failed += 1
+            print(virhe, file=virheet)
+            if tietue is not None:
+                ulos.write(tietue)
+            continue
+
+        if muoto_ulos != "jsonl" and ok:
+            ulos.write("\n\n")
+        ulos.write(tietue)
+        ok += 1
+
+    if muoto_ulos != "jsonl" and ok:
+        ulos.write("\n")
+    return ok, failed
+
+def kasittele(sisaan: TextIO, ulos: TextIO, protokollat: Dict[str, Any],
+              muoto_sisaan: str = "csv", muoto_ulos: str = "teksti",
+              virheet: Optional[TextIO] = None, tehtava: str = "annokset") -> Tuple[int, int]:
+    """
+    Streams patients from `sisaan` through the dosing logic into `ulos`.
+
+    Args:
+        sisaan: Input file (CSV or JSONL).
+        ulos: Output file.
+        protokollat: Protocol data, e.g. `Tietokanta.data`.
+        muoto_sisaan: "csv" or "jsonl".
+        muoto_ulos: "teksti" (report text, blank line between patients) or "jsonl".
+        virheet: Where to report bad rows (default stderr).
+        tehtava: "annokset" (doses and report), "luokitus" (stage group and breast cancer plan)
+            or "aikataulu" (administration days).
+
+    Returns:
+        Tuple[int, int]: (rows written, rows failed).
+    """
+    tulokset = (kasittele_rivi(i, rivi, protokollat, muoto_ulos, tehtava)
+                for i, rivi in enumerate(lue_potilaat(sisaan, muoto_sisaan), 1))
+    return kirjoita_tulokset(ulos, tulokset, muoto_ulos, virheet)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Sytostaattiannosten eräajo (CSV/JSONL -> raportit).")
+    parser.add_argument("syote", help="Potilastiedosto (.csv tai .jsonl), '-' = stdin")
+    parser.add_argument("-o", "--ulos", default="-", help="Tulostiedosto, '-' = stdout")
+    parser.add_argument("--muoto", choices=["teksti", "jsonl"], default="teksti", help="Tulosteen muoto")
+    parser.add_argument("--syotemuoto", choices=["csv", "jsonl"], help="Syötteen muoto (oletus: päätteestä)")
+    parser.add_argument("--tehtava", choices=sorted(TEHTAVAT), default="annokset",
+                        help="annokset (annokset ja raportti), luokitus (levinneisyysryhmä ja rintasyövän hoitosuunnitelma) "
+                             "tai aikataulu (antopäivät)")
+    parser.add_argument("-j", "--tyoprosessit", type=int, default=1,
+                        help="Rinnakkaisten työprosessien määrä (0 = kaikki ytimet, oletus 1)")
+    args = parser.parse_args(argv)
+
+    muoto_sisaan = args.syotemuoto or ("jsonl" if args.syote.endswith((".jsonl", ".ndjson")) else "csv")
+
+    Tietokanta.lataa()
+
+    sisaan = sys.stdin if args.syote == "-" else open(args.syote, "r", encoding="utf-8-sig", newline="")
+    ulos = sys.stdout if args.ulos == "-" else open(args.ulos, "w", encoding="utf-8", newline="")
+    try:
+        if args.tyoprosessit == 1:
+            ok, failed = kasittele(sisaan, ulos, Tietokanta.data, muoto_sisaan, args.muoto, tehtava=args.tehtava)
+        else:
+            from oncology_helper.parallel import kasittele_rinnakkain
+            ok, failed = kasittele_rinnakkain(sisaan, ulos, Tietokanta.polku, muoto_sisaan, args.muoto,
+                                              tehtava=args.tehtava, tyoprosessit=args.tyoprosessit or None)
+    finally:
+        if sisaan is not sys.stdin:
+            sisaan.close()
+        if ulos is not sys.stdout:
+            ulos.close()
+
+    print(f"Käsitelty {ok} potilasta, {failed} virheellistä riviä.", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
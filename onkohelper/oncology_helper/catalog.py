@@ -0,0 +1,168 @@
+"""
+Optional SQLite protocol catalogue with full-text search.
+
+The catalogue is a local SQLite file (or an in-memory database) imported from
+the protocol data. It indexes protocols by name, drug name, diagnosis and unit,
+and answers prefix searches through an FTS5 table.
+"""
+import os
+import re
+import sqlite3
+import threading
+from typing import List, Mapping, Optional
+
+from oncology_helper.models import Protokolla
+
+_SKEEMA = """
+CREATE TABLE IF NOT EXISTS meta (avain TEXT PRIMARY KEY, arvo TEXT);
+CREATE TABLE IF NOT EXISTS protokolla (
+    id INTEGER PRIMARY KEY,
+    nimi TEXT NOT NULL UNIQUE,
+    sykli TEXT,
+    diagnoosi TEXT COLLATE NOCASE
+);
+CREATE TABLE IF NOT EXISTS laake (
+    protokolla_id INTEGER NOT NULL REFERENCES protokolla(id),
+    jarjestys INTEGER NOT NULL,
+    nimi TEXT NOT NULL COLLATE NOCASE,
+    annos REAL,
+    yksikko TEXT NOT NULL,
+    paivat TEXT
+);
+CREATE INDEX IF NOT EXISTS laake_nimi ON laake(nimi);
+CREATE INDEX IF NOT EXISTS laake_yksikko ON laake(yksikko, nimi);
+CREATE INDEX IF NOT EXISTS protokolla_diagnoosi ON protokolla(diagnoosi);
+CREATE VIRTUAL TABLE IF NOT EXISTS protokolla_fts USING fts5(
+    nimi, laakkeet, diagnoosi, yksikot, prefix='2 3 4'
+);
+"""
+
+_SANA = re.compile(r"\w+", re.UNICODE)
+
+def _fts_kysely(teksti: str) -> str:
+    """Turns free text into an FTS5 query where every word is a prefix term."""
+    return " ".join(f'"{sana}"*' for sana in _SANA.findall(teksti))
+
+class ProtokollaKatalogi:
+    """
+    SQLite-backed protocol catalogue.
+
+    One connection is shared between threads and serialized with a lock.
+    """
+
+    def __init__(self, polku: str = ":memory:"):
+        self.polku = polku
+        self._lukko = threading.Lock()
+        self._yhteys = sqlite3.connect(polku, check_same_thread=False)
+        self._yhteys.executescript(_SKEEMA)
+
+    @classmethod
+    def rakenna(cls, polku: str, protokollat: Mapping[str, Protokolla], tiiviste: str = "") -> "ProtokollaKatalogi":
+        """
+        Builds a catalogue file from scratch and atomically replaces `polku` with it.
+
+        Args:
+            polku: Catalogue file path.
+            protokollat: Protocol data, e.g. `Tietokanta.data`.
+            tiiviste: Content hash of the source data, stored for freshness checks.
+        """
+        tmp = f"{polku}.{os.getpid()}.tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        uusi = cls(tmp)
+        uusi.tuo(protokollat, tiiviste)
+        uusi.sulje()
+        os.replace(tmp, polku)
+        return cls(polku)
+
+    def tuo(self, protokollat: Mapping[str, Protokolla], tiiviste: str = "") -> None:
+        """
+        Replaces the catalogue contents with `protokollat`.
+
+        Args:
+            protokollat: Protocol data, e.g. `Tietokanta.data`.
+            tiiviste: Content hash of the source data.
+        """
+        with self._lukko, self._yhteys as c:
+            c.execute("DELETE FROM laake")
+            c.execute("DELETE FROM protokolla")
+            c.execute("DELETE FROM protokolla_fts")
+            for nimi in protokollat:
+                p = protokollat[nimi]
+                cur = c.execute("INSERT INTO protokolla (nimi, sykli, diagnoosi) VALUES (?, ?, ?)",
+                                (nimi, p.sykli, p.diagnoosi))
+                pid = cur.lastrowid
+                c.executemany(
+                    "INSERT INTO laake (protokolla_id, jarjestys, nimi, annos, yksikko, paivat) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(pid, i, m.nimi, m.annos, m.yksikko.value, m.paivat) for i, m in enumerate(p.laakkeet)])
+                c.execute(
+                    "INSERT INTO protokolla_fts (rowid, nimi, laakkeet, diagnoosi, yksikot) VALUES (?, ?, ?, ?, ?)",
+                    (pid, nimi, " ".join(m.nimi for m in p.laakkeet), p.diagnoosi,
+                     " ".join(sorted({m.yksikko.value for m in p.laakkeet}))))
+            c.execute("INSERT OR REPLACE INTO meta (avain, arvo) VALUES ('tiiviste', ?)", (tiiviste,))
+
+    @property
+    def tiiviste(self) -> Optional[str]:
+        """Content hash of the data the catalogue was imported from."""
+        with self._lukko:
+            row = self._yhteys.execute("SELECT arvo FROM meta WHERE avain = 'tiiviste'").fetchone()
+        return row[0] if row else None
+
+    def hae(self, teksti: str, raja: int = 50) -> List[str]:
+        """
+        Full-text prefix search over protocol names, drug names, diagnoses and units.
+
+        Args:
+            teksti: Search words; each one is matched as a prefix (e.g., "karbo auc").
+            raja: Maximum number of results.
+
+        Returns:
+            List[str]: Matching protocol names, best match first.
+        """
+        kysely = _fts_kysely(teksti)
+        if not kysely:
+            return []
+        with self._lukko:
+            rows = self._yhteys.execute(
+                "SELECT p.nimi FROM protokolla_fts f JOIN protokolla p ON p.id = f.rowid "
+                "WHERE protokolla_fts MATCH ? ORDER BY bm25(protokolla_fts) LIMIT ?",
+                (kysely, raja)).fetchall()
+        return [r[0] for r in rows]
+
+    def protokollat_laakkeella(self, laake: str, yksikko: Optional[str] = None) -> List[str]:
+        """
+        Protocols containing a drug whose name starts with `laake`.
+
+        Args:
+            laake: Drug name prefix, case-insensitive (e.g., "karboplatiini").
+            yksikko: Only count the drug when it is dosed in this unit (e.g., "AUC").
+
+        Returns:
+            List[str]: Protocol names in import order.
+        """
+        sql = ("SELECT DISTINCT p.nimi FROM laake l JOIN protokolla p ON p.id = l.protokolla_id "
+               "WHERE l.nimi LIKE ? ESCAPE '\\'")
+        args: list = [laake.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"]
+        if yksikko is not None:
+            sql += " AND l.yksikko = ?"
+            args.append(yksikko)
+        sql += " ORDER BY p.id"
+        with self._lukko:
+            rows = self._yhteys.execute(sql, args).fetchall()
+        return [r[0] for r in rows]
+
+    def protokollat_diagnoosilla(self, diagnoosi: str) -> List[str]:
+        """
+        Protocols whose diagnosis equals `diagnoosi` (case-insensitive).
+
+        Returns:
+            List[str]: Protocol names in import order.
+        """
+        with self._lukko:
+            rows = self._yhteys.execute(
+                "SELECT nimi FROM protokolla WHERE diagnoosi = ? ORDER BY id", (diagnoosi,)).fetchall()
+        return [r[0] for r in rows]
+
+    def sulje(self) -> None:
+        with self._lukko:
+            self._yhteys.close()
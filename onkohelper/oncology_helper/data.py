@@ -1,6 +1,16 @@
+import hashlib
 import json
 import os
-from typing import Dict, List, Optional, Any
+import re
+import threading
+import time
+from types import MappingProxyType
+from typing import Dict, List, Optional, Any, Iterator, Mapping, NamedTuple, Tuple
+
+from oncology_helper.models import Protokolla, kaanna_protokolla
+from oncology_helper.snapshot import (Tilannekuva, avaa_tuore, kirjoita as kirjoita_tilannekuva, siivoa,
+                                      tilannekuvan_polku)
+from oncology_helper.timing import ajasta
 
 # TNM Data for staging
 TNM_DATA: Dict[str, Dict[str, Any]] = {
@@ -58,6 +68,53 @@ TNM_DATA: Dict[str, Dict[str, Any]] = {
     }
 }
 
+# Stage group decision tables of the TNM diseases in TNM_DATA. Rules are tried
+# in order and the first match wins. A rule matches when each of its "T", "N"
+# and "M" lists (if given) holds a prefix of the code, so "N1" also matches
+# "N1mi". Codes no rule matches are "Ei määritettävissä". The tables are
+# compiled into lookup arrays by oncology_helper.staging.
+STAGE_SAANNOT: Dict[str, List[Dict[str, Any]]] = {
+    "Rintasyöpä": [
+        {"M": ["M1"], "stage": "Stage IV"},
+        {"N": ["N3"], "stage": "Stage IIIC"},
+        {"T": ["T4"], "stage": "Stage IIIB"},
+        {"N": ["N2"], "stage": "Stage IIIA"},
+        {"T": ["T3"], "N": ["N1"], "stage": "Stage IIIA"},
+        {"T": ["T3"], "N": ["N0"], "stage": "Stage IIB"},
+        {"T": ["T2"], "N": ["N1"], "stage": "Stage IIB"},
+        # Before the N1 rule below, which would also match N1mi
+        {"T": ["T0", "T1"], "N": ["N1mi"], "stage": "Stage IB"},
+        {"T": ["T0", "T1"], "N": ["N1"], "stage": "Stage IIA"},
+        {"T": ["T2"], "N": ["N0"], "stage": "Stage IIA"},
+        {"T": ["T1"], "N": ["N0"], "stage": "Stage IA"},
+        {"T": ["Tis"], "N": ["N0"], "stage": "Stage 0"},
+    ],
+    # Stages I-IIIC also depend on PSA and the Gleason grade group, which are not selected here
+    "Eturauhassyöpä": [
+        {"M": ["M1"], "stage": "Stage IVB"},
+        {"N": ["N1"], "stage": "Stage IVA"},
+        {"T": ["T3", "T4"], "N": ["N0"], "stage": "Stage IIIB-IIIC (Gleason-ryhmän mukaan)"},
+        {"T": ["T1", "T2"], "N": ["N0"], "stage": "Stage I-IIIC (PSA:n ja Gleason-ryhmän mukaan)"},
+    ],
+    "Keuhkosyöpä (NSCLC)": [
+        {"M": ["M1c"], "stage": "Stage IVB"},
+        {"M": ["M1"], "stage": "Stage IVA"},
+        {"T": ["T3", "T4"], "N": ["N3"], "stage": "Stage IIIC"},
+        {"N": ["N3"], "stage": "Stage IIIB"},
+        {"T": ["T3", "T4"], "N": ["N2"], "stage": "Stage IIIB"},
+        {"N": ["N2"], "stage": "Stage IIIA"},
+        {"T": ["T3", "T4"], "N": ["N1"], "stage": "Stage IIIA"},
+        {"N": ["N1"], "stage": "Stage IIB"},
+        {"T": ["T4"], "N": ["N0"], "stage": "Stage IIIA"},
+        {"T": ["T3"], "N": ["N0"], "stage": "Stage IIB"},
+        {"T": ["T2b"], "N": ["N0"], "stage": "Stage IIA"},
+        {"T": ["T2"], "N": ["N0"], "stage": "Stage IB"},
+        {"T": ["T1c"], "N": ["N0"], "stage": "Stage IA3"},
+        {"T": ["T1b"], "N": ["N0"], "stage": "Stage IA2"},
+        {"T": ["T1"], "N": ["N0"], "stage": "Stage IA1"},
+    ],
+}
+
 def luo_esimerkkidata() -> None:
     """Creates med_data.json with example data if it is missing."""
     esimerkkidata = {
@@ -80,18 +137,218 @@ def luo_esimerkkidata() -> None:
     except Exception as e:
         print(f"Varoitus: Ei voitu luoda esimerkkidataa: {e}")
 
+# Strings and brackets; everything else in the JSON is skipped over by the index scan
+_JSON_TOKEN = re.compile(rb'"(?:[^"\\]|\\.)*"|[{}\[\]]')
+_INDEKSI_VERSIO = 1
+
+def _indeksoi(raw: bytes) -> Dict[str, Tuple[int, int]]:
+    """
+    Scans a JSON object and returns {top-level key: (offset, length)} of each value
+    without decoding the values.
+
+    Raises:
+        ValueError: If the document is not an object of objects/arrays/strings.
+    """
+    index: Dict[str, Tuple[int, int]] = {}
+    depth = 0
+    key: Optional[str] = None
+    start = 0
+    last_end = 0
+    for m in _JSON_TOKEN.finditer(raw):
+        tok = m.group()
+        if depth == 1 and key is not None and raw[last_end:m.start()].strip(b" \t\r\n:"):
+            raise ValueError("Tietokannan ylätason arvot eivät ole objekteja.")
+        c = tok[:1]
+        if c == b'"':
+            if depth == 1:
+                if key is None:
+                    key = json.loads(tok)
+                else:
+                    index[key] = (m.start(), m.end() - m.start())
+                    key = None
+        elif c in (b"{", b"["):
+            depth += 1
+            if depth == 2:
+                start = m.start()
+        else:
+            if depth == 2 and key is not None:
+                index[key] = (start, m.end() - start)
+                key = None
+            depth -= 1
+        last_end = m.end()
+    if depth != 0 or key is not None:
+        raise ValueError("Tietokannan JSON on katkennut.")
+    return index
+
+class ProtokollaVarasto(Mapping[str, Protokolla]):
+    """
+    Read-only mapping of protocol name -> compiled `Protokolla`.
+
+    Keeps the raw file bytes and a name -> (offset, length) index, and decodes
+    and compiles a protocol only when it is first accessed.
+    """
+
+    def __init__(self, raw: bytes, index: Dict[str, Tuple[int, int]], tiiviste: str = ""):
+        self._raw = raw
+        self._index = index
+        self._cache: Dict[str, Protokolla] = {}
+        self.tiiviste = tiiviste
+
+    @classmethod
+    def avaa(cls, filepath: str, raw: Optional[bytes] = None) -> "ProtokollaVarasto":
+        """
+        Opens a protocol file, using the sidecar index (<file>.idx) when it
+        matches the file contents and writing a new one otherwise.
+
+        Args:
+            filepath: Path of the JSON file.
+            raw: File contents, if already read.
+        """
+        if raw is None:
+            with open(filepath, "rb") as f:
+                raw = f.read()
+        tiiviste = hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+        index = _lue_sivuindeksi(filepath + ".idx", tiiviste)
+        if index is None:
+            index = _indeksoi(raw)
+            _kirjoita_sivuindeksi(filepath + ".idx", tiiviste, index)
+        return cls(raw, index, tiiviste)
+
+    def __getitem__(self, nimi: str) -> Protokolla:
+        try:
+            return self._cache[nimi]
+        except KeyError:
+            pass
+        alku, pituus = self._index[nimi]
+        arvo = kaanna_protokolla(nimi, json.loads(self._raw[alku:alku + pituus]))
+        # Threads racing on the same protocol all get the object stored first
+        return self._cache.setdefault(nimi, arvo)
+
+    def __contains__(self, nimi: object) -> bool:
+        return nimi in self._index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._index)
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+def _lue_sivuindeksi(polku: str, tiiviste: str) -> Optional[Dict[str, Tuple[int, int]]]:
+    try:
+        with open(polku, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        if d.get("versio") != _INDEKSI_VERSIO or d.get("tiiviste") != tiiviste:
+            return None
+        return {nimi: (alku, pituus) for nimi, alku, pituus in d["indeksi"]}
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+def _kirjoita_sivuindeksi(polku: str, tiiviste: str, index: Dict[str, Tuple[int, int]]) -> None:
+    d = {
+        "versio": _INDEKSI_VERSIO,
+        "tiiviste": tiiviste,
+        "indeksi": [[nimi, alku, pituus] for nimi, (alku, pituus) in index.items()],
+    }
+    try:
+        tmp = f"{polku}.{os.getpid()}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(d, f, ensure_ascii=False)
+        os.replace(tmp, polku)
+    except OSError:
+        # Read-only install: the index is simply rebuilt on the next start
+        pass
+
+def _avaa_tietokanta(filepath: str, lahde: Tuple[int, int], raw: Optional[bytes] = None) -> Mapping[str, Protokolla]:
+    """
+    Opens a protocol file through its snapshot when one was built from the file
+    as it is now. Otherwise reads the file and builds the snapshot under a new
+    name, so snapshots mapped by this or other processes are never replaced;
+    if that fails (e.g. a read-only install) the file is used directly.
+
+    Args:
+        filepath: Path of the JSON file.
+        lahde: (mtime_ns, size) of the file.
+        raw: File contents, if already read.
+    """
+    polku = tilannekuvan_polku(filepath, lahde)
+    kuva = avaa_tuore(polku, lahde)
+    if kuva is not None:
+        return kuva
+    varasto = ProtokollaVarasto.avaa(filepath, raw)
+    try:
+        kirjoita_tilannekuva(polku, varasto, varasto.tiiviste, lahde)
+        kuva = Tilannekuva.avaa(polku)
+    except Exception as e:
+        # Another process may have built and mapped the same snapshot first
+        kuva = avaa_tuore(polku, lahde)
+        if kuva is None:
+            print(f"Virhe luotaessa tilannekuvaa ({polku}): {e}")
+            return varasto
+    siivoa(filepath, polku)
+    return kuva
+
+class Tietokantaversio(NamedTuple):
+    """
+    One loaded version of the protocol data. Immutable: the protocols are a
+    read-only mapping of `Protokolla` tuples, so any number of threads can
+    share it without locks or copies.
+    """
+    versio: int
+    polku: Optional[str]
+    protokollat: Mapping[str, Protokolla]
+
+    @property
+    def tiiviste(self) -> str:
+        """Content hash of the source file ("" if unknown)."""
+        return getattr(self.protokollat, "tiiviste", "")
+
+_TYHJA: Mapping[str, Protokolla] = MappingProxyType({})
+
 class Tietokanta:
-    """Handles loading and accessing protocol data."""
-    data: Dict[str, Any] = {}
+    """
+    Handles loading and accessing protocol data.
+
+    A load builds the new data completely and then installs it as a new
+    `nykyinen` in one assignment, so readers see either the old or the new
+    version, never a partial one. Code that reads the data several times (a
+    Streamlit rerun, one request) should take `Tietokanta.nykyinen` once and
+    use that version throughout.
+    """
+    nykyinen: Tietokantaversio = Tietokantaversio(0, None, _TYHJA)
+    # The protocols and version number of `nykyinen`
+    data: Mapping[str, Protokolla] = _TYHJA
+    versio: int = 0
+    polku: Optional[str] = None
+    _tila: Optional[Tuple[int, int]] = None
+    _virhetila: Optional[Tuple[int, int]] = None
+    _tarkistettu: float = 0.0
+    _lukko = threading.Lock()
+    # SQLite catalogue built from `data`, and the `versio` it was built for
+    _katalogi: Any = None
+    _katalogi_versio: int = -1
+    # (versio, in-memory catalogue) of the last older version searched
+    _vanha_katalogi: Tuple[int, Any] = (-1, None)
 
     @classmethod
-    def lataa(cls) -> None:
-        """Loads data from med_data.json, creating it if necessary."""
+    @ajasta("tietokanta.lataa")
+    def lataa(cls, polku: Optional[str] = None) -> None:
+        """
+        Loads data from med_data.json, creating it if necessary.
+
+        The data is opened through its memory-mapped snapshot (see `snapshot`),
+        which is rebuilt first if the file has changed. Processes opening the
+        same snapshot share its pages.
+
+        Args:
+            polku: Load this file instead of the package's med_data.json. A
+                ".snap" path opens that snapshot alone, without the JSON.
+        """
         # Determines path relative to this file
         base_dir = os.path.dirname(os.path.abspath(__file__))
-        filepath = os.path.join(base_dir, "med_data.json")
+        filepath = polku or os.path.join(base_dir, "med_data.json")
 
-        if not os.path.exists(filepath):
+        if polku is None and not os.path.exists(filepath):
             # Fallback to current working directory if not found in package dir (e.g. dev environment)
             if os.path.exists("med_data.json"):
                 filepath = "med_data.json"
@@ -109,9 +366,158 @@ class Tietokanta:
                 except:
                     pass
         
+        with cls._lukko:
+            cls.polku = filepath
+            try:
+                st = os.stat(filepath)
+                tila = (st.st_mtime_ns, st.st_size)
+                if filepath.endswith(".snap"):
+                    cls._asenna(Tilannekuva.avaa(filepath), tila)
+                else:
+                    cls._asenna(_avaa_tietokanta(filepath, tila), tila)
+            except Exception as e:
+                print(f"Virhe ladattaessa tietokantaa ({filepath}): {e}")
+                cls._asenna(_TYHJA, None)
+
+    @classmethod
+    def paivita(cls, min_vali: float = 0.0) -> bool:
+        """
+        Reloads the data file if it has changed since the last load.
+
+        The file's mtime and size are checked first; the content is hashed only
+        when they differ, and re-indexed (and its snapshot rebuilt) only when
+        the hash differs. The new data is installed as a new `nykyinen`, so a
+        caller holding the previous version keeps a consistent view. On a read
+        or parse error (e.g. a half-written file) the old data is kept.
+
+        Args:
+            min_vali: Skip the check if the previous one was less than this many seconds ago.
+
+        Returns:
+            bool: True if new data was installed.
+        """
+        if cls.polku is None:
+            cls.lataa()
+            return True
+
+        nyt = time.monotonic()
+        if nyt - cls._tarkistettu < min_vali:
+            return False
+        cls._tarkistettu = nyt
+
         try:
-            with open(filepath, "r", encoding="utf-8") as f:
-                cls.data = json.load(f)
-        except Exception as e:
-            print(f"Virhe ladattaessa tietokantaa ({filepath}): {e}")
-            cls.data = {}
+            st = os.stat(cls.polku)
+        except OSError:
+            return False
+        tila = (st.st_mtime_ns, st.st_size)
+        if tila == cls._tila or tila == cls._virhetila:
+            return False
+
+        with cls._lukko:
+            if tila == cls._tila or tila == cls._virhetila:
+                return False
+            try:
+                if cls.polku.endswith(".snap"):
+                    varasto = Tilannekuva.avaa(cls.polku)
+                    if varasto.tiiviste == getattr(cls.data, "tiiviste", None):
+                        cls._tila = tila
+                        return False
+                else:
+                    with open(cls.polku, "rb") as f:
+                        raw = f.read()
+                    tiiviste = hashlib.blake2b(raw, digest_size=16).hexdigest()
+                    if tiiviste == getattr(cls.data, "tiiviste", None):
+                        cls._tila = tila
+                        return False
+                    varasto = _avaa_tietokanta(cls.polku, tila, raw)
+            except (OSError, ValueError) as e:
+                print(f"Virhe ladattaessa tietokantaa uudelleen ({cls.polku}): {e}")
+                cls._virhetila = tila
+                return False
+            cls._asenna(varasto, tila)
+            return True
+
+    @classmethod
+    def _asenna(cls, data: Mapping[str, Protokolla], tila: Optional[Tuple[int, int]]) -> None:
+        if isinstance(data, dict):
+            data = MappingProxyType(data)
+        nykyinen = Tietokantaversio(cls.nykyinen.versio + 1, cls.polku, data)
+        cls.nykyinen = nykyinen
+        cls.data = nykyinen.protokollat
+        cls.versio = nykyinen.versio
+        cls._tila = tila
+
+    @classmethod
+    def katalogi(cls, kanta: Optional[Tietokantaversio] = None):
+        """
+        Returns the SQLite search catalogue (`ProtokollaKatalogi`) for the current data.
+
+        The catalogue is stored next to the data file (<file>.sqlite) and rebuilt
+        only when the data's content hash changes. If the file cannot be written
+        the catalogue is kept in memory.
+
+        Args:
+            kanta: Version the caller is working with (default `nykyinen`).
+                An older version (e.g. held by a Streamlit fragment across a
+                reload) gets an in-memory catalogue; the file always belongs
+                to the current version.
+        """
+        kanta = kanta or cls.nykyinen
+        data, versio = kanta.protokollat, kanta.versio
+        if cls._katalogi is not None and cls._katalogi_versio == versio:
+            return cls._katalogi
+
+        from oncology_helper.catalog import ProtokollaKatalogi
+        if versio == cls.nykyinen.versio:
+            with cls._lukko:
+                # Reloads install under the same lock, so the version cannot go stale here
+                if versio == cls.nykyinen.versio:
+                    return cls._katalogi_tiedostoon(kanta)
+
+        vanha_versio, katalogi = cls._vanha_katalogi
+        if vanha_versio != versio:
+            katalogi = ProtokollaKatalogi()
+            katalogi.tuo(data, kanta.tiiviste)
+            cls._vanha_katalogi = (versio, katalogi)
+        return katalogi
+
+    @classmethod
+    def _katalogi_tiedostoon(cls, kanta: Tietokantaversio):
+        from oncology_helper.catalog import ProtokollaKatalogi
+        if cls._katalogi is not None and cls._katalogi_versio == kanta.versio:
+            return cls._katalogi
+        data, tiiviste = kanta.protokollat, kanta.tiiviste
+        katalogi = None
+        if kanta.polku and tiiviste:
+            polku = kanta.polku + ".sqlite"
+            try:
+                katalogi = ProtokollaKatalogi(polku)
+                if katalogi.tiiviste != tiiviste:
+                    katalogi.sulje()
+                    katalogi = ProtokollaKatalogi.rakenna(polku, data, tiiviste)
+            except Exception as e:
+                print(f"Virhe luotaessa hakuluetteloa ({polku}): {e}")
+                katalogi = None
+        if katalogi is None:
+            katalogi = ProtokollaKatalogi()
+            katalogi.tuo(data, tiiviste)
+        # The previous catalogue may still be in use by another thread; it is
+        # closed when the last reference goes away
+        cls._katalogi = katalogi
+        cls._katalogi_versio = kanta.versio
+        return katalogi
+
+    @classmethod
+    def hae(cls, teksti: str, raja: int = 50, kanta: Optional[Tietokantaversio] = None) -> List[str]:
+        """
+        Full-text prefix search over protocol names, drugs, diagnoses and units.
+
+        Args:
+            teksti: Search text.
+            raja: Maximum number of results.
+            kanta: Version to search (default `nykyinen`).
+
+        Returns:
+            List[str]: Matching protocol names, best match first.
+        """
+        return cls.katalogi(kanta).hae(teksti, raja)
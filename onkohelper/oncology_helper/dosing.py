@@ -0,0 +1,215 @@
+"""
+Vectorized dose calculation for whole patient cohorts.
+
+The functions mirror the scalar formulas in `oncology_helper.logic`, but take
+NumPy arrays (one element per patient) so that a whole cohort is dosed with a
+handful of array operations instead of a Python loop per patient.
+"""
+from typing import Dict, List, Optional, Any, Sequence, Union
+
+import numpy as np
+
+from oncology_helper.logic import TAULU_MAX, tablettitaulu
+from oncology_helper.models import KAIKKI_VAHVUUDET, Protokolla, vahvuus_mg
+
+ArrayLike = Union[Sequence[float], np.ndarray]
+
+def laske_bsa_sarja(height_cm: ArrayLike, weight_kg: ArrayLike) -> np.ndarray:
+    """
+    Calculates BSA (Mosteller) for a cohort. See `logic.laske_bsa`.
+
+    Args:
+        height_cm: Heights in centimeters.
+        weight_kg: Weights in kilograms.
+
+    Returns:
+        np.ndarray: BSA in m2, 0.0 where inputs are invalid.
+    """
+    h = np.asarray(height_cm, dtype=np.float64)
+    w = np.asarray(weight_kg, dtype=np.float64)
+    valid = (h > 0) & (w > 0)
+    return np.where(valid, np.sqrt(np.where(valid, h * w, 0.0) / 3600), 0.0)
+
+def laske_gfr_sarja(age: ArrayLike, weight_kg: ArrayLike, creatinine: ArrayLike,
+                    sex: Union[str, Sequence[str], np.ndarray]) -> np.ndarray:
+    """
+    Calculates Cockcroft-Gault GFR for a cohort. See `logic.laske_cockcroft_gault`.
+
+    Args:
+        age: Ages in years.
+        weight_kg: Weights in kilograms.
+        creatinine: Serum creatinine in micromol/L.
+        sex: 'Mies' / 'Nainen' per patient, or one value for the whole cohort.
+
+    Returns:
+        np.ndarray: GFR in mL/min, 0.0 where creatinine is invalid.
+    """
+    a = np.asarray(age, dtype=np.float64)
+    w = np.asarray(weight_kg, dtype=np.float64)
+    k = np.asarray(creatinine, dtype=np.float64)
+    valid = k > 0
+    gfr = np.where(valid, ((140 - a) * w) / (0.814 * np.where(valid, k, 1.0)), 0.0)
+    nainen = np.asarray(sex) == "Nainen"
+    return np.where(nainen, gfr * 0.85, gfr)
+
+def laske_mg_sarja(annos: ArrayLike, yksikko: Union[str, Sequence[str], np.ndarray],
+                   bsa: ArrayLike, weight_kg: ArrayLike, gfr: ArrayLike) -> np.ndarray:
+    """
+    Calculates absolute doses in mg. See `logic.laske_annos_mg`.
+
+    All arguments broadcast against each other, so this works both for one drug
+    over a cohort (scalar dose and unit) and for one patient over a drug table
+    (array of doses and units).
+
+    Args:
+        annos: Dose in the protocol unit.
+        yksikko: 'mg/m2', 'mg/kg', 'AUC' or a fixed-dose unit.
+        bsa: BSA in m2.
+        weight_kg: Weight in kilograms.
+        gfr: GFR in mL/min.
+
+    Returns:
+        np.ndarray: Dose in mg.
+    """
+    a = np.asarray(annos, dtype=np.float64)
+    u = np.asarray(yksikko)
+    b = np.asarray(bsa, dtype=np.float64)
+    w = np.asarray(weight_kg, dtype=np.float64)
+    g = np.asarray(gfr, dtype=np.float64)
+    # Calvert formula with the GFR capped at 125 ml/min
+    return np.select(
+        [u == "mg/m2", u == "mg/kg", u == "AUC"],
+        [a * b, a * w, a * (np.minimum(g, 125) + 25)],
+        default=a,
+    )
+
+def laske_maarays_sarja(mg: ArrayLike, vahvuus: Union[str, float, ArrayLike, None] = None) -> np.ndarray:
+    """
+    Rounds calculated doses to prescribed amounts. See `logic.laske_maarays`.
+
+    Args:
+        mg: Calculated doses in mg.
+        vahvuus: Tablet strength, as a label (e.g., "40 mg") or in mg, if any.
+            An array gives one strength per dose, NaN meaning no tablet.
+
+    Returns:
+        np.ndarray: Prescribed doses in mg (int64).
+    """
+    x = np.asarray(mg, dtype=np.float64)
+    if vahvuus is None or isinstance(vahvuus, str):
+        strength = vahvuus_mg(vahvuus)
+        vahvuus = np.nan if strength is None else strength
+    s = np.asarray(vahvuus, dtype=np.float64)
+    tabletit = s > 0
+    s_turva = np.where(tabletit, s, 1.0)
+    return np.select(
+        [np.isnan(s), tabletit],
+        [np.rint(x), np.trunc(np.rint(x / s_turva) * s_turva)],
+        default=np.trunc(x),
+    ).astype(np.int64)
+
+def laske_yhdistelmat_sarja(mg: ArrayLike, vahvuudet: Sequence[float]) -> np.ndarray:
+    """
+    Rounds calculated doses to the closest dose achievable by combining
+    tablet strengths. See `logic.ratkaise_tabletit`.
+
+    The doses are looked up in the cached table of the strength set with
+    array operations, using the same tie-breaking as the scalar solver.
+
+    Args:
+        mg: Calculated doses in mg.
+        vahvuudet: Available strengths in mg (at least one positive).
+
+    Returns:
+        np.ndarray: Prescribed doses in mg (int64).
+    """
+    taulu = tablettitaulu(vahvuudet)
+    m = np.asarray(mg, dtype=np.float64)
+    x = m / taulu.askel
+    taulukossa = (x > 0) & (x <= TAULU_MAX)
+    xt = np.where(taulukossa, x, 0.0)
+    ala = np.floor(xt).astype(np.int64)
+    yla = np.ceil(xt).astype(np.int64)
+    maara, alas, ylos = (np.asarray(t, dtype=np.int64) for t in taulu.taulukot(int(yla.max(initial=0))))
+    a, b = alas[ala], ylos[yla]
+    da, db = xt - a, b - xt
+    pyoristetty = np.rint(xt)
+    tasan = np.where(pyoristetty == a, a, np.where(pyoristetty == b, b, np.where(maara[a] < maara[b], a, b)))
+    k = np.where(np.abs(da - db) > 1e-9, np.where(da < db, a, b), tasan)
+    tulos = np.trunc(np.round(k * taulu.askel, 6)).astype(np.int64)
+    # Nonsense doses beyond the table go through the scalar solver
+    for i in np.flatnonzero(x > TAULU_MAX).tolist():
+        tulos.flat[i] = int(taulu.ratkaise(float(m.flat[i])).mg)
+    return tulos
+
+def laske_maaraykset_sarja(mg: ArrayLike, vahvuudet: Sequence[Sequence[float]]) -> np.ndarray:
+    """
+    Rounds doses that each have their own tablet strengths, e.g. one patient's
+    drug table. See `logic.laske_maarays` with a tuple of strengths.
+
+    Doses with one strength (or none) are rounded in one `laske_maarays_sarja`
+    call, and doses combining strengths in one `laske_yhdistelmat_sarja` call
+    per strength set.
+
+    Args:
+        mg: Calculated doses in mg.
+        vahvuudet: Per dose, the strengths in mg to use (empty for no tablet).
+
+    Returns:
+        np.ndarray: Prescribed doses in mg (int64).
+    """
+    m = np.asarray(mg, dtype=np.float64)
+    yhdistelmat = [len(v) > 1 and any(x > 0 for x in v) for v in vahvuudet]
+    tulos = laske_maarays_sarja(m, [np.nan if y or not v else v[0] for v, y in zip(vahvuudet, yhdistelmat)])
+    ryhmat: Dict[tuple, List[int]] = {}
+    for i, (v, y) in enumerate(zip(vahvuudet, yhdistelmat)):
+        if y:
+            ryhmat.setdefault(tuple(v), []).append(i)
+    for v, indeksit in ryhmat.items():
+        tulos[indeksit] = laske_yhdistelmat_sarja(m[indeksit], v)
+    return tulos
+
+def laske_kohortti(height_cm: ArrayLike, weight_kg: ArrayLike, age: ArrayLike,
+                   creatinine: ArrayLike, sex: Union[str, Sequence[str], np.ndarray],
+                   protokolla: Protokolla) -> Dict[str, Any]:
+    """
+    Calculates every drug of a protocol for a whole cohort in one call.
+
+    A drug with several tablet strengths gets the nearest dose its strengths can
+    make together (the calculators' "Kaikki" choice, vahvuus KAIKKI_VAHVUUDET);
+    a drug with one strength is rounded to it.
+
+    Args:
+        height_cm: Heights in centimeters.
+        weight_kg: Weights in kilograms.
+        age: Ages in years.
+        creatinine: Serum creatinine in micromol/L.
+        sex: 'Mies' / 'Nainen' per patient, or one value for the whole cohort.
+        protokolla: Protocol from `Tietokanta.data`.
+
+    Returns:
+        Dict[str, Any]: {"bsa", "gfr", "lääkkeet"}, where "lääkkeet" has one
+        entry per drug with its "mg" and "määräys" arrays.
+    """
+    w = np.asarray(weight_kg, dtype=np.float64)
+    bsa = laske_bsa_sarja(height_cm, w)
+    gfr = laske_gfr_sarja(age, w, creatinine, sex)
+
+    laakkeet: List[Dict[str, Any]] = []
+    for med in protokolla.laakkeet:
+        mg = laske_mg_sarja(med.annos, med.yksikko.value, bsa, w, gfr)
+        if len(med.tablettikoot) > 1 and any(v > 0 for v in med.vahvuudet):
+            vahvuus = KAIKKI_VAHVUUDET
+            maarays = laske_yhdistelmat_sarja(mg, med.vahvuudet)
+        else:
+            vahvuus = med.tablettikoot[0] if med.tablettikoot else None
+            maarays = laske_maarays_sarja(mg, med.vahvuudet[0] if med.vahvuudet else None)
+        laakkeet.append({
+            "nimi": med.nimi,
+            "yksikkö": med.yksikko.value,
+            "vahvuus": vahvuus,
+            "mg": mg,
+            "määräys": maarays,
+        })
+
+    return {"bsa": bsa, "gfr": gfr, "lääkkeet": laakkeet}
@@ -1,9 +1,15 @@
+import functools
 import math
-from typing import Union, List, Optional
+import sys
+import threading
+from typing import Union, List, NamedTuple, Optional, Dict, Tuple, Iterable
+from oncology_helper.models import vahvuus_mg
+from oncology_helper.staging import STAGE_TAULUT
 
 def safe_float(v: Union[str, float, int]) -> float:
     """
     Safely converts a value to float. Returns 0.0 if conversion fails.
+    For bulk input where bad values must be reported, see `parsing.jasenna_luvut`.
     
     Args:
         v: The value to convert.
@@ -18,6 +24,34 @@ def safe_float(v: Union[str, float, int]) -> float:
     except: 
         return 0.0
 
+def lue_luku(rivi: Dict[str, object], kentta: str) -> float:
+    """
+    Reads a required positive number from an input row (batch, service).
+    Unlike `safe_float`, a bad value is an error instead of 0.0.
+
+    Args:
+        rivi: Input row.
+        kentta: Field name (e.g., "paino").
+
+    Returns:
+        float: The value.
+
+    Raises:
+        ValueError: If the field is missing, not a number, or not positive.
+    """
+    v = rivi.get(kentta)
+    if v is None or (isinstance(v, str) and not v.strip()):
+        raise ValueError(f"Puuttuva kenttä: {kentta}")
+    try:
+        if isinstance(v, bool):
+            raise TypeError
+        x = float(v) if isinstance(v, (float, int)) else float(str(v).replace(",", ".").strip())
+    except (TypeError, ValueError):
+        raise ValueError(f"Virheellinen arvo: {kentta}={v!r}") from None
+    if not (math.isfinite(x) and x > 0):
+        raise ValueError(f"Virheellinen arvo: {kentta}={v!r}")
+    return x
+
 def laske_bsa(height_cm: float, weight_kg: float) -> float:
     """
     Calculates Body Surface Area (BSA) using the Mosteller formula.
@@ -77,10 +111,222 @@ def pyorista_tabletit(mg: float, strength: float) -> int:
         return int(mg)
     return int(round(mg / strength) * strength)
 
+class Tablettiyhdistelma(NamedTuple):
+    """Tablets making up one prescribed dose."""
+    mg: float
+    # (strength in mg, tablet count), strongest first; only strengths in use
+    tabletit: Tuple[Tuple[float, int], ...]
+
+    @property
+    def kpl(self) -> int:
+        return sum(n for _, n in self.tabletit)
+
+# Largest dose, in grid steps, the tables are built up to; larger (nonsense)
+# doses are split greedily instead
+TAULU_MAX = 100000
+
+class TablettiTaulu:
+    """
+    Fewest-tablet combinations for one set of tablet strengths.
+
+    Doses are tabulated on a grid whose step is the greatest common divisor of
+    the strengths. For every grid index the table holds the fewest tablets
+    reaching it (-1 if unreachable), the strength added last, and the nearest
+    reachable index below and above. It is extended on demand and shared by
+    every caller with the same strengths (see `tablettitaulu`).
+    """
+
+    def __init__(self, vahvuudet: Tuple[float, ...]):
+        # Strongest first
+        self.vahvuudet = vahvuudet
+        kerroin = 1
+        while kerroin < 10000 and any(abs(v * kerroin - round(v * kerroin)) > 1e-6 for v in vahvuudet):
+            kerroin *= 10
+        kokonaiset = [round(v * kerroin) for v in vahvuudet]
+        syt = functools.reduce(math.gcd, kokonaiset)
+        self.askel = syt / kerroin
+        self.yksikot = [k // syt for k in kokonaiset]
+        self.maara = [0]
+        self.viimeinen = [-1]
+        self.alas = [0]
+        self.ylos: List[int] = [0]
+        self._avoimet: List[int] = []
+        self._lukko = threading.Lock()
+
+    def _varmista(self, k: int) -> None:
+        """Extends the table to grid index `k` and until `ylos[k]` is known."""
+        if k < len(self.ylos) and self.ylos[k] >= 0:
+            return
+        with self._lukko:
+            maara, viimeinen, alas, ylos, yksikot = self.maara, self.viimeinen, self.alas, self.ylos, self.yksikot
+            i = len(maara)
+            while i <= k or ylos[k] < 0:
+                paras, paras_j = -1, -1
+                for j, u in enumerate(yksikot):
+                    if u <= i and maara[i - u] >= 0 and (paras < 0 or maara[i - u] + 1 < paras):
+                        paras, paras_j = maara[i - u] + 1, j
+                maara.append(paras)
+                viimeinen.append(paras_j)
+                if paras >= 0:
+                    alas.append(i)
+                    for a in self._avoimet:
+                        ylos[a] = i
+                    self._avoimet.clear()
+                    ylos.append(i)
+                else:
+                    alas.append(alas[i - 1])
+                    self._avoimet.append(i)
+                    ylos.append(-1)
+                i += 1
+
+    def taulukot(self, k: int) -> Tuple[List[int], List[int], List[int]]:
+        """
+        Returns the (maara, alas, ylos) lists, extended so that indices up to
+        `k` are filled. For vectorized lookups (see `dosing.laske_yhdistelmat_sarja`).
+        """
+        self._varmista(k)
+        return self.maara, self.alas, self.ylos
+
+    def _yhdistelma(self, k: int) -> Tablettiyhdistelma:
+        maarat = [0] * len(self.vahvuudet)
+        while k > 0:
+            j = self.viimeinen[k]
+            maarat[j] += 1
+            k -= self.yksikot[j]
+        return self._kokoa(maarat)
+
+    def _kokoa(self, maarat: List[int]) -> Tablettiyhdistelma:
+        tabletit = tuple((v, n) for v, n in zip(self.vahvuudet, maarat) if n)
+        return Tablettiyhdistelma(round(sum(v * n for v, n in tabletit), 6) + 0.0, tabletit)
+
+    def ratkaise(self, mg: float) -> Tablettiyhdistelma:
+        """
+        The achievable dose closest to `mg`, with the fewest tablets.
+
+        On a tie between the dose below and above, the one that single-strength
+        rounding (`pyorista_tabletit`) on the grid step would pick wins, then the
+        one with fewer tablets, then the larger.
+        """
+        if mg <= 0:
+            return Tablettiyhdistelma(0.0, ())
+        x = mg / self.askel
+        if x > TAULU_MAX:
+            return self._ahne(round(x))
+        k_ala = math.floor(x)
+        k_yla = math.ceil(x)
+        self._varmista(k_yla)
+        a, b = self.alas[k_ala], self.ylos[k_yla]
+        da, db = x - a, b - x
+        if abs(da - db) > 1e-9:
+            return self._yhdistelma(a if da < db else b)
+        pyoristetty = round(x)
+        if pyoristetty in (a, b):
+            return self._yhdistelma(pyoristetty)
+        if self.maara[a] < self.maara[b]:
+            return self._yhdistelma(a)
+        return self._yhdistelma(b)
+
+    def _ahne(self, k: int) -> Tablettiyhdistelma:
+        maarat = []
+        for u in self.yksikot:
+            maarat.append(k // u)
+            k -= maarat[-1] * u
+        return self._kokoa(maarat)
+
+@functools.lru_cache(maxsize=256)
+def _tablettitaulu(vahvuudet: Tuple[float, ...]) -> TablettiTaulu:
+    return TablettiTaulu(vahvuudet)
+
+def tablettitaulu(vahvuudet: Iterable[float]) -> TablettiTaulu:
+    """
+    Returns the shared combination table for a set of tablet strengths.
+
+    Args:
+        vahvuudet: Strengths in mg; zero, negative and duplicate values are ignored.
+
+    Raises:
+        ValueError: If no strength is positive.
+    """
+    avain = tuple(sorted({float(v) for v in vahvuudet if v > 0}, reverse=True))
+    if not avain:
+        raise ValueError("Ei tablettivahvuuksia")
+    return _tablettitaulu(avain)
+
+def ratkaise_tabletit(mg: float, vahvuudet: Iterable[float]) -> Tablettiyhdistelma:
+    """
+    Finds the achievable dose closest to `mg` using any of the given tablet
+    strengths, with the fewest tablets.
+
+    Args:
+        mg: Target dose in mg.
+        vahvuudet: Available strengths in mg (e.g., (40.0, 20.0)).
+
+    Returns:
+        Tablettiyhdistelma: Achieved dose and tablets, e.g. 100 mg -> 2 x 40 mg + 1 x 20 mg.
+    """
+    return tablettitaulu(vahvuudet).ratkaise(mg)
+
+def laske_annos_mg(annos: float, yksikko: str, bsa: float, paino_kg: float, gfr: float) -> float:
+    """
+    Calculates the absolute dose of one drug from its protocol dose and unit.
+    
+    Args:
+        annos: Dose in the protocol unit.
+        yksikko: 'mg/m2', 'mg/kg', 'AUC' or a fixed-dose unit (e.g. 'mg').
+        bsa: Body surface area in m2.
+        paino_kg: Weight in kilograms.
+        gfr: GFR in mL/min (used by the Calvert formula).
+        
+    Returns:
+        float: Dose in mg.
+    """
+    if yksikko == "mg/m2":
+        return annos * bsa
+    if yksikko == "mg/kg":
+        return annos * paino_kg
+    if yksikko == "AUC":
+        # Calvert formula: Dose = AUC * (GFR + 25)
+        # GFR cap is often 125 ml/min
+        return annos * (min(gfr, 125) + 25)
+    return annos
+
+def laske_maarays(mg: float, vahvuus: Union[str, float, Iterable[float], None] = None) -> int:
+    """
+    Rounds a calculated dose to the prescribed amount.
+    
+    Args:
+        mg: Calculated dose in mg.
+        vahvuus: Selected tablet strength, as a label (e.g., "40 mg") or in mg,
+            or several strengths in mg to combine (see `ratkaise_tabletit`), if any.
+        
+    Returns:
+        int: Prescribed dose in mg.
+    """
+    if vahvuus is not None and not isinstance(vahvuus, (str, int, float)):
+        vahvuudet = tuple(vahvuus)
+        if len(vahvuudet) > 1 and any(v > 0 for v in vahvuudet):
+            return int(ratkaise_tabletit(mg, vahvuudet).mg)
+        vahvuus = vahvuudet[0] if vahvuudet else None
+    strength = vahvuus_mg(vahvuus)
+    if strength is None:
+        return int(round(mg))
+    return pyorista_tabletit(mg, strength)
+
+# Breast cancer stage groups, compiled from the "Rintasyöpä" rule table in data.STAGE_SAANNOT
+_RINTA = STAGE_TAULUT["Rintasyöpä"]
+
+# Code lists of the breast cancer T/N/M selections, in TNM_DATA order
+RINTA_T_KOODIT = _RINTA.t_koodit
+RINTA_N_KOODIT = _RINTA.n_koodit
+RINTA_M_KOODIT = _RINTA.m_koodit
+
 def laske_stage_rintasyopa(t: str, n: str, m: str) -> str:
     """
     Calculates the anatomical stage group for Breast Cancer based on TNM.
     
+    Codes listed in TNM_DATA are answered from the compiled stage table; other
+    codes are matched against the rules (see `staging.StageTaulu`).
+    
     Args:
         t: T-stage string (e.g., "T1c").
         n: N-stage string (e.g., "N0").
@@ -89,42 +335,37 @@ def laske_stage_rintasyopa(t: str, n: str, m: str) -> str:
     Returns:
         str: The stage group (e.g., "Stage IIA").
     """
-    # Check for Metastasis first
-    if "M1" in m: return "Stage IV"
-    
-    # Advanced N and T
-    if "N3" in n: return "Stage IIIC"
-    if "T4" in t: return "Stage IIIB"
-    
-    # Parse T number (simplified)
-    t_n = 0
-    if "T1" in t or "T0" in t: t_n = 1
-    elif "T2" in t: t_n = 2
-    elif "T3" in t: t_n = 3
+    return _RINTA.hae(t, n, m)
+
+def laske_stage_rintasyopa_indeksi(t_index: int, n_index: int, m_index: int) -> str:
+    """
+    Returns the Breast Cancer stage group by code position in TNM_DATA.
     
-    # Stage Logic
-    if "N2" in n:
-        if t_n <= 3: return "Stage IIIA"
-        
-    if "T3" in t:
-        if "N1" in n or "N2" in n: return "Stage IIIA"
-        # T3 N0 M0 is Stage IIB
-        if "N0" in n: return "Stage IIB"
+    Args:
+        t_index: Index into RINTA_T_KOODIT.
+        n_index: Index into RINTA_N_KOODIT.
+        m_index: Index into RINTA_M_KOODIT.
         
-    if "T2" in t and "N1" in n: return "Stage IIB"
-    if "T3" in t and "N0" in n: return "Stage IIB"
-    
-    # Check N1mi first because "N1" is a substring of "N1mi"
-    if ("T0" in t or "T1" in t) and "N1mi" in n: return "Stage IB"
+    Returns:
+        str: The stage group.
+    """
+    return _RINTA.indeksi(t_index, n_index, m_index)
 
-    if ("T0" in t or "T1" in t) and "N1" in n: return "Stage IIA"
-    if "T2" in t and "N0" in n: return "Stage IIA"
-    
-    if "T1" in t and "N0" in n: return "Stage IA"
+def laske_stage_rintasyopa_sarja(t: Iterable[str], n: Iterable[str], m: Iterable[str]) -> List[str]:
+    """
+    Stages whole registry columns of Breast Cancer T/N/M codes at once.
     
-    if "Tis" in t and "N0" in n: return "Stage 0"
+    Full selection labels (e.g., "T1c: >10-20 mm") are accepted as well as codes.
     
-    return "Ei määritettävissä"
+    Args:
+        t: T-stage column.
+        n: N-stage column.
+        m: M-stage column.
+        
+    Returns:
+        List[str]: Stage group per row.
+    """
+    return _RINTA.sarja(t, n, m)
 
 def suosittele_hoito_rintasyopa(stage: str, t: str, n: str, m: str) -> str:
     """
@@ -156,12 +397,35 @@ def suosittele_hoito_rintasyopa(stage: str, t: str, n: str, m: str) -> str:
     # Early stage
     return "Suositellaan ensisijaisesti leikkausta ja adjuvanttihoitoa."
 
+# Normalized plan inputs: (stage, t, n, m, er, her2, ki67, hoitolinja)
+SuunnitelmaAvain = Tuple[str, str, str, str, str, str, str, Optional[str]]
+
+_HOITOLINJAT = ("Neoadjuvantti", "Adjuvantti")
+_SUUNNITELMA_TAULU: Dict[SuunnitelmaAvain, str] = {}
+_SUUNNITELMA_TAULU_OSUMAT = 0
+
+def _normalisoi_suunnitelma(stage: str, t: str, n: str, m: str,
+                            er: str, her2: str, ki67: str,
+                            valittu_hoitolinja: Optional[str]) -> SuunnitelmaAvain:
+    """Maps plan inputs to the canonical values the plan text actually depends on."""
+    return (
+        stage, t, n, m,
+        "Positiivinen" if er == "Positiivinen" else "Negatiivinen",
+        "Positiivinen" if her2 == "Positiivinen" else "Negatiivinen",
+        "Korkea (>=20%)" if "Korkea" in ki67 else "Matala (<20%)",
+        valittu_hoitolinja if valittu_hoitolinja in _HOITOLINJAT else None,
+    )
+
 def maarita_hoitosuunnitelma_rintasyopa(stage: str, t: str, n: str, m: str, 
                                          er: str, her2: str, ki67: str, 
                                          valittu_hoitolinja: Optional[str] = None) -> str:
     """
     Determines the comprehensive treatment plan for Breast Cancer.
     
+    Results are served from the pre-enumerated table (see
+    `esilaske_hoitosuunnitelmat`) or a bounded LRU cache keyed on the
+    normalized inputs.
+    
     Args:
         stage: Calculated stage.
         t: T-stage.
@@ -175,6 +439,67 @@ def maarita_hoitosuunnitelma_rintasyopa(stage: str, t: str, n: str, m: str,
     Returns:
         str: Detailed treatment recommendation.
     """
+    global _SUUNNITELMA_TAULU_OSUMAT
+    key = _normalisoi_suunnitelma(stage, t, n, m, er, her2, ki67, valittu_hoitolinja)
+    res = _SUUNNITELMA_TAULU.get(key)
+    if res is not None:
+        _SUUNNITELMA_TAULU_OSUMAT += 1
+        return res
+    return _hoitosuunnitelma_valimuisti(*key)
+
+def esilaske_hoitosuunnitelmat() -> int:
+    """
+    Pre-enumerates the treatment plan for every Breast Cancer T/N/M code
+    combination in TNM_DATA and every ER/HER2/Ki-67/treatment line choice.
+    
+    Identical plan texts share one interned string.
+    
+    Returns:
+        int: Number of entries in the table.
+    """
+    tekstit: Dict[str, str] = {}
+    for t in RINTA_T_KOODIT:
+        for n in RINTA_N_KOODIT:
+            for m in RINTA_M_KOODIT:
+                stage = laske_stage_rintasyopa(t, n, m)
+                for er in ("Positiivinen", "Negatiivinen"):
+                    for her2 in ("Positiivinen", "Negatiivinen"):
+                        for ki67 in ("Matala (<20%)", "Korkea (>=20%)"):
+                            for linja in (None,) + _HOITOLINJAT:
+                                key = (stage, t, n, m, er, her2, ki67, linja)
+                                res = _muodosta_hoitosuunnitelma(*key)
+                                _SUUNNITELMA_TAULU[key] = tekstit.setdefault(res, sys.intern(res))
+    return len(_SUUNNITELMA_TAULU)
+
+def hoitosuunnitelma_valimuisti_tilastot() -> Dict[str, int]:
+    """
+    Returns hit/miss counters of the treatment plan cache.
+    
+    Returns:
+        Dict[str, int]: "taulu_osumat" (pre-enumerated table hits), "osumat"
+        (LRU hits), "ohitukset" (LRU misses), "koko" (LRU entries) and
+        "taulu_koko" (pre-enumerated entries).
+    """
+    info = _hoitosuunnitelma_valimuisti.cache_info()
+    return {
+        "taulu_osumat": _SUUNNITELMA_TAULU_OSUMAT,
+        "osumat": info.hits,
+        "ohitukset": info.misses,
+        "koko": info.currsize,
+        "taulu_koko": len(_SUUNNITELMA_TAULU),
+    }
+
+def tyhjenna_hoitosuunnitelma_valimuisti() -> None:
+    """Clears the treatment plan cache, the pre-enumerated table and the counters."""
+    global _SUUNNITELMA_TAULU_OSUMAT
+    _hoitosuunnitelma_valimuisti.cache_clear()
+    _SUUNNITELMA_TAULU.clear()
+    _SUUNNITELMA_TAULU_OSUMAT = 0
+
+def _muodosta_hoitosuunnitelma(stage: str, t: str, n: str, m: str,
+                               er: str, her2: str, ki67: str,
+                               valittu_hoitolinja: Optional[str] = None) -> str:
+    """Builds the plan text for `maarita_hoitosuunnitelma_rintasyopa` (uncached)."""
     if "Stage IV" in stage or "M1" in m:
         return "Levinnyt rintasyöpä: Hoito on palliatiivista. Hoidon valinta perustuu potilaan vointiin ja biologiseen alatyyppiin (ER/HER2)."
 
@@ -251,3 +576,5 @@ def maarita_hoitosuunnitelma_rintasyopa(stage: str, t: str, n: str, m: str,
              res += "• Harkitse abemasisiklibiä adjuvanttina (korkea uusiutumisriski).\n"
 
     return res
+
+_hoitosuunnitelma_valimuisti = functools.lru_cache(maxsize=4096)(_muodosta_hoitosuunnitelma)
@@ -1,7 +1,7 @@
 import sys
 import os
 import tkinter as tk
-from tkinter import ttk
+from tkinter import ttk, filedialog
 
 # Add parent directory to path if running directly to allow absolute imports
 # This must be done BEFORE importing from the package
@@ -11,6 +11,7 @@ if __name__ == "__main__":
 from oncology_helper.data import Tietokanta
 from oncology_helper.ui.main_menu import MainMenu
 from oncology_helper.ui.calculator_view import LaskuriView
+from oncology_helper import timing
 # from oncology_helper.ui.staging_view import LevinneisyysView
 
 # High DPI support for Windows
@@ -20,6 +21,9 @@ try:
 except Exception:
     pass
 
+# How often med_data.json is checked for changes
+TIETOKANTA_TARKISTUSVALI_MS = 2000
+
 class MainApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -41,9 +45,47 @@ class MainApp(tk.Tk):
             self.frames[F.__name__].grid(row=0, column=0, sticky="nsew")
             
         self.show_frame("MainMenu")
+        self.after(TIETOKANTA_TARKISTUSVALI_MS, self.tarkista_tietokanta)
+        if timing.kaytossa():
+            self.bind("<F12>", lambda e: self.nayta_ajanotto())
 
     def show_frame(self, n):
         self.frames[n].tkraise()
 
-if __name__ == "__main__":
+    def tarkista_tietokanta(self):
+        """Picks up edits to med_data.json without restarting the app."""
+        if Tietokanta.paivita():
+            for f in self.frames.values():
+                if hasattr(f, "paivita_protokollat"):
+                    f.paivita_protokollat()
+        self.after(TIETOKANTA_TARKISTUSVALI_MS, self.tarkista_tietokanta)
+
+    def nayta_ajanotto(self):
+        """Debug panel with the timing statistics (F12 when ONKOHELPER_AJANOTTO is set)."""
+        w = tk.Toplevel(self)
+        w.title("Ajanotto")
+        txt = tk.Text(w, width=90, height=20, font=("Consolas", 9))
+        txt.pack(fill="both", expand=True)
+
+        def paivita():
+            txt.delete("1.0", tk.END)
+            txt.insert("1.0", timing.muotoile())
+
+        def tallenna():
+            polku = filedialog.asksaveasfilename(parent=w, defaultextension=".json")
+            if polku:
+                timing.tallenna(polku)
+
+        bar = ttk.Frame(w)
+        bar.pack(fill=tk.X, pady=5)
+        ttk.Button(bar, text="Päivitä", command=paivita).pack(side=tk.LEFT, padx=5)
+        ttk.Button(bar, text="Nollaa", command=lambda: (timing.nollaa(), paivita())).pack(side=tk.LEFT, padx=5)
+        ttk.Button(bar, text="Tallenna...", command=tallenna).pack(side=tk.LEFT, padx=5)
+        paivita()
+
+def main() -> None:
+    """Starts the desktop application."""
     MainApp().mainloop()
+
+if __name__ == "__main__":
+    main()
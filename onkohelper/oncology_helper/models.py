@@ -0,0 +1,195 @@
+import re
+from enum import Enum
+from typing import Dict, Optional, Any, NamedTuple, Tuple, Union
+
+class Yksikko(str, Enum):
+    """Dose unit of a drug. Members compare equal to their label strings."""
+    MG_M2 = "mg/m2"
+    MG_KG = "mg/kg"
+    AUC = "AUC"
+    MG = "mg"
+    KIINTEA = "mg (kiinteä)"
+
+    def __str__(self) -> str:
+        return self.value
+
+    @classmethod
+    def tunnista(cls, teksti: Optional[str]) -> "Yksikko":
+        """
+        Maps a unit label to a member. A missing unit is 'mg/m2' (the calculator
+        default) and an unknown label is treated as a fixed dose.
+        """
+        if teksti is None:
+            return cls.MG_M2
+        try:
+            return cls(teksti)
+        except ValueError:
+            return cls.MG
+
+# Treatment days as inclusive (first, last) day-of-cycle pairs
+Jaksot = Tuple[Tuple[int, int], ...]
+
+_PAIVA = re.compile(r"[Dd](\d+)(?:\s*-\s*[Dd]?(\d+))?")
+
+def jasenna_paivat(teksti: Optional[str]) -> Jaksot:
+    """
+    Parses a 'päivät' schedule into day intervals.
+
+    Args:
+        teksti: Schedule text (e.g., "D1", "D1-5", "D1, D2", "D1+D5+D15").
+
+    Returns:
+        Jaksot: ((first, last), ...), e.g. "D1-5, D8" -> ((1, 5), (8, 8)).
+        Empty for text without day numbers (e.g., "Jatkuva").
+    """
+    if not teksti:
+        return ()
+    jaksot = []
+    for m in _PAIVA.finditer(teksti):
+        alku = int(m.group(1))
+        loppu = int(m.group(2)) if m.group(2) else alku
+        jaksot.append((alku, max(alku, loppu)))
+    return tuple(jaksot)
+
+_SYKLI_VRK = re.compile(r"(\d+)\s*(?:vrk|vuorokau|pv|päivä)", re.IGNORECASE)
+_SYKLI_VK = re.compile(r"(\d+)\s*(?:vk|viik)", re.IGNORECASE)
+
+def jasenna_sykli(teksti: Optional[str]) -> Optional[int]:
+    """
+    Parses a 'sykli' text into the cycle length in days.
+
+    Args:
+        teksti: Cycle text (e.g., "21 vrk", "14 vuorokautta", "Viikoittainen").
+
+    Returns:
+        Optional[int]: Cycle length, e.g. "21 vrk (14 vrk lääkettä, 7 vrk tauko)" -> 21.
+        None for continuous treatment or text without a length.
+    """
+    if not teksti:
+        return None
+    m = _SYKLI_VRK.search(teksti)
+    if m:
+        return int(m.group(1)) or None
+    m = _SYKLI_VK.search(teksti)
+    if m:
+        return 7 * int(m.group(1)) or None
+    if "viikoittai" in teksti.lower():
+        return 7
+    return None
+
+def vahvuus_mg(vahvuus: Union[str, float, None]) -> Optional[float]:
+    """
+    Parses the numeric strength from a tablet strength label.
+
+    Args:
+        vahvuus: Strength label (e.g., "40 mg"), "None", None, or an already parsed number.
+
+    Returns:
+        Optional[float]: Strength in mg, or None if the label is empty or invalid.
+    """
+    if isinstance(vahvuus, (int, float)):
+        return float(vahvuus)
+    if not vahvuus or vahvuus == "None":
+        return None
+    try:
+        return float(vahvuus.split()[0].replace(",", "."))
+    except (ValueError, IndexError):
+        return None
+
+# Strength choice that combines all of a drug's tablet strengths
+KAIKKI_VAHVUUDET = "Kaikki"
+
+class Laake(NamedTuple):
+    """One drug of a protocol, compiled from its med_data.json entry."""
+    nimi: str
+    annos: float
+    yksikko: Yksikko
+    # Tablet strength labels and their parsed values in mg (unparsable labels left out)
+    tablettikoot: Tuple[str, ...]
+    vahvuudet: Tuple[float, ...]
+    paivat: str
+    paivat_jaksot: Jaksot
+    reseptiohje: str
+    max_mg: Optional[float]
+
+    def vahvuus(self, valinta: Optional[str]) -> Optional[float]:
+        """
+        Returns the strength in mg of a selected tablet size label, using the
+        pre-parsed value when the label is one of `tablettikoot`.
+        """
+        for koko, mg in zip(self.tablettikoot, self.vahvuudet):
+            if koko == valinta:
+                return mg
+        return vahvuus_mg(valinta)
+
+    def vahvuudet_valinnalle(self, valinta: Optional[str]) -> Tuple[float, ...]:
+        """
+        Returns the strengths in mg a strength choice allows: all of
+        `vahvuudet` for `KAIKKI_VAHVUUDET`, otherwise the selected one (if any).
+        """
+        if valinta == KAIKKI_VAHVUUDET:
+            return self.vahvuudet
+        mg = self.vahvuus(valinta)
+        return () if mg is None else (mg,)
+
+class Protokolla(NamedTuple):
+    """A treatment protocol, compiled from its med_data.json entry."""
+    nimi: str
+    sykli: Optional[str]
+    kontrollit: str
+    esilaakitys: str
+    laakkeet: Tuple[Laake, ...]
+    # Optional 'diagnoosi' field of the entry (e.g., "Rintasyöpä")
+    diagnoosi: str = ""
+    # Cycle length in days parsed from `sykli` (None if continuous or unknown)
+    sykli_vrk: Optional[int] = None
+
+def kaanna_laake(d: Dict[str, Any]) -> Laake:
+    """
+    Compiles a raw drug dict into a `Laake` record.
+
+    Args:
+        d: Drug entry from med_data.json.
+
+    Returns:
+        Laake: The compiled drug.
+    """
+    annos = d.get('annos', 0)
+    if not isinstance(annos, (int, float)):
+        annos = vahvuus_mg(str(annos)) or 0.0
+    # Labels without a positive strength are dropped; they cannot be dispensed
+    koot = [(str(t), vahvuus_mg(str(t))) for t in d.get("tablettikoot") or ()]
+    koot = [(t, mg) for t, mg in koot if mg is not None and mg > 0]
+    max_mg = d.get('max_mg')
+    return Laake(
+        nimi=d['nimi'],
+        annos=annos,
+        yksikko=Yksikko.tunnista(d.get('yksikkö')),
+        tablettikoot=tuple(t for t, _ in koot),
+        vahvuudet=tuple(mg for _, mg in koot),
+        paivat=d.get('päivät') or "",
+        paivat_jaksot=jasenna_paivat(d.get('päivät')),
+        reseptiohje=d.get('reseptiohje') or "",
+        max_mg=float(max_mg) if max_mg is not None else None,
+    )
+
+def kaanna_protokolla(nimi: str, d: Dict[str, Any]) -> Protokolla:
+    """
+    Compiles a raw protocol dict into a `Protokolla` record.
+
+    Args:
+        nimi: Protocol name (the key in med_data.json).
+        d: Protocol entry from med_data.json.
+
+    Returns:
+        Protokolla: The compiled protocol.
+    """
+    return Protokolla(
+        nimi=nimi,
+        sykli=d.get('sykli'),
+        kontrollit=d.get('kontrollit', ''),
+        esilaakitys=d.get('esilääkitys', '-'),
+        laakkeet=tuple(kaanna_laake(m) for m in d.get('lääkkeet', [])),
+        diagnoosi=d.get('diagnoosi') or "",
+        sykli_vrk=jasenna_sykli(d.get('sykli')),
+    )
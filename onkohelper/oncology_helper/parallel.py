@@ -0,0 +1,78 @@
+"""
+Parallel batch runs over a process pool.
+
+The input is read in chunks of rows and each chunk is processed by a worker
+process. Workers load the protocol data once, in the pool initializer, and
+return formatted output records, so only rows and strings cross process
+boundaries. Results are written in input order, and at most a few chunks per
+worker are in flight, so memory use does not grow with the input size.
+"""
+import os
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import Any, Deque, Dict, Iterator, List, Optional, TextIO, Tuple
+
+from oncology_helper.batch import kasittele_rivi, kirjoita_tulokset, lue_potilaat
+from oncology_helper.data import Tietokanta
+
+# Chunks queued per worker; enough to keep workers busy while the parent writes
+JONO_PER_TYOPROSESSI = 2
+
+def _alusta_tyoprosessi(polku: Optional[str]) -> None:
+    # A forked worker already has the parent's data; a spawned one loads it here, once
+    if Tietokanta.polku != polku or not Tietokanta.nykyinen.protokollat:
+        Tietokanta.lataa(polku)
+
+def _kasittele_pala(alku: int, rivit: List[Dict[str, Any]], muoto_ulos: str,
+                    tehtava: str) -> List[Tuple[Optional[str], Optional[str]]]:
+    protokollat = Tietokanta.nykyinen.protokollat
+    return [kasittele_rivi(alku + i, rivi, protokollat, muoto_ulos, tehtava) for i, rivi in enumerate(rivit)]
+
+def _palat(rivit: Iterator[Dict[str, Any]], palakoko: int) -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    alku = 1
+    while True:
+        pala = list(islice(rivit, palakoko))
+        if not pala:
+            return
+        yield alku, pala
+        alku += len(pala)
+
+def kasittele_rinnakkain(sisaan: TextIO, ulos: TextIO, polku: Optional[str] = None,
+                         muoto_sisaan: str = "csv", muoto_ulos: str = "teksti",
+                         virheet: Optional[TextIO] = None, tehtava: str = "annokset",
+                         tyoprosessit: Optional[int] = None, palakoko: int = 500,
+                         mp_context: Any = None) -> Tuple[int, int]:
+    """
+    Parallel version of `batch.kasittele` with identical output.
+
+    Args:
+        sisaan: Input file (CSV or JSONL).
+        ulos: Output file.
+        polku: Protocol data file the workers load (default: the package's med_data.json).
+        muoto_sisaan: "csv" or "jsonl".
+        muoto_ulos: "teksti" or "jsonl".
+        virheet: Where to report bad rows (default stderr).
+        tehtava: "annokset" or "luokitus".
+        tyoprosessit: Number of worker processes (default: CPU count).
+        palakoko: Rows per task.
+        mp_context: Optional multiprocessing context (e.g., spawn).
+
+    Returns:
+        Tuple[int, int]: (rows written, rows failed).
+    """
+    tyoprosessit = tyoprosessit or os.cpu_count() or 1
+    palat = _palat(lue_potilaat(sisaan, muoto_sisaan), palakoko)
+
+    def tulokset(pool: ProcessPoolExecutor) -> Iterator[Tuple[Optional[str], Optional[str]]]:
+        jono: Deque[Future] = deque()
+        for alku, pala in palat:
+            jono.append(pool.submit(_kasittele_pala, alku, pala, muoto_ulos, tehtava))
+            if len(jono) >= tyoprosessit * JONO_PER_TYOPROSESSI:
+                yield from jono.popleft().result()
+        while jono:
+            yield from jono.popleft().result()
+
+    with ProcessPoolExecutor(max_workers=tyoprosessit, mp_context=mp_context,
+                             initializer=_alusta_tyoprosessi, initargs=(polku,)) as pool:
+        return kirjoita_tulokset(ulos, tulokset(pool), muoto_ulos, virheet)
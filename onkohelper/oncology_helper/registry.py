@@ -0,0 +1,235 @@
+"""
+Back-staging of cancer registry extracts.
+
+Streams a T/N/M CSV of any size in fixed-size chunks through the stage group
+tables of `staging` and the breast cancer treatment plan, fanning the chunks
+over worker processes. The parent process only reads raw lines and writes the
+finished chunks; decoding, parsing, staging and formatting happen in the
+workers, so only bytes cross process boundaries.
+
+Output is written in input order, one chunk at a time. After each chunk the
+output is flushed and a checkpoint (`<output>.tila`) records how far the input
+and output got, so a killed job resumes from the last completed chunk. At most
+a few chunks per worker are in flight, so memory use does not depend on the
+file size.
+
+Input columns: t, n, m (codes or full selection labels; c/p/y prefixes are
+dropped), optional: id, tauti (default "Rintasyöpä"), er, her2, ki67,
+hoitolinja. The file must be UTF-8; rows with other bytes are reported as
+bad rows. Each row must be on one line.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, TextIO, Tuple
+
+from oncology_helper.logic import maarita_hoitosuunnitelma_rintasyopa
+from oncology_helper.parallel import JONO_PER_TYOPROSESSI
+from oncology_helper.staging import STAGE_TAULUT, koodi
+
+# Output columns
+SARAKKEET = ("rivi", "id", "tauti", "t", "n", "m", "stage", "suunnitelma", "virhe")
+# Default rows per chunk
+PALAKOKO = 50000
+
+# Result of one chunk: (output bytes, rows staged, rows failed, error messages)
+Palatulos = Tuple[bytes, int, int, List[str]]
+
+def _porrasta_pala(otsikko: Sequence[str], erotin: str, alku: int, data: bytes) -> Palatulos:
+    """Stages one chunk of raw CSV lines; `alku` is the row number of the first line."""
+    leveys = len(otsikko)
+    rivit = [r if len(r) >= leveys else r + [""] * (leveys - len(r))
+             for r in csv.reader(io.StringIO(data.decode("utf-8", errors="replace")), delimiter=erotin)]
+    sarakkeet = list(zip(*rivit))
+    tyhja = [""] * len(rivit)
+
+    def sarake(nimi: str) -> List[str]:
+        i = otsikko.index(nimi) if nimi in otsikko else None
+        return [a.strip() for a in sarakkeet[i]] if i is not None and sarakkeet else tyhja
+
+    # Registry columns repeat a few codes, so each distinct value is normalized once
+    koodit: Dict[str, str] = {}
+
+    def normalisoi(arvot: List[str]) -> List[str]:
+        return [koodit[a] if a in koodit else koodit.setdefault(a, koodi(a)) for a in arvot]
+
+    tunnisteet, taudit = sarake("id"), [a or "Rintasyöpä" for a in sarake("tauti")]
+    t, n, m = normalisoi(sarake("t")), normalisoi(sarake("n")), normalisoi(sarake("m"))
+    virheet: List[str] = [""] * len(rivit)
+    # Rows are staged disease by disease with the column lookups, then written in input order
+    taudeittain: Dict[str, List[int]] = {}
+    for i, tauti in enumerate(taudit):
+        if any("\ufffd" in a for a in rivit[i]):
+            virheet[i] = "Virheellinen merkistö (ei UTF-8)"
+        elif not (t[i] and n[i] and m[i]):
+            virheet[i] = f"Puuttuva kenttä: {'tnm'[(t[i], n[i], m[i]).index('')]}"
+        elif tauti not in STAGE_TAULUT:
+            virheet[i] = f"Ei levinneisyysryhmittelyä: {tauti!r}"
+        else:
+            taudeittain.setdefault(tauti, []).append(i)
+
+    stages = [""] * len(rivit)
+    for tauti, indeksit in taudeittain.items():
+        sarja = STAGE_TAULUT[tauti].sarja([t[i] for i in indeksit], [n[i] for i in indeksit], [m[i] for i in indeksit])
+        for i, stage in zip(indeksit, sarja):
+            stages[i] = stage
+
+    suunnitelmat = [""] * len(rivit)
+    er, her2, ki67, linjat = sarake("er"), sarake("her2"), sarake("ki67"), sarake("hoitolinja")
+    for i in taudeittain.get("Rintasyöpä", ()):
+        if er[i] and her2[i] and ki67[i]:
+            suunnitelmat[i] = maarita_hoitosuunnitelma_rintasyopa(stages[i], t[i], n[i], m[i], er[i], her2[i],
+                                                                  ki67[i], linjat[i] or None)
+
+    tulos = io.StringIO()
+    csv.writer(tulos, lineterminator="\n").writerows(
+        zip(range(alku, alku + len(rivit)), tunnisteet, taudit, t, n, m, stages, suunnitelmat, virheet))
+    viestit = [f"Rivi {alku + i}: {v}" for i, v in enumerate(virheet) if v]
+    return tulos.getvalue().encode("utf-8"), len(rivit) - len(viestit), len(viestit), viestit
+
+def _palat(f: Any, palakoko: int) -> Iterator[Tuple[bytes, int]]:
+    """Raw chunks of `palakoko` lines, with each chunk's end offset in the file."""
+    siirto = f.tell()
+    while True:
+        rivit = []
+        for rivi in f:
+            if rivi.strip():
+                rivit.append(rivi)
+            siirto += len(rivi)
+            if len(rivit) >= palakoko:
+                break
+        if not rivit:
+            return
+        yield b"".join(rivit), siirto
+
+def _tunniste(polku: str) -> Dict[str, Any]:
+    st = os.stat(polku)
+    return {"syote": os.path.abspath(polku), "koko": st.st_size, "muutettu": st.st_mtime_ns}
+
+def _lue_tila(polku: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(polku, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        print(f"Virhe luettaessa tilatiedostoa ({polku}): {e}")
+        return None
+
+def _kirjoita_tila(polku: str, tila: Dict[str, Any]) -> None:
+    # Replaced atomically, so a crash leaves either the old or the new checkpoint
+    valiaikainen = polku + ".tmp"
+    with open(valiaikainen, "w", encoding="utf-8") as f:
+        json.dump(tila, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(valiaikainen, polku)
+
+def porrasta_rekisteri(syote: str, tuloste: str, palakoko: int = PALAKOKO,
+                       tyoprosessit: Optional[int] = None, jatka: bool = True,
+                       virheet: Optional[TextIO] = None, mp_context: Any = None) -> Tuple[int, int]:
+    """
+    Stages a registry CSV into an output CSV (columns `SARAKKEET`).
+
+    Args:
+        syote: Input CSV path (delimiter ",", ";" or tab, detected from the header).
+        tuloste: Output CSV path. The checkpoint is kept beside it as `<tuloste>.tila`
+            and removed when the job completes.
+        palakoko: Rows per chunk.
+        tyoprosessit: Worker processes (default: CPU count; 1 = no pool).
+        jatka: Resume from the checkpoint if it matches the input and chunk size;
+            otherwise (or if False) start over.
+        virheet: Where to report bad rows (default stderr).
+        mp_context: Optional multiprocessing context (e.g., spawn).
+
+    Returns:
+        Tuple[int, int]: (rows staged, rows failed), including rows of an earlier run.
+
+    Raises:
+        ValueError: If the input has no t, n or m column.
+    """
+    virheet = virheet or sys.stderr
+    tyoprosessit = tyoprosessit or os.cpu_count() or 1
+    tilapolku = tuloste + ".tila"
+    tunniste = dict(_tunniste(syote), palakoko=palakoko)
+
+    tila = _lue_tila(tilapolku) if jatka else None
+    if tila is not None and (any(tila.get(k) != v for k, v in tunniste.items())
+                             or not os.path.exists(tuloste) or os.path.getsize(tuloste) < tila["tuloste"]):
+        print(f"Tilatiedosto ei vastaa syötettä, aloitetaan alusta ({tilapolku})", file=virheet)
+        tila = None
+
+    with open(syote, "rb") as f:
+        otsikkorivi = f.readline().decode("utf-8-sig", errors="replace")
+        erotin = max([",", ";", "\t"], key=otsikkorivi.count)
+        otsikko = [c.strip().lower() for c in next(csv.reader([otsikkorivi], delimiter=erotin), [])]
+        for k in ("t", "n", "m"):
+            if k not in otsikko:
+                raise ValueError(f"Puuttuva sarake: {k}")
+        if tila is None:
+            tila = dict(tunniste, syote_siirto=f.tell(), tuloste=0, rivi=1, ok=0, failed=0)
+            with open(tuloste, "wb") as ulos:
+                ulos.write((",".join(SARAKKEET) + "\n").encode("utf-8"))
+            tila["tuloste"] = os.path.getsize(tuloste)
+            _kirjoita_tila(tilapolku, tila)
+        f.seek(tila["syote_siirto"])
+
+        with open(tuloste, "r+b") as ulos:
+            # Drops output written after the last checkpoint
+            ulos.truncate(tila["tuloste"])
+            ulos.seek(tila["tuloste"])
+
+            def valmis(siirto: int, tulos: Palatulos) -> None:
+                data, ok, failed, viestit = tulos
+                for viesti in viestit:
+                    print(viesti, file=virheet)
+                ulos.write(data)
+                ulos.flush()
+                os.fsync(ulos.fileno())
+                tila.update(syote_siirto=siirto, tuloste=ulos.tell(), rivi=tila["rivi"] + ok + failed,
+                            ok=tila["ok"] + ok, failed=tila["failed"] + failed)
+                _kirjoita_tila(tilapolku, tila)
+
+            palat = _palat(f, palakoko)
+            if tyoprosessit == 1:
+                for data, siirto in palat:
+                    valmis(siirto, _porrasta_pala(otsikko, erotin, tila["rivi"], data))
+            else:
+                with ProcessPoolExecutor(max_workers=tyoprosessit, mp_context=mp_context) as pool:
+                    jono: Deque[Tuple[int, Future]] = deque()
+                    rivi = tila["rivi"]
+                    for data, siirto in palat:
+                        jono.append((siirto, pool.submit(_porrasta_pala, otsikko, erotin, rivi, data)))
+                        rivi += data.count(b"\n") + (not data.endswith(b"\n"))
+                        if len(jono) >= tyoprosessit * JONO_PER_TYOPROSESSI:
+                            siirto, tulos = jono.popleft()
+                            valmis(siirto, tulos.result())
+                    while jono:
+                        siirto, tulos = jono.popleft()
+                        valmis(siirto, tulos.result())
+
+    os.remove(tilapolku)
+    return tila["ok"], tila["failed"]
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rekisteriaineiston levinneisyysluokitus (CSV -> CSV).")
+    parser.add_argument("syote", help="Rekisteritiedosto (.csv): t, n, m [id, tauti, er, her2, ki67, hoitolinja]")
+    parser.add_argument("tuloste", help="Tulostiedosto (.csv)")
+    parser.add_argument("--palakoko", type=int, default=PALAKOKO, help=f"Rivejä per pala (oletus {PALAKOKO})")
+    parser.add_argument("-j", "--tyoprosessit", type=int, default=0,
+                        help="Rinnakkaisten työprosessien määrä (0 = kaikki ytimet)")
+    parser.add_argument("--alusta", action="store_true", help="Älä jatka keskeytynyttä ajoa, aloita alusta")
+    args = parser.parse_args(argv)
+
+    ok, failed = porrasta_rekisteri(args.syote, args.tuloste, args.palakoko, args.tyoprosessit or None,
+                                    jatka=not args.alusta)
+    print(f"Luokiteltu {ok} riviä, {failed} virheellistä riviä.", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,235 @@
+"""
+Dose report rendering shared by the calculator views and the batch runner.
+
+A protocol's report template (`RaporttiPohja`) is compiled once: every fixed
+line and fragment is formatted and HTML-escaped up front. Rendering then only
+fills in the prescribed doses, and the same rendered rows produce the plain
+text, HTML and JSON forms of the report.
+"""
+import html
+import json
+from typing import Dict, List, Optional, Any, Iterable, NamedTuple, Tuple
+
+from oncology_helper.logic import Tablettiyhdistelma, ratkaise_tabletit, safe_float
+from oncology_helper.models import KAIKKI_VAHVUUDET, Laake, Protokolla, vahvuus_mg
+
+VIIVA = "-" * 40
+
+class LaakePohja(NamedTuple):
+    """Pre-formatted fragments for one drug."""
+    med: Laake
+    # Strength label -> mg (None for no tablet) for the labels the UIs offer
+    vahvuudet: Dict[Optional[str], Optional[float]]
+    # Strength in mg -> label, for combination lines
+    merkinnat: Dict[float, str]
+    alku: str
+    alku_html: str
+    # Schedule line, including the leading newline ("" if no schedule)
+    ajoitus: str
+    ajoitus_html: str
+
+class RaporttiPohja(NamedTuple):
+    """Compiled report template of one protocol."""
+    nimi: str
+    protokolla: Optional[Protokolla]
+    otsake: str
+    otsake_html: str
+    laakkeet: Tuple[LaakePohja, ...]
+    # Text after the drug lines ("" when no protocol is selected)
+    loppu: str
+    loppu_html: str
+
+# Compiled templates by (name, id(protocol)); the protocol is kept in the value
+# so that its id cannot be reused while the entry exists
+_POHJAT: Dict[Tuple[str, int], RaporttiPohja] = {}
+_POHJAT_MAX = 1024
+
+def _kaanna_laake(med: Laake) -> LaakePohja:
+    vahvuudet: Dict[Optional[str], Optional[float]] = {}
+    for koko, mg in zip(med.tablettikoot, med.vahvuudet):
+        vahvuudet.setdefault(koko, mg)
+    for tyhja in (None, "None", ""):
+        vahvuudet.setdefault(tyhja, None)
+    merkinnat: Dict[float, str] = {}
+    for koko, mg in zip(med.tablettikoot, med.vahvuudet):
+        merkinnat.setdefault(mg, koko)
+    return LaakePohja(
+        med=med,
+        vahvuudet=vahvuudet,
+        merkinnat=merkinnat,
+        alku=f"\n• {med.nimi}: ",
+        alku_html=f"<li><b>{html.escape(med.nimi)}</b>: ",
+        ajoitus=f"\n   Ajoitus: {med.paivat}" if med.paivat else "",
+        ajoitus_html=f"<br>Ajoitus: {html.escape(med.paivat)}" if med.paivat else "",
+    )
+
+def kaanna_pohja(protokolla_nimi: str, protokolla: Optional[Protokolla]) -> RaporttiPohja:
+    """
+    Returns the compiled report template of a protocol, compiling it on first use.
+
+    Args:
+        protokolla_nimi: Selected protocol name ("" if none).
+        protokolla: Protocol from `Tietokanta.data`, or None.
+
+    Returns:
+        RaporttiPohja: The template.
+    """
+    avain = (protokolla_nimi, id(protokolla))
+    pohja = _POHJAT.get(avain)
+    if pohja is not None and pohja.protokolla is protokolla:
+        return pohja
+
+    sykli = protokolla.sykli if protokolla else None
+    otsake = f"PROTOKOLLA: {protokolla_nimi}\n"
+    otsake_html = f'<div class="raportti">\n<h3>PROTOKOLLA: {html.escape(protokolla_nimi)}</h3>\n<p>'
+    if sykli is not None:
+        otsake += f"Sykli: {sykli}\n"
+        otsake_html += f"Sykli: {html.escape(str(sykli))}<br>"
+
+    loppu = loppu_html = ""
+    if protokolla_nimi:
+        tukihoidot = protokolla.esilaakitys if protokolla else "-"
+        loppu = f"\n{VIIVA}\nTUKIHOIDOT:\n{tukihoidot}"
+        loppu_html = f"<p><b>TUKIHOIDOT:</b><br>{html.escape(tukihoidot).replace(chr(10), '<br>')}</p>\n"
+
+    pohja = RaporttiPohja(
+        nimi=protokolla_nimi,
+        protokolla=protokolla,
+        otsake=otsake,
+        otsake_html=otsake_html,
+        laakkeet=tuple(_kaanna_laake(m) for m in protokolla.laakkeet) if protokolla else (),
+        loppu=loppu,
+        loppu_html=loppu_html,
+    )
+    if len(_POHJAT) >= _POHJAT_MAX:
+        _POHJAT.clear()
+    _POHJAT[avain] = pohja
+    return pohja
+
+class Raportti:
+    """
+    A rendered report. The dose rows are computed once; `teksti`, `html` and
+    `tiedot`/`json` are assembled from them on request.
+    """
+    __slots__ = ("pohja", "labrat", "rivit")
+
+    def __init__(self, pohja: RaporttiPohja, labrat: str,
+                 rivit: List[Tuple[LaakePohja, str, Optional[str], Optional[float], Optional[Tablettiyhdistelma]]]):
+        self.pohja = pohja
+        self.labrat = labrat
+        # (drug template, prescribed mg as entered, strength label, tablet count or None,
+        #  tablet combination when all strengths are combined)
+        self.rivit = rivit
+
+    @staticmethod
+    def _yhdistelma(lp: LaakePohja, fin: str, yhd: Tablettiyhdistelma) -> str:
+        teksti = " + ".join(f"{n} x {lp.merkinnat[v]}" for v, n in yhd.tabletit)
+        if yhd.mg != safe_float(fin):
+            teksti += f" (= {yhd.mg:g} mg)"
+        return teksti
+
+    @property
+    def teksti(self) -> str:
+        """The copyable plain-text report, as shown in the calculator views."""
+        out = [f"{self.pohja.otsake}Labrat: {self.labrat}\n{VIIVA}"]
+        for lp, fin, ts, kpl, yhd in self.rivit:
+            if yhd is not None:
+                out.append(f"{lp.alku}{fin} mg\n    -> {self._yhdistelma(lp, fin, yhd)}{lp.ajoitus}")
+            elif kpl is None:
+                out.append(f"{lp.alku}{fin} mg{lp.ajoitus}")
+            else:
+                out.append(f"{lp.alku}{fin} mg\n    -> {kpl:.1f} kpl ({ts}){lp.ajoitus}")
+        out.append(self.pohja.loppu)
+        return "".join(out)
+
+    @property
+    def html(self) -> str:
+        """The report as an HTML fragment."""
+        out = [self.pohja.otsake_html, "Labrat: ", html.escape(self.labrat), "</p>\n<ul>\n"]
+        for lp, fin, ts, kpl, yhd in self.rivit:
+            out += (lp.alku_html, html.escape(fin), " mg")
+            if yhd is not None:
+                out.append(f"<br>-&gt; {html.escape(self._yhdistelma(lp, fin, yhd))}")
+            elif kpl is not None:
+                out.append(f"<br>-&gt; {kpl:.1f} kpl ({html.escape(ts or '')})")
+            out += (lp.ajoitus_html, "</li>\n")
+        out += ("</ul>\n", self.pohja.loppu_html, "</div>")
+        return "".join(out)
+
+    @property
+    def tiedot(self) -> Dict[str, Any]:
+        """The report as a JSON-compatible dict."""
+        p = self.pohja.protokolla
+        return {
+            "protokolla": self.pohja.nimi,
+            "sykli": p.sykli if p else None,
+            "labrat": self.labrat,
+            "lääkkeet": [
+                {"nimi": lp.med.nimi, "määräys": fin, "vahvuus": ts if kpl is not None else None,
+                 "kpl": round(kpl, 1) if kpl is not None else None,
+                 "tabletit": [{"vahvuus": lp.merkinnat[v], "kpl": n} for v, n in yhd.tabletit] if yhd else None,
+                 "päivät": lp.med.paivat}
+                for lp, fin, ts, kpl, yhd in self.rivit
+            ],
+            "tukihoidot": (p.esilaakitys if p else "-") if self.pohja.nimi else None,
+        }
+
+    @property
+    def json(self) -> str:
+        return json.dumps(self.tiedot, ensure_ascii=False)
+
+def renderoi(pohja: RaporttiPohja, labrat: str, rivit: Iterable[Dict[str, Any]]) -> Raportti:
+    """
+    Renders a compiled template with the computed doses.
+
+    Args:
+        pohja: Template from `kaanna_pohja`.
+        labrat: Laboratory controls text.
+        rivit: One dict per drug with keys "med" (`Laake`), "maarays"
+            (prescribed mg, as entered) and "vahvuus" (tablet strength label,
+            `KAIKKI_VAHVUUDET` to combine all strengths, or None).
+
+    Returns:
+        Raportti: The rendered report.
+    """
+    laakkeet = pohja.laakkeet
+    valmiit = []
+    for i, r in enumerate(rivit):
+        med = r['med']
+        lp = laakkeet[i] if i < len(laakkeet) and laakkeet[i].med is med else _kaanna_laake(med)
+        fin = str(r['maarays'])
+        ts = r.get('vahvuus')
+        kpl = yhd = None
+        if ts == KAIKKI_VAHVUUDET and len(lp.merkinnat) > 1:
+            mg = safe_float(fin)
+            if mg > 0:
+                yhd = ratkaise_tabletit(mg, lp.merkinnat)
+                kpl = float(yhd.kpl)
+        else:
+            if ts == KAIKKI_VAHVUUDET:
+                strength = next(iter(lp.merkinnat), None)
+            else:
+                strength = lp.vahvuudet[ts] if ts in lp.vahvuudet else vahvuus_mg(ts)
+            if strength:
+                mg = safe_float(fin)
+                if mg > 0:
+                    kpl = mg / strength
+        valmiit.append((lp, fin, ts, kpl, yhd))
+    return Raportti(pohja, labrat, valmiit)
+
+def muodosta_raportti(protokolla_nimi: str, protokolla: Optional[Protokolla],
+                      labrat: str, rivit: Iterable[Dict[str, Any]]) -> str:
+    """
+    Builds the copyable dose report text shown in the calculator views.
+
+    Args:
+        protokolla_nimi: Selected protocol name.
+        protokolla: Protocol from `Tietokanta.data`, or None.
+        labrat: Laboratory controls text.
+        rivit: One dict per drug with keys "med" (`Laake`), "maarays"
+            (prescribed mg, as entered) and "vahvuus" (tablet strength label or None).
+
+    Returns:
+        str: The report text.
+    """
+    return renderoi(kaanna_pohja(protokolla_nimi, protokolla), labrat, rivit).teksti
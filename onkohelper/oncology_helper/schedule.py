@@ -0,0 +1,216 @@
+"""
+Treatment calendars: protocol day schedules expanded into dated administrations.
+
+A protocol's 'päivät' and 'sykli' texts are parsed once into an `Aikataulu`:
+the cycle length and, per drug, the day intervals within one cycle. Expanding
+a course is then interval arithmetic on dates, with no string parsing per
+patient or per cycle.
+
+`AikatauluIndeksi` indexes the expanded intervals of many patients by drug and
+start date, so range queries ("all prednisolone doses due next week") are a
+binary search instead of a scan.
+"""
+import re
+from bisect import bisect_left, bisect_right
+from datetime import date, timedelta
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+from oncology_helper.models import Protokolla
+
+# Continuous treatment without a cycle length is expanded in periods of this many days
+JATKUVA_SYKLI_VRK = 28
+# Intervals longer than this (days) are kept apart so they do not widen every search
+PITKA_VALI = 64
+
+class Aikataulu(NamedTuple):
+    """Day schedule of one protocol cycle, compiled from the protocol's texts."""
+    protokolla: str
+    # Cycle length in days; None if unknown (only the first cycle can be placed)
+    sykli_vrk: Optional[int]
+    # (drug, first day, last day) within a cycle, 0-based and inclusive
+    jaksot: Tuple[Tuple[str, int, int], ...]
+
+class Antojakso(NamedTuple):
+    """Days one patient takes one drug in one cycle (both dates inclusive)."""
+    potilas: str
+    protokolla: str
+    laake: str
+    sykli: int
+    alku: date
+    loppu: date
+
+def kaanna_aikataulu(protokolla: Protokolla) -> Aikataulu:
+    """
+    Compiles a protocol's day schedule.
+
+    Drugs given continuously ('päivät' "Jatkuva", or no days in a continuous
+    protocol) are given daily for the whole cycle. Drugs without days in a
+    cyclic protocol are left out.
+
+    Args:
+        protokolla: The compiled protocol.
+
+    Returns:
+        Aikataulu: The schedule.
+    """
+    jatkuva_protokolla = "jatkuva" in (protokolla.sykli or "").lower()
+    sykli = protokolla.sykli_vrk
+    if sykli is None and jatkuva_protokolla:
+        sykli = JATKUVA_SYKLI_VRK
+    jaksot: List[Tuple[str, int, int]] = []
+    for med in protokolla.laakkeet:
+        if med.paivat_jaksot:
+            jaksot.extend((med.nimi, eka - 1, vika - 1) for eka, vika in med.paivat_jaksot)
+        elif "jatkuva" in med.paivat.lower() or (jatkuva_protokolla and not med.paivat):
+            jaksot.append((med.nimi, 0, (sykli or JATKUVA_SYKLI_VRK) - 1))
+    return Aikataulu(protokolla.nimi, sykli, tuple(jaksot))
+
+_PVM = re.compile(r"(\d{1,2})\.(\d{1,2})\.(\d{4})$")
+
+def jasenna_pvm(arvo: Union[str, date]) -> date:
+    """
+    Parses a date written as "YYYY-MM-DD" or "d.m.yyyy".
+
+    Raises:
+        ValueError: If the date is invalid.
+    """
+    if isinstance(arvo, date):
+        return arvo
+    teksti = str(arvo).strip()
+    m = _PVM.match(teksti)
+    try:
+        if m:
+            return date(int(m.group(3)), int(m.group(2)), int(m.group(1)))
+        return date.fromisoformat(teksti)
+    except ValueError:
+        raise ValueError(f"Virheellinen päivämäärä: {teksti!r}") from None
+
+def laajenna(potilas: str, aikataulu: Aikataulu, alkupaiva: date, sykleja: int = 1) -> Iterator[Antojakso]:
+    """
+    Expands one patient's course into dated administration intervals.
+
+    Args:
+        potilas: Patient identifier.
+        aikataulu: Compiled schedule of the protocol.
+        alkupaiva: Day 1 of the first cycle.
+        sykleja: Number of cycles.
+
+    Yields:
+        Antojakso: Intervals in cycle order, then in schedule order.
+
+    Raises:
+        ValueError: If more than one cycle is asked and the cycle length is unknown.
+    """
+    if aikataulu.sykli_vrk is None and sykleja > 1:
+        raise ValueError(f"Syklin pituus ei ole tiedossa ({aikataulu.protokolla}): vain yksi sykli voidaan ajoittaa")
+    alku = alkupaiva.toordinal()
+    for s in range(sykleja):
+        for laake, eka, vika in aikataulu.jaksot:
+            yield Antojakso(potilas, aikataulu.protokolla, laake, s + 1,
+                            date.fromordinal(alku + eka), date.fromordinal(alku + vika))
+        alku += aikataulu.sykli_vrk or 0
+
+def laajenna_hoidot(hoidot: Iterable[Tuple[str, Protokolla, Union[str, date], int]]) -> Iterator[Antojakso]:
+    """
+    Expands many patients' courses. Each protocol is compiled once.
+
+    Args:
+        hoidot: (patient, protocol, first day, number of cycles) per course.
+
+    Yields:
+        Antojakso: Intervals course by course.
+    """
+    # Keyed by identity; the protocol is kept with its schedule so that its id cannot be reused
+    aikataulut: Dict[int, Tuple[Protokolla, Aikataulu]] = {}
+    for potilas, protokolla, alkupaiva, sykleja in hoidot:
+        kaannetty = aikataulut.get(id(protokolla))
+        if kaannetty is not None and kaannetty[0] is protokolla:
+            aikataulu = kaannetty[1]
+        else:
+            aikataulu = kaanna_aikataulu(protokolla)
+            aikataulut[id(protokolla)] = (protokolla, aikataulu)
+        yield from laajenna(potilas, aikataulu, jasenna_pvm(alkupaiva), sykleja)
+
+class _Laakeindeksi:
+    """Intervals of one drug sorted by start day (as ordinals)."""
+    __slots__ = ("alut", "jaksot", "pisin", "pitkat")
+
+    def __init__(self, jaksot: List[Antojakso]):
+        lyhyet = [j for j in jaksot if (j.loppu - j.alku).days < PITKA_VALI]
+        lyhyet.sort(key=lambda j: (j.alku, j.potilas))
+        self.jaksot = lyhyet
+        self.alut = [j.alku.toordinal() for j in lyhyet]
+        self.pisin = max(((j.loppu - j.alku).days for j in lyhyet), default=0)
+        self.pitkat = [j for j in jaksot if (j.loppu - j.alku).days >= PITKA_VALI]
+
+    def hae(self, alku: int, loppu: int) -> Iterator[Antojakso]:
+        # An interval starting before alku - pisin has ended before alku
+        i = bisect_left(self.alut, alku - self.pisin)
+        for j in self.jaksot[i:bisect_right(self.alut, loppu)]:
+            if j.loppu.toordinal() >= alku:
+                yield j
+        for j in self.pitkat:
+            if j.alku.toordinal() <= loppu and j.loppu.toordinal() >= alku:
+                yield j
+
+class AikatauluIndeksi:
+    """Interval index of expanded administrations for date range queries."""
+
+    def __init__(self, jaksot: Iterable[Antojakso]):
+        """
+        Args:
+            jaksot: Intervals, e.g. from `laajenna_hoidot`.
+        """
+        laakkeittain: Dict[str, List[Antojakso]] = {}
+        for j in jaksot:
+            laakkeittain.setdefault(j.laake, []).append(j)
+        self._laakkeet = {nimi: _Laakeindeksi(js) for nimi, js in laakkeittain.items()}
+
+    def __len__(self) -> int:
+        return sum(len(l.jaksot) + len(l.pitkat) for l in self._laakkeet.values())
+
+    def laakkeet(self) -> List[str]:
+        """Names of the indexed drugs."""
+        return sorted(self._laakkeet)
+
+    def hae(self, alku: Union[str, date], loppu: Union[str, date], laake: Optional[str] = None) -> List[Antojakso]:
+        """
+        Finds the intervals overlapping a date range.
+
+        Args:
+            alku: First day of the range.
+            loppu: Last day of the range (inclusive).
+            laake: Only drugs whose name contains this text (case-insensitive).
+
+        Returns:
+            List[Antojakso]: Overlapping intervals by start date and patient.
+        """
+        a, l = jasenna_pvm(alku).toordinal(), jasenna_pvm(loppu).toordinal()
+        haku = laake.lower() if laake else None
+        tulos = [j for nimi, indeksi in self._laakkeet.items() if haku is None or haku in nimi.lower()
+                 for j in indeksi.hae(a, l)]
+        tulos.sort(key=lambda j: (j.alku, j.potilas, j.laake))
+        return tulos
+
+    def antokerrat(self, alku: Union[str, date], loppu: Union[str, date],
+                   laake: Optional[str] = None) -> List[Tuple[date, Antojakso]]:
+        """
+        Lists the daily administrations due in a date range.
+
+        Args:
+            alku: First day of the range.
+            loppu: Last day of the range (inclusive).
+            laake: Only drugs whose name contains this text (case-insensitive).
+
+        Returns:
+            List[Tuple[date, Antojakso]]: (day, interval) per administration day, by day.
+        """
+        a, l = jasenna_pvm(alku), jasenna_pvm(loppu)
+        tulos = []
+        for j in self.hae(a, l, laake):
+            paiva, viimeinen = max(j.alku, a), min(j.loppu, l)
+            while paiva <= viimeinen:
+                tulos.append((paiva, j))
+                paiva += timedelta(days=1)
+        tulos.sort(key=lambda t: (t[0], t[1].potilas, t[1].laake))
+        return tulos
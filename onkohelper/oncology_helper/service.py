@@ -0,0 +1,249 @@
+"""
+Local JSON dosing service (asyncio, standard library only).
+
+Serves the calculator logic over HTTP/1.1 with keep-alive connections:
+
+    POST /v1/potilas            {"pituus", "paino", "ika", "krea", "sukupuoli"} -> {"bsa", "gfr"}
+    POST /v1/annokset           patient + "protokolla" -> doses and report (as in the batch runner)
+    POST /v1/luokitus           {"t", "n", "m", ["tauti"]} -> {"stage"} (default: breast cancer)
+    POST /v1/hoitosuunnitelma   {"t", "n", "m", "er", "her2", "ki67", ["hoitolinja"]} -> {"stage", "suunnitelma"}
+    POST /v1/<toiminto>/era     {"pyynnot": [...]} -> {"tulokset": [{"tulos": ...} | {"virhe": ...}, ...]}
+    GET  /v1/terveys            data version and protocol count
+    GET  /v1/tilastot           per-endpoint request counts and latency histograms
+
+The service has no authentication and listens on 127.0.0.1 by default; put it
+behind the hospital's own gateway if it must be reachable from other hosts.
+
+    python -m oncology_helper.service --portti 8080
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from oncology_helper.batch import laske_potilas
+from oncology_helper.data import Tietokanta
+from oncology_helper.logic import (lue_luku, laske_bsa, laske_cockcroft_gault,
+                                   laske_stage_rintasyopa, maarita_hoitosuunnitelma_rintasyopa)
+from oncology_helper.staging import laske_stage
+# The histogram moved to timing; VIIVERAJAT_MS is kept importable from here
+from oncology_helper.timing import VIIVERAJAT_MS, Viivehistogrammi
+
+# Largest accepted request body and batch
+MAX_RUNKO = 10 * 1024 * 1024
+MAX_ERA = 10000
+
+_TILAT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 411: "Length Required",
+          413: "Payload Too Large", 431: "Request Header Fields Too Large", 500: "Internal Server Error"}
+
+class Virhe(Exception):
+    """A request error answered with an HTTP status and a message."""
+
+    def __init__(self, tila: int, viesti: str):
+        super().__init__(viesti)
+        self.tila = tila
+
+def _virhe_json(viesti: str) -> bytes:
+    return json.dumps({"virhe": viesti}, ensure_ascii=False).encode("utf-8")
+
+def _potilas(p: Dict[str, Any]) -> Dict[str, Any]:
+    paino = lue_luku(p, "paino")
+    return {
+        "bsa": laske_bsa(lue_luku(p, "pituus"), paino),
+        "gfr": laske_cockcroft_gault(lue_luku(p, "ika"), paino, lue_luku(p, "krea"),
+                                     str(p.get("sukupuoli") or "Mies").strip()),
+    }
+
+def _annokset(p: Dict[str, Any]) -> Dict[str, Any]:
+    return laske_potilas(p, Tietokanta.nykyinen.protokollat)
+
+def _tnm(p: Dict[str, Any]) -> Tuple[str, str, str]:
+    # Accepts codes ("T2") as well as full selection labels ("T2: >20-50 mm")
+    return tuple(str(p[k]).split(":")[0].strip() for k in ("t", "n", "m"))
+
+def _luokitus(p: Dict[str, Any]) -> Dict[str, Any]:
+    return {"stage": laske_stage(str(p.get("tauti") or "Rintasyöpä"), *_tnm(p))}
+
+def _hoitosuunnitelma(p: Dict[str, Any]) -> Dict[str, Any]:
+    t, n, m = _tnm(p)
+    stage = laske_stage_rintasyopa(t, n, m)
+    suunnitelma = maarita_hoitosuunnitelma_rintasyopa(stage, t, n, m, str(p["er"]), str(p["her2"]),
+                                                      str(p["ki67"]), p.get("hoitolinja"))
+    return {"stage": stage, "suunnitelma": suunnitelma}
+
+TOIMINNOT: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "potilas": _potilas,
+    "annokset": _annokset,
+    "luokitus": _luokitus,
+    "hoitosuunnitelma": _hoitosuunnitelma,
+}
+
+def _suorita(toiminto: Callable[[Dict[str, Any]], Dict[str, Any]], p: Any) -> Dict[str, Any]:
+    if not isinstance(p, dict):
+        raise Virhe(400, "Pyynnön on oltava JSON-objekti")
+    try:
+        return toiminto(p)
+    except KeyError as e:
+        raise Virhe(400, f"Puuttuva kenttä: {e.args[0]}")
+    except ValueError as e:
+        raise Virhe(400, str(e))
+
+class AnnostusPalvelu:
+    """The HTTP service. `kasittele` answers one request and can be called without a socket."""
+
+    def __init__(self, tarkistusvali: float = 2.0):
+        # How often (seconds) the data file is checked for changes
+        self.tarkistusvali = tarkistusvali
+        self.histogrammit: Dict[str, Viivehistogrammi] = {}
+
+    def kasittele(self, metodi: str, polku: str, runko: bytes) -> Tuple[int, Any]:
+        """
+        Routes one request.
+
+        Returns:
+            Tuple[int, Any]: HTTP status and the JSON-compatible response body.
+        """
+        polku = polku.split("?", 1)[0].rstrip("/")
+        osat = polku.split("/")[1:]
+        if len(osat) < 2 or osat[0] != "v1":
+            raise Virhe(404, f"Tuntematon polku: {polku}")
+
+        if osat[1] in ("terveys", "tilastot") and len(osat) == 2:
+            if metodi != "GET":
+                raise Virhe(405, "Käytä GET-pyyntöä")
+            if osat[1] == "terveys":
+                kanta = Tietokanta.nykyinen
+                return 200, {"tila": "ok", "versio": kanta.versio, "protokollia": len(kanta.protokollat)}
+            return 200, {r: h.tiedot() for r, h in sorted(self.histogrammit.items())}
+
+        toiminto = TOIMINNOT.get(osat[1])
+        era = len(osat) == 3 and osat[2] == "era"
+        if toiminto is None or len(osat) > 3 or (len(osat) == 3 and not era):
+            raise Virhe(404, f"Tuntematon polku: {polku}")
+        if metodi != "POST":
+            raise Virhe(405, "Käytä POST-pyyntöä")
+        try:
+            p = json.loads(runko or b"{}")
+        except ValueError as e:
+            raise Virhe(400, f"Virheellinen JSON: {e}")
+
+        if not era:
+            return 200, _suorita(toiminto, p)
+
+        pyynnot = p.get("pyynnot") if isinstance(p, dict) else p
+        if not isinstance(pyynnot, list):
+            raise Virhe(400, "Eräpyynnössä on oltava lista 'pyynnot'")
+        if len(pyynnot) > MAX_ERA:
+            raise Virhe(413, f"Erässä saa olla enintään {MAX_ERA} pyyntöä")
+        tulokset: List[Dict[str, Any]] = []
+        for q in pyynnot:
+            try:
+                tulokset.append({"tulos": _suorita(toiminto, q)})
+            except Virhe as e:
+                tulokset.append({"virhe": str(e)})
+        return 200, {"tulokset": tulokset}
+
+    def _vastaa(self, metodi: str, polku: str, runko: bytes) -> Tuple[int, bytes]:
+        alku = time.perf_counter()
+        try:
+            Tietokanta.paivita(min_vali=self.tarkistusvali)
+            tila, vastaus = self.kasittele(metodi, polku, runko)
+        except Virhe as e:
+            tila, data = e.tila, _virhe_json(str(e))
+        except Exception as e:
+            tila, data = 500, _virhe_json(f"Sisäinen virhe: {e}")
+        else:
+            data = json.dumps(vastaus, ensure_ascii=False).encode("utf-8")
+
+        reitti = polku.split("?", 1)[0].rstrip("/") if tila != 404 else "(tuntematon)"
+        h = self.histogrammit.get(reitti)
+        if h is None:
+            h = self.histogrammit[reitti] = Viivehistogrammi()
+        h.lisaa(time.perf_counter() - alku, tila != 200)
+        return tila, data
+
+    async def _yhteys(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                try:
+                    otsake = await reader.readuntil(b"\r\n\r\n")
+                except asyncio.IncompleteReadError:
+                    break
+                except asyncio.LimitOverrunError:
+                    self._kirjoita(writer, 431, _virhe_json("Liian pitkät otsakkeet"), False)
+                    break
+                rivit = otsake.decode("latin-1").split("\r\n")
+                try:
+                    metodi, polku, versio = rivit[0].split(" ", 2)
+                except ValueError:
+                    break
+                otsakkeet = {}
+                for r in rivit[1:]:
+                    k, _, v = r.partition(":")
+                    if k:
+                        otsakkeet[k.strip().lower()] = v.strip()
+                yhteys = otsakkeet.get("connection", "").lower()
+                sailyta = yhteys != "close" if versio == "HTTP/1.1" else yhteys == "keep-alive"
+
+                if "transfer-encoding" in otsakkeet:
+                    # Only Content-Length bodies are read; the chunks would otherwise
+                    # be parsed as the next request
+                    self._kirjoita(writer, 411, _virhe_json("Käytä Content-Length-otsaketta"), False)
+                    await writer.drain()
+                    break
+                try:
+                    pituus = int(otsakkeet.get("content-length") or 0)
+                except ValueError:
+                    pituus = -1
+                if not 0 <= pituus <= MAX_RUNKO:
+                    self._kirjoita(writer, 413, _virhe_json("Virheellinen tai liian suuri runko"), False)
+                    await writer.drain()
+                    break
+                runko = await reader.readexactly(pituus) if pituus else b""
+
+                tila, data = self._vastaa(metodi, polku, runko)
+                self._kirjoita(writer, tila, data, sailyta)
+                await writer.drain()
+                if not sailyta:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _kirjoita(writer: asyncio.StreamWriter, tila: int, data: bytes, sailyta: bool) -> None:
+        writer.write(
+            f"HTTP/1.1 {tila} {_TILAT.get(tila, '')}\r\n"
+            f"Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(data)}\r\n"
+            f"Connection: {'keep-alive' if sailyta else 'close'}\r\n\r\n".encode("latin-1") + data)
+
+    async def kaynnista(self, osoite: str = "127.0.0.1", portti: int = 8080) -> asyncio.AbstractServer:
+        """Starts listening; returns the server (its sockets give the actual port)."""
+        return await asyncio.start_server(self._yhteys, osoite, portti)
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Paikallinen annostuspalvelu (JSON/HTTP).")
+    parser.add_argument("--osoite", default="127.0.0.1", help="Kuunneltava osoite (oletus 127.0.0.1)")
+    parser.add_argument("--portti", type=int, default=8080)
+    args = parser.parse_args(argv)
+
+    Tietokanta.lataa()
+
+    async def aja():
+        palvelin = await AnnostusPalvelu().kaynnista(args.osoite, args.portti)
+        print(f"Annostuspalvelu: http://{args.osoite}:{args.portti}/v1/", file=sys.stderr)
+        async with palvelin:
+            await palvelin.serve_forever()
+
+    try:
+        asyncio.run(aja())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
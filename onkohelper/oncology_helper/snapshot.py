@@ -0,0 +1,302 @@
+"""
+Compiled, memory-mapped protocol snapshots.
+
+A snapshot (`<data file>.<mtime_ns>-<size>.snap`) holds the compiled protocol database in a
+binary form that is used in place through `mmap`: no parsing at open, and all
+processes that open the same snapshot share one copy of its pages in the OS
+page cache. Records are decoded into `Protokolla` objects only when accessed.
+
+Layout (little-endian):
+
+    header      magic, format version, content hash and stat of the source file,
+                then the count and offset of each section
+    strings     u32 offsets (count + 1) followed by one UTF-8 blob; None is 0xFFFFFFFF
+    protocols   fixed-size records in source order (`_PROTOKOLLA`)
+    names       u32 protocol indices sorted by name bytes, for binary search
+    drugs       fixed-size records (`_LAAKE`), each protocol's drugs contiguous
+    sizes       u32 string indices of tablet size labels, with a parallel f64
+                array of their strengths in mg
+    days        u32 (first, last) day pairs
+
+Snapshots are written to a temporary file and renamed into place. Each build
+of a source file gets its own name (`tilannekuvan_polku`), so a rebuild never
+replaces or modifies a snapshot that is still mapped; Windows does not allow
+either. Older snapshots are removed once nothing maps them.
+"""
+import glob
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterator, List, Mapping, Optional, Tuple
+
+from oncology_helper.models import Laake, Protokolla, Yksikko
+
+_MAGIA = b"ONKSNAP\x00"
+# 2: tablet strength labels that do not parse are no longer stored
+VERSIO = 2
+_EI = 0xFFFFFFFF
+
+# magic, version, content hash, source mtime_ns and size, then (count, offset) per section
+_OTSAKE = struct.Struct("<8sI16sqq" + "IQ" * 6 + "Q")
+# name, sykli, kontrollit, esilaakitys, diagnoosi, sykli_vrk (-1 = None), first drug, drug count
+_PROTOKOLLA = struct.Struct("<IIIIIiII")
+# name, dose, unit, paivat, reseptiohje, first size, size count, first day pair, pair count, max_mg (NaN = None)
+_LAAKE = struct.Struct("<IdBIIIIIId")
+_U32 = struct.Struct("<I")
+_F64 = struct.Struct("<d")
+_PARI = struct.Struct("<II")
+
+_YKSIKOT = tuple(Yksikko)
+
+def tilannekuvan_polku(polku: str, lahde: Tuple[int, int]) -> str:
+    """Snapshot path of a source file with the given (mtime_ns, size)."""
+    return f"{polku}.{lahde[0]}-{lahde[1]}.snap"
+
+def siivoa(polku: str, sailyta: str) -> None:
+    """
+    Removes the snapshots of source file `polku` other than `sailyta`.
+    Snapshots still mapped (on Windows) are left for a later build to remove.
+    """
+    for vanha in glob.glob(glob.escape(polku) + ".*-*.snap"):
+        if vanha != sailyta:
+            try:
+                os.remove(vanha)
+            except OSError:
+                pass
+
+class _Merkkijonot:
+    """String table under construction; equal strings are stored once."""
+
+    def __init__(self) -> None:
+        self.indeksit: Dict[str, int] = {}
+        self.tavut: List[bytes] = []
+
+    def lisaa(self, s: Optional[str]) -> int:
+        if s is None:
+            return _EI
+        i = self.indeksit.get(s)
+        if i is None:
+            i = self.indeksit[s] = len(self.tavut)
+            self.tavut.append(s.encode("utf-8"))
+        return i
+
+def kirjoita(polku: str, protokollat: Mapping[str, Protokolla], tiiviste: str = "",
+             lahde: Tuple[int, int] = (0, 0)) -> None:
+    """
+    Writes a snapshot of compiled protocols.
+
+    Args:
+        polku: Snapshot path; replaced atomically. Must not be mapped (see
+            `tilannekuvan_polku`).
+        protokollat: Protocol name -> `Protokolla`, in the order to keep.
+        tiiviste: Hex content hash of the source file.
+        lahde: (mtime_ns, size) of the source file, for freshness checks.
+    """
+    jonot = _Merkkijonot()
+    p_osa, l_osa, k_osa, v_osa, j_osa = bytearray(), bytearray(), bytearray(), bytearray(), bytearray()
+    nimet: List[bytes] = []
+    laakkeita = kokoja = pareja = 0
+    for nimi, p in protokollat.items():
+        nimet.append(nimi.encode("utf-8"))
+        p_osa += _PROTOKOLLA.pack(jonot.lisaa(nimi), jonot.lisaa(p.sykli), jonot.lisaa(p.kontrollit),
+                                  jonot.lisaa(p.esilaakitys), jonot.lisaa(p.diagnoosi),
+                                  -1 if p.sykli_vrk is None else p.sykli_vrk, laakkeita, len(p.laakkeet))
+        for l in p.laakkeet:
+            l_osa += _LAAKE.pack(jonot.lisaa(l.nimi), l.annos, _YKSIKOT.index(l.yksikko), jonot.lisaa(l.paivat),
+                                 jonot.lisaa(l.reseptiohje), kokoja, len(l.tablettikoot), pareja,
+                                 len(l.paivat_jaksot), float("nan") if l.max_mg is None else l.max_mg)
+            for koko, mg in zip(l.tablettikoot, l.vahvuudet):
+                k_osa += _U32.pack(jonot.lisaa(koko))
+                v_osa += _F64.pack(mg)
+            for eka, vika in l.paivat_jaksot:
+                j_osa += _PARI.pack(eka, vika)
+            laakkeita += 1
+            kokoja += len(l.tablettikoot)
+            pareja += len(l.paivat_jaksot)
+    jarjestys = sorted(range(len(nimet)), key=nimet.__getitem__)
+
+    siirrot = bytearray()
+    kohta = 0
+    for b in jonot.tavut:
+        siirrot += _U32.pack(kohta)
+        kohta += len(b)
+    siirrot += _U32.pack(kohta)
+    osat = [
+        (len(jonot.tavut), bytes(siirrot) + b"".join(jonot.tavut)),
+        (len(nimet), bytes(p_osa)),
+        (len(nimet), b"".join(_U32.pack(i) for i in jarjestys)),
+        (laakkeita, bytes(l_osa)),
+        (kokoja, bytes(k_osa) + bytes(v_osa)),
+        (pareja, bytes(j_osa)),
+    ]
+    otsake: List[int] = []
+    kohta = _OTSAKE.size
+    for lkm, data in osat:
+        otsake += [lkm, kohta]
+        kohta += len(data)
+
+    valiaikainen = f"{polku}.{os.getpid()}.tmp"
+    try:
+        with open(valiaikainen, "wb") as f:
+            f.write(_OTSAKE.pack(_MAGIA, VERSIO, bytes.fromhex(tiiviste or "").ljust(16, b"\0")[:16],
+                                 lahde[0], lahde[1], *otsake, kohta))
+            for _, data in osat:
+                f.write(data)
+        os.replace(valiaikainen, polku)
+    except BaseException:
+        if os.path.exists(valiaikainen):
+            os.remove(valiaikainen)
+        raise
+
+class Tilannekuva(Mapping[str, Protokolla]):
+    """
+    Read-only mapping of protocol name -> `Protokolla` over a mapped snapshot.
+
+    Has the same interface as `data.ProtokollaVarasto`, including `tiiviste`.
+    """
+
+    def __init__(self, mm: mmap.mmap):
+        otsake = _OTSAKE.unpack_from(mm, 0)
+        if otsake[0] != _MAGIA or otsake[1] != VERSIO:
+            raise ValueError("Tuntematon tilannekuvan muoto")
+        self._mm = mm
+        self.tiiviste = otsake[2].hex()
+        self.lahde: Tuple[int, int] = (otsake[3], otsake[4])
+        (self._jonoja, self._jonot, self._lkm, self._protokollat, _, self._nimet, _, self._laakkeet,
+         self._kokoja, self._koot, _, self._jaksot, koko) = otsake[5:]
+        if koko != len(mm):
+            raise ValueError("Tilannekuva on katkennut")
+        self._blob = self._jonot + 4 * (self._jonoja + 1)
+        self._cache: Dict[str, Protokolla] = {}
+
+    @classmethod
+    def avaa(cls, polku: str) -> "Tilannekuva":
+        """
+        Maps a snapshot file.
+
+        Raises:
+            OSError: If the file cannot be opened.
+            ValueError: If the file is not a snapshot of this version, or is truncated.
+        """
+        with open(polku, "rb") as f:
+            # The mapping stays valid after the file is closed (or replaced)
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(mm)
+        except (ValueError, struct.error):
+            mm.close()
+            raise ValueError(f"Virheellinen tilannekuva: {polku}")
+
+    def _tavut(self, i: int) -> bytes:
+        alku, loppu = _PARI.unpack_from(self._mm, self._jonot + 4 * i)
+        return self._mm[self._blob + alku:self._blob + loppu]
+
+    def _jono(self, i: int) -> Optional[str]:
+        return None if i == _EI else self._tavut(i).decode("utf-8")
+
+    def _etsi(self, nimi: str) -> int:
+        """Index of the protocol named `nimi`, or -1."""
+        haettu = nimi.encode("utf-8")
+        ala, yla = 0, self._lkm
+        while ala < yla:
+            keski = (ala + yla) // 2
+            i = _U32.unpack_from(self._mm, self._nimet + 4 * keski)[0]
+            verrattava = self._tavut(_U32.unpack_from(self._mm, self._protokollat + _PROTOKOLLA.size * i)[0])
+            if verrattava < haettu:
+                ala = keski + 1
+            elif verrattava > haettu:
+                yla = keski
+            else:
+                return i
+        return -1
+
+    def _laake(self, i: int) -> Laake:
+        (nimi, annos, yksikko, paivat, ohje, koot, kokoja, jaksot, jaksoja,
+         max_mg) = _LAAKE.unpack_from(self._mm, self._laakkeet + _LAAKE.size * i)
+        return Laake(
+            nimi=self._jono(nimi),
+            annos=annos,
+            yksikko=_YKSIKOT[yksikko],
+            tablettikoot=tuple(self._jono(_U32.unpack_from(self._mm, self._koot + 4 * (koot + k))[0])
+                               for k in range(kokoja)),
+            vahvuudet=tuple(_F64.unpack_from(self._mm, self._koot + 4 * self._kokoja + 8 * (koot + k))[0]
+                            for k in range(kokoja)),
+            paivat=self._jono(paivat),
+            paivat_jaksot=tuple(_PARI.unpack_from(self._mm, self._jaksot + 8 * (jaksot + k)) for k in range(jaksoja)),
+            reseptiohje=self._jono(ohje),
+            max_mg=None if max_mg != max_mg else max_mg,
+        )
+
+    def __getitem__(self, nimi: str) -> Protokolla:
+        try:
+            return self._cache[nimi]
+        except KeyError:
+            pass
+        i = self._etsi(nimi) if isinstance(nimi, str) else -1
+        if i < 0:
+            raise KeyError(nimi)
+        (_, sykli, kontrollit, esilaakitys, diagnoosi, sykli_vrk, laakkeet,
+         laakkeita) = _PROTOKOLLA.unpack_from(self._mm, self._protokollat + _PROTOKOLLA.size * i)
+        arvo = Protokolla(
+            nimi=nimi,
+            sykli=self._jono(sykli),
+            kontrollit=self._jono(kontrollit),
+            esilaakitys=self._jono(esilaakitys),
+            laakkeet=tuple(self._laake(laakkeet + k) for k in range(laakkeita)),
+            diagnoosi=self._jono(diagnoosi),
+            sykli_vrk=None if sykli_vrk < 0 else sykli_vrk,
+        )
+        return self._cache.setdefault(nimi, arvo)
+
+    def __contains__(self, nimi: object) -> bool:
+        return isinstance(nimi, str) and self._etsi(nimi) >= 0
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(self._lkm):
+            yield self._jono(_U32.unpack_from(self._mm, self._protokollat + _PROTOKOLLA.size * i)[0])
+
+    def __len__(self) -> int:
+        return self._lkm
+
+def avaa_tuore(polku: str, lahde: Tuple[int, int]) -> Optional[Tilannekuva]:
+    """
+    Opens the snapshot at `polku` if it was built from a source file with the
+    given (mtime_ns, size).
+
+    Returns:
+        Optional[Tilannekuva]: The snapshot, or None if it is missing, stale or invalid.
+    """
+    try:
+        kuva = Tilannekuva.avaa(polku)
+    except (OSError, ValueError):
+        return None
+    if kuva.lahde != tuple(lahde):
+        return None
+    return kuva
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import argparse
+    from oncology_helper.data import Tietokanta
+
+    parser = argparse.ArgumentParser(description="Kääntää protokollatietokannan muistiin kartoitettavaksi "
+                                                 "tilannekuvaksi (<tiedosto>.<muutosaika>-<koko>.snap).")
+    parser.add_argument("tiedosto", nargs="?", help="Protokollatiedosto (oletus: paketin med_data.json)")
+    args = parser.parse_args(argv)
+
+    # Loading builds the snapshot if it is missing or stale
+    Tietokanta.lataa(args.tiedosto)
+    try:
+        st = os.stat(str(Tietokanta.polku))
+    except OSError:
+        st = None
+    polku = tilannekuvan_polku(str(Tietokanta.polku), (st.st_mtime_ns, st.st_size) if st else (0, 0))
+    kuva = avaa_tuore(polku, (st.st_mtime_ns, st.st_size)) if st else None
+    if kuva is None:
+        print(f"Tilannekuvaa ei voitu luoda ({polku})", file=sys.stderr)
+        return 1
+    print(f"{polku}: {len(kuva)} protokollaa", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
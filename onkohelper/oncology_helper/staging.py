@@ -0,0 +1,165 @@
+"""
+Compiled stage group lookup for the TNM diseases.
+
+The decision tables in `data.STAGE_SAANNOT` are compiled at import into one
+dense table per disease, indexed by the positions of the T, N and M codes in
+TNM_DATA. Staging a listed code combination is three dict lookups and one
+array access, for single rows and registry columns alike. Other codes (e.g.
+plain "T1" or "pT2") are matched against the rules directly.
+
+A new TNM disease needs only its TNM_DATA entry and a rule table.
+"""
+import re
+from typing import Any, Dict, Iterable, List, NamedTuple, Sequence, Tuple
+
+from oncology_helper.data import STAGE_SAANNOT, TNM_DATA
+
+EI_MAARITETTAVISSA = "Ei määritettävissä"
+
+# Clinical, pathological and post-therapy prefixes of a code ("pT2", "ypN1")
+_ETULIITE = re.compile(r"^[cpyrau]+(?=[TNM])")
+
+def koodi(arvo: Any) -> str:
+    """Code of a selection label, without a c/p/y prefix ("pT1c: >10-20 mm" -> "T1c")."""
+    return _ETULIITE.sub("", str(arvo).split(":")[0].strip())
+
+class _Saanto(NamedTuple):
+    # Code prefixes per axis; empty matches any code
+    t: Tuple[str, ...]
+    n: Tuple[str, ...]
+    m: Tuple[str, ...]
+    stage: str
+
+class StageTaulu:
+    """Compiled stage groups of one TNM disease."""
+    __slots__ = ("tauti", "t_koodit", "n_koodit", "m_koodit", "ryhmat", "taulu",
+                 "_saannot", "_t", "_n", "_m", "_nm")
+
+    def __init__(self, tauti: str, t_koodit: Sequence[str], n_koodit: Sequence[str], m_koodit: Sequence[str],
+                 saannot: Iterable[Dict[str, Any]]):
+        """
+        Args:
+            tauti: Disease name.
+            t_koodit: T codes in selection order (the table's first axis).
+            n_koodit: N codes in selection order.
+            m_koodit: M codes in selection order.
+            saannot: Decision table (see `data.STAGE_SAANNOT`).
+        """
+        self.tauti = tauti
+        self.t_koodit = tuple(t_koodit)
+        self.n_koodit = tuple(n_koodit)
+        self.m_koodit = tuple(m_koodit)
+        self._saannot = tuple(_Saanto(tuple(s.get("T", ())), tuple(s.get("N", ())), tuple(s.get("M", ())),
+                                      s["stage"]) for s in saannot)
+        # Distinct stage groups; the table holds indices into this
+        self.ryhmat: Tuple[str, ...] = tuple(dict.fromkeys((EI_MAARITETTAVISSA,) + tuple(s.stage for s in self._saannot)))
+        if len(self.ryhmat) > 256:
+            raise ValueError(f"Liikaa levinneisyysryhmiä: {tauti}")
+        indeksit = {r: i for i, r in enumerate(self.ryhmat)}
+        # Indexed by (t_index * len(N) + n_index) * len(M) + m_index
+        self.taulu = bytes(indeksit[self.sovella(t, n, m)]
+                           for t in self.t_koodit for n in self.n_koodit for m in self.m_koodit)
+        self._t = {k: i * len(self.n_koodit) for i, k in reversed(list(enumerate(self.t_koodit)))}
+        self._n = {k: i for i, k in reversed(list(enumerate(self.n_koodit)))}
+        self._m = {k: i for i, k in reversed(list(enumerate(self.m_koodit)))}
+        self._nm = len(self.m_koodit)
+
+    def sovella(self, t: str, n: str, m: str) -> str:
+        """Stage group by the rules themselves (codes without labels)."""
+        for s in self._saannot:
+            if ((not s.t or t.startswith(s.t)) and (not s.n or n.startswith(s.n))
+                    and (not s.m or m.startswith(s.m))):
+                return s.stage
+        return EI_MAARITETTAVISSA
+
+    def indeksi(self, t_index: int, n_index: int, m_index: int) -> str:
+        """Stage group by code positions in the selection lists."""
+        return self.ryhmat[self.taulu[(t_index * len(self.n_koodit) + n_index) * self._nm + m_index]]
+
+    def hae(self, t: str, n: str, m: str) -> str:
+        """
+        Stage group of a T/N/M combination.
+
+        Args:
+            t: T code or full selection label (e.g., "T1c", "T1c: >10-20 mm").
+            n: N code or label.
+            m: M code or label.
+
+        Returns:
+            str: The stage group.
+        """
+        ti, ni, mi = self._t.get(t), self._n.get(n), self._m.get(m)
+        if ti is None or ni is None or mi is None:
+            t, n, m = koodi(t), koodi(n), koodi(m)
+            ti, ni, mi = self._t.get(t), self._n.get(n), self._m.get(m)
+            if ti is None or ni is None or mi is None:
+                return self.sovella(t, n, m)
+        return self.ryhmat[self.taulu[(ti + ni) * self._nm + mi]]
+
+    def sarja(self, t: Iterable[str], n: Iterable[str], m: Iterable[str]) -> List[str]:
+        """
+        Stages whole registry columns at once.
+
+        Args:
+            t: T column (codes or labels).
+            n: N column.
+            m: M column.
+
+        Returns:
+            List[str]: Stage group per row.
+        """
+        ryhmat, taulu, nm = self.ryhmat, self.taulu, self._nm
+        tt, nt, mt = self._t, self._n, self._m
+        tulos: List[str] = []
+        muut: Dict[Tuple[str, str, str], str] = {}
+        for avain in zip(t, n, m):
+            ti, ni, mi = tt.get(avain[0]), nt.get(avain[1]), mt.get(avain[2])
+            if ti is None or ni is None or mi is None:
+                stage = muut.get(avain)
+                if stage is None:
+                    stage = muut[avain] = self.hae(*avain)
+                tulos.append(stage)
+            else:
+                tulos.append(ryhmat[taulu[(ti + ni) * nm + mi]])
+        return tulos
+
+def _kaanna(tauti: str, saannot: Iterable[Dict[str, Any]]) -> StageTaulu:
+    d = TNM_DATA[tauti]
+    return StageTaulu(tauti, *(tuple(koodi(a) for a in d[k]) for k in ("L1", "L2", "L3")), saannot)
+
+# Compiled tables of every disease with a rule table
+STAGE_TAULUT: Dict[str, StageTaulu] = {tauti: _kaanna(tauti, s) for tauti, s in STAGE_SAANNOT.items()}
+
+def stage_taulu(tauti: str) -> StageTaulu:
+    """
+    Compiled stage table of a disease.
+
+    Raises:
+        ValueError: If the disease has no stage rules.
+    """
+    taulu = STAGE_TAULUT.get(tauti)
+    if taulu is None:
+        raise ValueError(f"Ei levinneisyysryhmittelyä: {tauti!r}")
+    return taulu
+
+def laske_stage(tauti: str, t: str, n: str, m: str) -> str:
+    """
+    Stage group of a T/N/M combination of a disease in STAGE_SAANNOT.
+
+    Args:
+        tauti: Disease name (a key of TNM_DATA).
+        t: T code or full selection label.
+        n: N code or label.
+        m: M code or label.
+
+    Returns:
+        str: The stage group, or "Ei määritettävissä".
+
+    Raises:
+        ValueError: If the disease has no stage rules.
+    """
+    return stage_taulu(tauti).hae(t, n, m)
+
+def laske_stage_sarja(tauti: str, t: Iterable[str], n: Iterable[str], m: Iterable[str]) -> List[str]:
+    """Stage groups of whole T/N/M columns of one disease (see `StageTaulu.sarja`)."""
+    return stage_taulu(tauti).sarja(t, n, m)
@@ -0,0 +1,189 @@
+"""
+Switchable timing instrumentation.
+
+Sections are timed with the `mittaa` context manager or the `ajasta`
+decorator. Timings are aggregated in memory per section name into counts,
+means and latency histograms (p50/p90/p99), which can be written to a JSON
+file or shown as a table in the apps' debug panels.
+
+Instrumentation is off by default and then costs one flag check per call.
+Turn it on with `ota_kayttoon()` or the environment:
+
+    ONKOHELPER_AJANOTTO=1                   time sections
+    ONKOHELPER_AJANOTTO_TIEDOSTO=ajat.json  also write the statistics there at exit
+"""
+import atexit
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Optional, Tuple, TypeVar
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Upper bucket bounds of the latency histograms, in milliseconds
+VIIVERAJAT_MS: Tuple[float, ...] = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 1000)
+
+class Viivehistogrammi:
+    """Call count and latency histogram of one endpoint or section."""
+
+    def __init__(self, rajat_ms: Tuple[float, ...] = VIIVERAJAT_MS):
+        self.rajat_ms = rajat_ms
+        # One bucket per bound, plus one for slower requests
+        self.lukumaarat = [0] * (len(rajat_ms) + 1)
+        self.pyynnot = 0
+        self.virheet = 0
+        self.summa_ms = 0.0
+        self.max_ms = 0.0
+
+    def lisaa(self, kesto_s: float, virhe: bool = False) -> None:
+        ms = kesto_s * 1000
+        self.lukumaarat[bisect_left(self.rajat_ms, ms)] += 1
+        self.pyynnot += 1
+        self.summa_ms += ms
+        if ms > self.max_ms:
+            self.max_ms = ms
+        if virhe:
+            self.virheet += 1
+
+    def kvantiili(self, q: float) -> Optional[float]:
+        """
+        Upper bound (ms) of the bucket holding quantile `q`. None if there are no
+        calls, or if the quantile is above the last bound (see `max_ms`); JSON
+        has no infinity.
+        """
+        if not self.pyynnot:
+            return None
+        raja = q * self.pyynnot
+        kertyma = 0
+        for i, n in enumerate(self.lukumaarat):
+            kertyma += n
+            if kertyma >= raja:
+                return self.rajat_ms[i] if i < len(self.rajat_ms) else None
+        return None
+
+    def tiedot(self) -> Dict[str, Any]:
+        return {
+            "pyynnot": self.pyynnot,
+            "virheet": self.virheet,
+            "keskiarvo_ms": self.summa_ms / self.pyynnot if self.pyynnot else None,
+            "p50_ms": self.kvantiili(0.5),
+            "p90_ms": self.kvantiili(0.9),
+            "p99_ms": self.kvantiili(0.99),
+            "max_ms": self.max_ms,
+            "rajat_ms": list(self.rajat_ms),
+            "lukumaarat": list(self.lukumaarat),
+        }
+
+_paalla = os.environ.get("ONKOHELPER_AJANOTTO", "") not in ("", "0")
+_mittaukset: Dict[str, Viivehistogrammi] = {}
+_lukko = threading.Lock()
+
+def kaytossa() -> bool:
+    """Whether sections are being timed."""
+    return _paalla
+
+def ota_kayttoon(paalla: bool = True) -> None:
+    """Turns timing on or off. Statistics gathered so far are kept."""
+    global _paalla
+    _paalla = paalla
+
+def kirjaa(nimi: str, kesto_s: float, virhe: bool = False) -> None:
+    """Adds one timing of section `nimi` (also when timing is off)."""
+    with _lukko:
+        h = _mittaukset.get(nimi)
+        if h is None:
+            h = _mittaukset[nimi] = Viivehistogrammi()
+        h.lisaa(kesto_s, virhe)
+
+class _Mittaus:
+    __slots__ = ("nimi", "alku")
+
+    def __init__(self, nimi: str):
+        self.nimi = nimi
+
+    def __enter__(self) -> "_Mittaus":
+        self.alku = time.perf_counter()
+        return self
+
+    def __exit__(self, tyyppi, arvo, jaljitys) -> None:
+        kirjaa(self.nimi, time.perf_counter() - self.alku, tyyppi is not None)
+
+class _EiMittausta:
+    __slots__ = ()
+
+    def __enter__(self) -> None:
+        return None
+
+    def __exit__(self, tyyppi, arvo, jaljitys) -> None:
+        return None
+
+_EI_MITTAUSTA = _EiMittausta()
+
+def mittaa(nimi: str):
+    """
+    Context manager timing the block as section `nimi`; an exception counts
+    as an error. A shared no-op when timing is off.
+    """
+    return _Mittaus(nimi) if _paalla else _EI_MITTAUSTA
+
+def ajasta(nimi: Optional[str] = None) -> Callable[[F], F]:
+    """
+    Decorator timing every call of the function as section `nimi`
+    (default: the function's qualified name).
+    """
+    def koristele(fn: F) -> F:
+        osio = nimi or fn.__qualname__
+
+        @functools.wraps(fn)
+        def kaare(*args, **kwargs):
+            if not _paalla:
+                return fn(*args, **kwargs)
+            alku = time.perf_counter()
+            virhe = True
+            try:
+                tulos = fn(*args, **kwargs)
+                virhe = False
+                return tulos
+            finally:
+                kirjaa(osio, time.perf_counter() - alku, virhe)
+        return kaare  # type: ignore[return-value]
+    return koristele
+
+def tilastot() -> Dict[str, Dict[str, Any]]:
+    """Statistics per section name."""
+    with _lukko:
+        return {nimi: h.tiedot() for nimi, h in sorted(_mittaukset.items())}
+
+def nollaa() -> None:
+    """Clears all statistics."""
+    with _lukko:
+        _mittaukset.clear()
+
+def muotoile() -> str:
+    """Statistics as a fixed-width text table, for debug panels."""
+    rivit = [f"{'Osio':<32} {'n':>7} {'ka ms':>9} {'p50':>7} {'p90':>7} {'p99':>7} {'max ms':>9}"]
+    for nimi, t in tilastot().items():
+        # A quantile above the last bound is shown as ">bound"
+        p50, p90, p99 = (f"{t[k]:g}" if t[k] is not None else f">{t['rajat_ms'][-1]:g}"
+                         for k in ("p50_ms", "p90_ms", "p99_ms"))
+        rivit.append(f"{nimi[:32]:<32} {t['pyynnot']:>7} {t['keskiarvo_ms']:>9.2f} {p50:>7} "
+                     f"{p90:>7} {p99:>7} {t['max_ms']:>9.2f}")
+    return "\n".join(rivit)
+
+def tallenna(polku: str) -> None:
+    """Writes the statistics to a JSON file."""
+    with open(polku, "w", encoding="utf-8") as f:
+        json.dump({"aika": time.strftime("%Y-%m-%dT%H:%M:%S"), "pid": os.getpid(), "osiot": tilastot()},
+                  f, ensure_ascii=False, indent=1)
+
+def _tallenna_lopuksi(polku: str) -> None:
+    try:
+        tallenna(polku)
+    except OSError as e:
+        print(f"Virhe tallennettaessa ajanottoa ({polku}): {e}")
+
+if os.environ.get("ONKOHELPER_AJANOTTO_TIEDOSTO"):
+    atexit.register(_tallenna_lopuksi, os.environ["ONKOHELPER_AJANOTTO_TIEDOSTO"])
@@ -1,13 +1,55 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
 from oncology_helper.data import Tietokanta
-from oncology_helper.logic import safe_float, laske_bsa, laske_cockcroft_gault, pyorista_tabletit
+from oncology_helper.models import KAIKKI_VAHVUUDET
+from oncology_helper.logic import safe_float, laske_bsa, laske_cockcroft_gault, laske_annos_mg, laske_maarays
+from oncology_helper.report import muodosta_raportti
+from oncology_helper.audit import laskentamerkinta, oletusloki
+from oncology_helper.timing import ajasta
+
+def rivimuutos(vanha, uusi):
+    """
+    Computes the smallest line-range edit that turns text `vanha` into `uusi`.
+
+    Returns:
+        (start index, end index, text to insert) as tk.Text indices.
+    """
+    a = vanha.split("\n")
+    b = uusi.split("\n")
+    n = min(len(a), len(b))
+    p = 0
+    while p < n and a[p] == b[p]:
+        p += 1
+    s = 0
+    while s < n - p and a[-1 - s] == b[-1 - s]:
+        s += 1
+    keski = b[p:len(b) - s]
+
+    if s:
+        # Replace whole lines p+1 .. len(a)-s, keeping the newline before the suffix
+        return f"{p + 1}.0", f"{len(a) - s + 1}.0", "".join(r + "\n" for r in keski)
+    if p:
+        # Replace from the end of the last common line to the end of the text
+        return f"{p}.end", "end-1c", "".join("\n" + r for r in keski)
+    return "1.0", "end-1c", uusi
+
+# Pause after the last manual Määräys edit before it is written to the audit log
+KIRJAUSVIIVE_MS = 1500
 
 class LaskuriView(ttk.Frame):
     def __init__(self, parent, controller):
         super().__init__(parent)
         self.controller = controller
         self.rows = []
+        # Protocol snapshot the rows were built from (kept across data reloads)
+        self.protokolla = None
+        # Pending after_idle render, so many updates in one event produce one render
+        self._raportti_ajastus = None
+        # Pending audit entry for manual edits, and the edits last logged
+        self._kirjaus_ajastus = None
+        self._kirjatut_muutokset = ()
+        # Inputs of the last calculation, for the audit log
+        self._laskenta = None
         
         # Header
         h = ttk.Frame(self)
@@ -88,6 +130,10 @@ class LaskuriView(ttk.Frame):
         
         self.v_sex = tk.StringVar(value="Mies")
         ttk.OptionMenu(f1, self.v_sex, "Mies", "Mies", "Nainen").grid(row=1, column=3, padx=5)
+
+        ttk.Label(f1, text="Tunniste:").grid(row=3, column=0)
+        self.e_id = ttk.Entry(f1, width=20)
+        self.e_id.grid(row=3, column=1, columnspan=3, sticky="w", padx=5)
         
         self.l_bsa = ttk.Label(f1, text="BSA: -", font=("Arial", 9, "bold"))
         self.l_bsa.grid(row=0, column=4, padx=15)
@@ -95,9 +141,15 @@ class LaskuriView(ttk.Frame):
         self.l_gfr.grid(row=2, column=4, padx=15)
         
         ttk.Label(p, text="Protokolla:").grid(row=1, column=0, sticky="w", pady=(10,2))
-        self.c_prot = ttk.Combobox(p, values=list(Tietokanta.data.keys()), state="readonly")
-        self.c_prot.grid(row=2, column=0, sticky="ew", padx=5)
+        fp = ttk.Frame(p)
+        fp.grid(row=2, column=0, sticky="ew", padx=5)
+        self.c_prot = ttk.Combobox(fp, values=list(Tietokanta.data.keys()), state="readonly")
+        self.c_prot.pack(side=tk.LEFT, fill=tk.X, expand=True)
         self.c_prot.bind("<<ComboboxSelected>>", self.update_meds)
+        ttk.Label(fp, text="Hae:").pack(side=tk.LEFT, padx=(10, 2))
+        self.e_haku = ttk.Entry(fp, width=20)
+        self.e_haku.pack(side=tk.LEFT)
+        self.e_haku.bind("<KeyRelease>", lambda e: self.paivita_protokollat())
         
         f2 = ttk.Frame(p)
         f2.grid(row=3, column=0, sticky="ew", pady=10)
@@ -110,33 +162,40 @@ class LaskuriView(ttk.Frame):
         self.f_meds = ttk.LabelFrame(p, text="Lääkkeet", padding=5)
         self.f_meds.grid(row=4, column=0, sticky="nsew", pady=5)
 
+    @ajasta("laskuri.update_meds")
     def update_meds(self, e=None):
         for w in self.f_meds.winfo_children(): w.destroy()
         self.rows.clear()
+        # A new protocol starts a new calculation
+        self._laskenta = None
+        self._kirjatut_muutokset = ()
         sel = self.c_prot.get()
         if not sel: return
         
         d = Tietokanta.data[sel]
+        self.protokolla = d
         self.e_labs.delete(0, tk.END)
-        self.e_labs.insert(0, d.get('kontrollit', ''))
+        self.e_labs.insert(0, d.kontrollit)
         
         cols = ["Lääke", "Annos", "Yks.", "Vahvuus", "Tulos", "Määräys"]
         for i, c in enumerate(cols): 
             ttk.Label(self.f_meds, text=c, font=("Arial", 8, "bold")).grid(row=0, column=i)
         
-        for i, m in enumerate(d['lääkkeet']):
+        for i, m in enumerate(d.laakkeet):
             r = i+1
-            ttk.Label(self.f_meds, text=m['nimi']).grid(row=r, column=0, sticky="w")
+            ttk.Label(self.f_meds, text=m.nimi).grid(row=r, column=0, sticky="w")
             
-            v_a = tk.StringVar(value=str(m['annos']))
+            v_a = tk.StringVar(value=str(m.annos))
             ttk.Entry(self.f_meds, textvariable=v_a, width=6).grid(row=r, column=1)
             
-            v_u = tk.StringVar(value=m.get('yksikkö', 'mg/m2'))
+            v_u = tk.StringVar(value=m.yksikko.value)
             ttk.Combobox(self.f_meds, textvariable=v_u, values=["mg/m2", "mg/kg", "AUC", "mg"], width=8).grid(row=r, column=2)
             
             v_t = tk.StringVar()
-            if "tablettikoot" in m:
-                cb = ttk.Combobox(self.f_meds, textvariable=v_t, values=m["tablettikoot"], width=8)
+            if m.tablettikoot:
+                # Several strengths: combining them all is offered first
+                koot = ((KAIKKI_VAHVUUDET,) if len(m.tablettikoot) > 1 else ()) + m.tablettikoot
+                cb = ttk.Combobox(self.f_meds, textvariable=v_t, values=koot, width=8)
                 cb.current(0)
                 cb.grid(row=r, column=3)
             else: 
@@ -150,10 +209,12 @@ class LaskuriView(ttk.Frame):
             e_fin.grid(row=r, column=5)
             
             # Update report when value changes (calculated or manual)
-            v_fin.trace_add("write", lambda *args: self.paivita_raportti())
+            v_fin.trace_add("write", lambda *args: self.ajoita_raportti())
+            v_fin.trace_add("write", lambda *args: self.ajoita_kirjaus())
             
-            self.rows.append({"n":m['nimi'], "va":v_a, "vu":v_u, "vt":v_t, "lr":l_res, "v_fin":v_fin, "ef":e_fin, "d":m})
+            self.rows.append({"n":m.nimi, "va":v_a, "vu":v_u, "vt":v_t, "lr":l_res, "v_fin":v_fin, "ef":e_fin, "d":m})
 
+    @ajasta("laskuri.laske")
     def laske(self):
         p = safe_float(self.e_len.get())
         w = safe_float(self.e_wei.get())
@@ -165,75 +226,82 @@ class LaskuriView(ttk.Frame):
         self.l_gfr.config(text=f"GFR: {gfr:.0f}")
         
         for r in self.rows:
-            a = safe_float(r['va'].get())
-            u = r['vu'].get()
-            
-            if u == "mg/m2":
-                mg = a * bsa
-            elif u == "mg/kg":
-                mg = a * w
-            elif u == "AUC":
-                # Calvert formula: Dose = AUC * (GFR + 25)
-                # GFR cap is often 125 ml/min
-                mg = a * (min(gfr, 125) + 25)
-            else:
-                mg = a
-            
+            mg = laske_annos_mg(safe_float(r['va'].get()), r['vu'].get(), bsa, w, gfr)
             r['lr'].config(text=f"{mg:.0f}")
-            fin = int(round(mg))
-            
-            ts = r['vt'].get()
-            if ts and ts != "None":
-                try: 
-                    # Extract strength from string like "40 mg"
-                    strength = float(ts.split()[0])
-                    fin = pyorista_tabletit(mg, strength)
-                except: 
-                    pass
+            fin = laske_maarays(mg, r['d'].vahvuudet_valinnalle(r['vt'].get()))
+            r['mg'], r['laskettu'] = mg, fin
             
-            # This triggers the trace, so paivita_raportti is called automatically
+            # This triggers the trace, which schedules a single report render
             r['v_fin'].set(str(fin))
             
         # Ensure report is updated at least once (redundant if trace works, but safe)
+        self.ajoita_raportti()
+
+        self._laskenta = {"pituus": p, "paino": w, "ika": safe_float(self.e_age.get()),
+                          "krea": safe_float(self.e_krea.get()), "sukupuoli": self.v_sex.get(),
+                          "bsa": bsa, "gfr": gfr}
+        self._kirjatut_muutokset = ()
+        self.kirjaa("laskenta")
+
+    def kirjaa(self, tapahtuma):
+        """Queues the current calculation to the audit log (never waits for the disk)."""
+        loki = oletusloki()
+        if loki is None or self._laskenta is None:
+            return
+        tiedot = dict(self._laskenta)
+        bsa, gfr = tiedot.pop("bsa"), tiedot.pop("gfr")
+        laakkeet = [{"nimi": r['n'], "annos": safe_float(r['va'].get()), "yksikkö": r['vu'].get(),
+                     "vahvuus": r['vt'].get() or None, "mg": round(r['mg'], 2), "laskettu": r['laskettu'],
+                     "määräys": r['v_fin'].get()}
+                    for r in self.rows if 'laskettu' in r]
+        loki.kirjaa(laskentamerkinta("tk", tapahtuma, self.e_id.get().strip(), self.c_prot.get(),
+                                     tiedot, bsa, gfr, laakkeet))
+
+    def ajoita_kirjaus(self):
+        """Logs manual Määräys edits once typing has paused."""
+        if self._kirjaus_ajastus is not None:
+            self.after_cancel(self._kirjaus_ajastus)
+        self._kirjaus_ajastus = self.after(KIRJAUSVIIVE_MS, self._kirjaa_muutokset)
+
+    def _kirjaa_muutokset(self):
+        self._kirjaus_ajastus = None
+        muutokset = tuple((r['n'], r['v_fin'].get().strip()) for r in self.rows
+                          if 'laskettu' in r and r['v_fin'].get().strip() != str(r['laskettu']))
+        if muutokset != self._kirjatut_muutokset:
+            self._kirjatut_muutokset = muutokset
+            self.kirjaa("muutos")
+
+    def ajoita_raportti(self):
+        """Schedules one report render for when the event loop is idle."""
+        if self._raportti_ajastus is None:
+            self._raportti_ajastus = self.after_idle(self._piirra_ajoitettu)
+
+    def _piirra_ajoitettu(self):
+        self._raportti_ajastus = None
         self.paivita_raportti()
 
+    @ajasta("laskuri.paivita_raportti")
     def paivita_raportti(self):
         sel = self.c_prot.get()
-        out = [f"PROTOKOLLA: {sel}"]
-        
-        if sel in Tietokanta.data:
-            d = Tietokanta.data[sel]
-            if "sykli" in d:
-                out.append(f"Sykli: {d['sykli']}")
-        
-        out.append(f"Labrat: {self.e_labs.get()}")
-        out.append("-" * 40)
-        
-        for r in self.rows:
-            # Read from StringVar to capture manual edits
-            fin_str = r['v_fin'].get()
-            fin = safe_float(fin_str)
-            
-            out.append(f"• {r['n']}: {fin_str} mg")
-            
-            ts = r['vt'].get()
-            if ts and ts != "None" and fin > 0:
-                try: 
-                    strength = float(ts.split()[0])
-                    out.append(f"    -> {fin/strength:.1f} kpl ({ts})")
-                except: 
-                    pass
-            
-            if r['d'].get('päivät'): 
-                out.append(f"   Ajoitus: {r['d']['päivät']}")
+        # Read from StringVar to capture manual edits
+        rivit = [{"med": r['d'], "maarays": r['v_fin'].get(), "vahvuus": r['vt'].get()} for r in self.rows]
+        raportti = muodosta_raportti(sel, self.protokolla if sel else None, self.e_labs.get(), rivit)
 
-        if sel:
-            d = Tietokanta.data[sel]
-            out.append("-" * 40)
-            out.append(f"TUKIHOIDOT:\n{d.get('esilääkitys', '-')}")
-            
-        self.txt.delete("1.0", tk.END)
-        self.txt.insert(tk.END, "\n".join(out))
+        self._aseta_teksti(raportti)
+
+    def _aseta_teksti(self, uusi):
+        """Replaces only the changed lines of the report Text widget."""
+        vanha = self.txt.get("1.0", "end-1c")
+        if vanha == uusi:
+            return
+        alku, loppu, lisays = rivimuutos(vanha, uusi)
+        self.txt.delete(alku, loppu)
+        self.txt.insert(alku, lisays)
+
+    def paivita_protokollat(self):
+        """Refreshes the protocol list after a database reload or a search edit."""
+        haku = self.e_haku.get().strip()
+        self.c_prot['values'] = Tietokanta.hae(haku) if haku else list(Tietokanta.data.keys())
 
     def kopioi(self):
         self.clipboard_clear()
@@ -241,11 +309,22 @@ class LaskuriView(ttk.Frame):
         messagebox.showinfo("OK", "Kopioitu.")
 
     def tyhjenna(self):
-        for e in [self.e_len, self.e_wei, self.e_age, self.e_krea, self.e_labs]:
+        for e in [self.e_len, self.e_wei, self.e_age, self.e_krea, self.e_labs, self.e_id]:
             e.delete(0, tk.END)
             e.config(foreground="black")
         self.v_sex.set("Mies")
+        self.e_haku.delete(0, tk.END)
+        self.paivita_protokollat()
         self.c_prot.set("")
+        self.protokolla = None
+        if self._raportti_ajastus is not None:
+            self.after_cancel(self._raportti_ajastus)
+            self._raportti_ajastus = None
+        if self._kirjaus_ajastus is not None:
+            self.after_cancel(self._kirjaus_ajastus)
+            self._kirjaus_ajastus = None
+        self._laskenta = None
+        self._kirjatut_muutokset = ()
         self.l_bsa.config(text="BSA: -")
         self.l_gfr.config(text="GFR: -")
         self.txt.delete("1.0", tk.END)
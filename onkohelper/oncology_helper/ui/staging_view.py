@@ -1,7 +1,9 @@
 import tkinter as tk
 from tkinter import ttk
 from oncology_helper.data import TNM_DATA
-from oncology_helper.logic import laske_stage_rintasyopa, suosittele_hoito_rintasyopa, maarita_hoitosuunnitelma_rintasyopa
+from oncology_helper.logic import suosittele_hoito_rintasyopa, maarita_hoitosuunnitelma_rintasyopa
+from oncology_helper.staging import STAGE_TAULUT
+from oncology_helper.timing import ajasta
 
 class LevinneisyysView(ttk.Frame):
     def __init__(self, parent, controller):
@@ -112,6 +114,7 @@ class LevinneisyysView(ttk.Frame):
         for c in self.combos: c.set('')
         self.txt.delete("1.0", tk.END)
 
+    @ajasta("levinneisyys.calc_res")
     def calc_res(self, e=None):
         tauti = self.v_tauti.get()
         v1 = self.vars[0].get()
@@ -146,10 +149,11 @@ class LevinneisyysView(ttk.Frame):
         else:
             # TNM Logiikka
             res += f"Levinneisyys (cTNM): {c1}{c2}{c3}"
-            if tauti == "Rintasyöpä" and "?" not in (c1, c2, c3):
-                st = laske_stage_rintasyopa(c1, c2, c3)
+            if tauti in STAGE_TAULUT and "?" not in (c1, c2, c3):
+                st = STAGE_TAULUT[tauti].hae(c1, c2, c3)
                 res += f"\nAnatominen levinneisyysryhmä: {st}"
                 
+            if tauti == "Rintasyöpä" and "?" not in (c1, c2, c3):
                 # Full treatment plan
                 plan = maarita_hoitosuunnitelma_rintasyopa(
                     st, c1, c2, c3, 
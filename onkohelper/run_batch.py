@@ -0,0 +1,10 @@
+import sys
+import os
+
+# Ensure the current directory is in the path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from oncology_helper.batch import main
+
+if __name__ == "__main__":
+    sys.exit(main())
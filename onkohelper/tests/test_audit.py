@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import unittest
+from oncology_helper.audit import AnnosLoki, laskentamerkinta
+
+class TestAnnosLoki(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.polku = os.path.join(self.tmp.name, "loki", "annosloki.jsonl")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def kirjaa(self, loki, n):
+        for i in range(n):
+            loki.kirjaa({"potilas": f"P{i % 10}", "aika": f"2026-0{1 + i % 3}-15T10:00:00", "i": i})
+
+    def test_historia(self):
+        loki = AnnosLoki(self.polku, kirjoitusvali=60)
+        self.kirjaa(loki, 100)
+        # Queued entries are found before the writer thread has run
+        historia = loki.historia("P3")
+        self.assertEqual([m["i"] for m in historia], list(range(3, 100, 10)))
+        self.assertEqual([m["i"] for m in loki.historia("P3", "2026-02-01", "2026-02-28")], [13, 43, 73])
+        self.assertEqual(loki.historia("P99"), [])
+        loki.kirjaa({"potilas": "P3"})
+        self.assertEqual(len(loki.historia("P3")), 11)
+        loki.sulje()
+        with open(self.polku, encoding="utf-8") as f:
+            self.assertEqual(len(f.readlines()), 101)
+
+    def test_avaus_jatkaa_ja_korjaa(self):
+        loki = AnnosLoki(self.polku)
+        self.kirjaa(loki, 20)
+        loki.sulje()
+        # A partial line from a crash, and entries appended by another writer
+        with open(self.polku, "ab") as f:
+            f.write(json.dumps({"potilas": "P1", "aika": "2026-04-01T08:00:00"}).encode() + b"\n")
+            f.write(b'{"potilas": "P1", "ai')
+        loki = AnnosLoki(self.polku)
+        loki.kirjaa({"potilas": "P1", "aika": "2026-04-02T08:00:00"})
+        self.assertEqual(len(loki.historia("P1")), 4)
+        loki.sulje()
+        # The index is rebuilt from the log
+        os.remove(self.polku + ".idx")
+        loki = AnnosLoki(self.polku)
+        self.assertEqual([m["aika"][:10] for m in loki.historia("P1", "2026-04-01")], ["2026-04-01", "2026-04-02"])
+        loki.sulje()
+        with self.assertRaises(ValueError):
+            loki.kirjaa({"potilas": "P1"})
+
+    def test_kirjoitusvirhe_sailyttaa_merkinnat(self):
+        loki = AnnosLoki(self.polku, kirjoitusvali=60)
+        oikea = loki._loki
+
+        class Taysi:
+            def write(self, data):
+                raise OSError("Levy täynnä")
+
+            def __getattr__(self, nimi):
+                return getattr(oikea, nimi)
+
+        loki._loki = Taysi()
+        self.kirjaa(loki, 3)
+        with self.assertRaises(OSError):
+            loki.kirjoita()
+        loki._loki = oikea
+        loki.kirjaa({"potilas": "P0", "aika": "2026-05-01T10:00:00", "i": 3})
+        # The failed batch is written first, before the later entry
+        self.assertEqual([m["i"] for m in loki.historia("P0")], [0, 3])
+        loki.sulje()
+        with open(self.polku, encoding="utf-8") as f:
+            self.assertEqual([json.loads(r)["i"] for r in f], [0, 1, 2, 3])
+
+    def test_lyhyet_kirjoitukset(self):
+        loki = AnnosLoki(self.polku, kirjoitusvali=60)
+        oikea = loki._loki
+        kirjoitukset = []
+
+        class Lyhyt:
+            # Writes at most 10 bytes per call; the second call fails when `virhe` is set
+            virhe = True
+
+            def write(self, data):
+                if self.virhe and len(kirjoitukset) == 1:
+                    raise OSError("Levy täynnä")
+                kirjoitukset.append(data)
+                return oikea.write(data[:10])
+
+            def __getattr__(self, nimi):
+                return getattr(oikea, nimi)
+
+        loki._loki = Lyhyt()
+        self.kirjaa(loki, 3)
+        with self.assertRaises(OSError):
+            loki.kirjoita()
+        Lyhyt.virhe = False
+        loki.kirjoita()
+        self.assertEqual([m["i"] for m in loki.historia("P0")], [0])
+        loki._loki = oikea
+        loki.sulje()
+        # The partial line is ended and every entry is written whole, once
+        with open(self.polku, encoding="utf-8") as f:
+            rivit = f.read().split("\n")
+        self.assertEqual(len(rivit[0]), 10)
+        self.assertEqual([json.loads(r)["i"] for r in rivit[1:-1]], [0, 1, 2])
+
+    def test_laskentamerkinta(self):
+        m = laskentamerkinta("tk", "muutos", "P1", "R-CHOP", {"pituus": 180.0}, 2.0, 100.0, [
+            {"nimi": "Rituksimabi", "laskettu": 750, "määräys": "750"},
+            {"nimi": "Prednisoloni", "laskettu": 100, "määräys": "80"},
+        ])
+        self.assertEqual(m["pituus"], 180.0)
+        self.assertEqual([l["muutettu"] for l in m["lääkkeet"]], [False, True])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+import io
+import json
+import unittest
+from oncology_helper.batch import lue_potilaat, laske_potilas, kasittele
+from oncology_helper.models import kaanna_protokolla
+from oncology_helper.report import muodosta_raportti
+
+PROTOKOLLAT = {
+    "R-CHOP": kaanna_protokolla("R-CHOP", {
+        "sykli": "21 vrk",
+        "kontrollit": "PVK, Krea",
+        "esilääkitys": "Ondansetroni 8mg.",
+        "lääkkeet": [
+            {"nimi": "Rituksimabi", "annos": 375, "yksikkö": "mg/m2", "päivät": "D1"},
+            {"nimi": "Prednisoloni", "annos": 100, "yksikkö": "mg (kiinteä)", "tablettikoot": ["40 mg", "20 mg"], "päivät": "D1-5"},
+        ]
+    })
+}
+
+class TestBatch(unittest.TestCase):
+
+    def test_lue_potilaat_csv_puolipiste(self):
+        f = io.StringIO("pituus;paino;ika;krea;sukupuoli;protokolla\n180;80,5;50;100;Mies;R-CHOP\n")
+        rivit = list(lue_potilaat(f, "csv"))
+        self.assertEqual(len(rivit), 1)
+        self.assertEqual(rivit[0]["paino"], "80,5")
+        self.assertEqual(rivit[0]["protokolla"], "R-CHOP")
+
+    def test_raportti_vastaa_laskurinakymaa(self):
+        tulos = laske_potilas({"pituus": 180, "paino": 80, "ika": 50, "krea": 100, "sukupuoli": "Mies", "protokolla": "R-CHOP"}, PROTOKOLLAT)
+        self.assertAlmostEqual(tulos["bsa"], 2.0)
+        # Prednisolone combines its 40 mg and 20 mg tablets
+        self.assertEqual([l["määräys"] for l in tulos["lääkkeet"]], [750, 100])
+        p = PROTOKOLLAT["R-CHOP"]
+        odotettu = muodosta_raportti("R-CHOP", p, "PVK, Krea", [
+            {"med": p.laakkeet[0], "maarays": "750", "vahvuus": "None"},
+            {"med": p.laakkeet[1], "maarays": "100", "vahvuus": "Kaikki"},
+        ])
+        self.assertEqual(tulos["raportti"], odotettu)
+        self.assertIn("    -> 2 x 40 mg + 1 x 20 mg", odotettu)
+        self.assertTrue(odotettu.endswith("TUKIHOIDOT:\nOndansetroni 8mg."))
+
+    def test_puuttuvat_ja_virheelliset_arvot(self):
+        sisaan = io.StringIO("id;pituus;paino;ika;krea;sukupuoli;protokolla\n"
+                             "a;180;80;50;100;Mies;R-CHOP\n"
+                             "b;180;80;50;abc;Mies;R-CHOP\n"
+                             "c;;;50;100;Mies;R-CHOP\n"
+                             "d;180;-80;50;100;Mies;R-CHOP\n")
+        ulos, virheet = io.StringIO(), io.StringIO()
+        ok, failed = kasittele(sisaan, ulos, PROTOKOLLAT, "csv", "jsonl", virheet=virheet)
+        self.assertEqual((ok, failed), (1, 3))
+        self.assertEqual(virheet.getvalue().splitlines(), [
+            "Rivi 2: Virheellinen arvo: krea='abc'",
+            "Rivi 3: Puuttuva kenttä: paino",
+            "Rivi 4: Virheellinen arvo: paino='-80'",
+        ])
+
+    def test_kasittele_jsonl_virherivi(self):
+        sisaan = io.StringIO(
+            json.dumps({"id": "a", "pituus": 180, "paino": 80, "ika": 50, "krea": 100, "sukupuoli": "Mies", "protokolla": "R-CHOP"}) + "\n"
+            + json.dumps({"id": "b", "protokolla": "Tuntematon"}) + "\n")
+        ulos = io.StringIO()
+        ok, failed = kasittele(sisaan, ulos, PROTOKOLLAT, "jsonl", "jsonl", virheet=io.StringIO())
+        self.assertEqual((ok, failed), (1, 1))
+        rivit = [json.loads(l) for l in ulos.getvalue().splitlines()]
+        self.assertEqual(rivit[0]["id"], "a")
+        self.assertIn("virhe", rivit[1])
+
+    def test_kasittele_jsonl_viallinen_rivi(self):
+        rivi = json.dumps({"id": "a", "pituus": 180, "paino": 80, "ika": 50, "krea": 100, "sukupuoli": "Mies",
+                           "protokolla": "R-CHOP"})
+        sisaan = io.StringIO("\n".join([rivi, '{"id": "b", "pituus', "[1, 2]", "5", rivi]) + "\n")
+        ulos, virheet = io.StringIO(), io.StringIO()
+        ok, failed = kasittele(sisaan, ulos, PROTOKOLLAT, "jsonl", "jsonl", virheet=virheet)
+        self.assertEqual((ok, failed), (2, 3))
+        rivit = [json.loads(l) for l in ulos.getvalue().splitlines()]
+        self.assertEqual([r.get("rivi") for r in rivit[1:4]], [2, 3, 4])
+        self.assertTrue(rivit[1]["virhe"].startswith("Virheellinen JSON"))
+        self.assertEqual(rivit[2]["virhe"], "Rivi ei ole JSON-objekti")
+        self.assertEqual(rivit[4]["id"], "a")
+        self.assertIn("Rivi 4: Rivi ei ole JSON-objekti", virheet.getvalue())
+
+    def test_luokitus_tauti(self):
+        sisaan = io.StringIO("id;tauti;t;n;m\n1;Keuhkosyöpä (NSCLC);T2a;N0;M0\n2;Tuntematon;T1;N0;M0\n3;;T1c;N0;M0\n")
+        ulos, virheet = io.StringIO(), io.StringIO()
+        ok, failed = kasittele(sisaan, ulos, PROTOKOLLAT, "csv", "jsonl", virheet=virheet, tehtava="luokitus")
+        self.assertEqual((ok, failed), (2, 1))
+        rivit = [json.loads(l) for l in ulos.getvalue().splitlines()]
+        self.assertEqual([r.get("stage") for r in rivit], ["Stage IB", None, "Stage IA"])
+        self.assertEqual(rivit[2]["tauti"], "Rintasyöpä")
+
+    def test_aikataulu(self):
+        sisaan = io.StringIO("id,protokolla,alkupvm,syklit\na,R-CHOP,5.1.2026,2\nb,R-CHOP,32.1.2026,1\n")
+        ulos, virheet = io.StringIO(), io.StringIO()
+        ok, failed = kasittele(sisaan, ulos, PROTOKOLLAT, "csv", "teksti", virheet=virheet, tehtava="aikataulu")
+        self.assertEqual((ok, failed), (1, 1))
+        self.assertIn("  Sykli 2: Prednisoloni 26.01.2026-30.01.2026", ulos.getvalue())
+        self.assertIn("Rivi 2: Virheellinen päivämäärä", virheet.getvalue())
+
+    def test_aikataulu_syklimaara(self):
+        protokollat = dict(PROTOKOLLAT, X=kaanna_protokolla("X", {"lääkkeet": [{"nimi": "A", "päivät": "D1"}]}))
+        sisaan = io.StringIO("id;protokolla;alkupvm;syklit\na;R-CHOP;5.1.2026;2,5\nb;X;5.1.2026;2\nc;X;5.1.2026;1\n")
+        ulos, virheet = io.StringIO(), io.StringIO()
+        ok, failed = kasittele(sisaan, ulos, protokollat, "csv", "teksti", virheet=virheet, tehtava="aikataulu")
+        self.assertEqual((ok, failed), (1, 2))
+        self.assertIn("Rivi 1: Virheellinen syklimäärä: '2,5'", virheet.getvalue())
+        self.assertIn("Rivi 2: Syklin pituus ei ole tiedossa (X)", virheet.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,30 @@
+import unittest
+from benchmarks.bench import luo_kohortti, luo_protokollat, mittaa, vertaa
+from oncology_helper.models import kaanna_protokolla
+
+class TestBench(unittest.TestCase):
+
+    def test_synteettinen_data(self):
+        data = luo_protokollat(50, siemen=3)
+        self.assertEqual(data, luo_protokollat(50, siemen=3))
+        self.assertEqual(len(data), 50)
+        for nimi, d in data.items():
+            self.assertTrue(kaanna_protokolla(nimi, d).laakkeet)
+        kohortti = luo_kohortti(10, list(data), siemen=3)
+        self.assertTrue(all(r["protokolla"] in data for r in kohortti))
+
+    def test_mittaa_ja_vertaa(self):
+        r = mittaa(lambda: None, 10, 2, min_aika=0.001)
+        self.assertGreater(r["kierrokset"], 1)
+        self.assertEqual(r["toistot"], 2)
+
+        vanha = {"tulokset": {"a": {"per_op_us": 1.0}, "b": {"per_op_us": 2.0}, "c": {"per_op_us": 1.0}}}
+        uusi = {"tulokset": {"a": {"per_op_us": 1.1}, "b": {"per_op_us": 3.0}, "d": {"per_op_us": 1.0}}}
+        rivit = {r["nimi"]: r for r in vertaa(vanha, uusi, kynnys=1.3)}
+        self.assertEqual(set(rivit), {"a", "b"})
+        self.assertFalse(rivit["a"]["heikentynyt"])
+        self.assertTrue(rivit["b"]["heikentynyt"])
+        self.assertAlmostEqual(rivit["b"]["suhde"], 1.5)
+
+if __name__ == '__main__':
+    unittest.main()
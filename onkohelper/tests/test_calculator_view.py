@@ -0,0 +1,58 @@
+import random
+import unittest
+
+try:
+    from oncology_helper.ui.calculator_view import rivimuutos
+except ImportError:
+    # Python built without Tk
+    rivimuutos = None
+
+def sovella(teksti, alku, loppu, lisays):
+    """Applies a `rivimuutos` edit the way tk.Text does (the text without its final newline)."""
+    rivit = teksti.split("\n")
+
+    def siirto(indeksi):
+        if indeksi == "end-1c":
+            return len(teksti)
+        rivi, sarake = indeksi.split(".")
+        r = int(rivi) - 1
+        return sum(len(x) + 1 for x in rivit[:r]) + (len(rivit[r]) if sarake == "end" else int(sarake))
+
+    return teksti[:siirto(alku)] + lisays + teksti[siirto(loppu):]
+
+@unittest.skipIf(rivimuutos is None, "tkinter puuttuu")
+class TestRivimuutos(unittest.TestCase):
+
+    def tarkista(self, vanha, uusi):
+        muutos = rivimuutos(vanha, uusi)
+        self.assertEqual(sovella(vanha, *muutos), uusi)
+        return muutos
+
+    def test_ennallaan(self):
+        teksti = "PROTOKOLLA: R-CHOP\nSykli: 21 vrk\n"
+        alku, loppu, lisays = self.tarkista(teksti, teksti)
+        self.assertEqual(lisays, "")
+
+    def test_keskirivi(self):
+        self.assertEqual(self.tarkista("a\nb\nc", "a\nx\nc"), ("2.0", "3.0", "x\n"))
+
+    def test_rivit_lisatty_loppuun(self):
+        self.assertEqual(self.tarkista("a\nb", "a\nb\nc\nd"), ("2.end", "end-1c", "\nc\nd"))
+
+    def test_rivit_poistettu(self):
+        self.assertEqual(self.tarkista("a\nb\nc\nd", "a\nd"), ("2.0", "4.0", ""))
+        self.assertEqual(self.tarkista("a\nb\nc", "a"), ("1.end", "end-1c", ""))
+
+    def test_tyhja_vanha(self):
+        self.assertEqual(self.tarkista("", "a\nb"), ("1.0", "end-1c", "a\nb"))
+        self.tarkista("a\nb", "")
+
+    def test_satunnaiset(self):
+        rnd = random.Random(5)
+        for _ in range(500):
+            vanha = "\n".join(rnd.choice("abc") for _ in range(rnd.randint(0, 6)))
+            uusi = "\n".join(rnd.choice("abc") for _ in range(rnd.randint(0, 6)))
+            self.tarkista(vanha, uusi)
+
+if __name__ == '__main__':
+    unittest.main()
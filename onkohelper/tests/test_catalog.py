@@ -0,0 +1,102 @@
+import json
+import os
+import tempfile
+import unittest
+from oncology_helper.catalog import ProtokollaKatalogi
+from oncology_helper.data import Tietokanta
+from oncology_helper.models import kaanna_protokolla
+
+DATA = {
+    "KARE": {"diagnoosi": "Keuhkosyöpä", "lääkkeet": [
+        {"nimi": "Karboplatiini (IV)", "annos": 5, "yksikkö": "AUC"},
+        {"nimi": "Etoposidi (IV)", "annos": 100, "yksikkö": "mg/m2"}]},
+    "GDP (Gemsitabiini-Sisplatiini)": {"diagnoosi": "Lymfooma", "lääkkeet": [
+        {"nimi": "Gemsitabiini (IV)", "annos": 1000, "yksikkö": "mg/m2"},
+        {"nimi": "Sisplatiini (IV)", "annos": 75, "yksikkö": "mg/m2"}]},
+    "Karboplatiini 100_%": {"lääkkeet": [{"nimi": "Karboplatiini", "annos": 400, "yksikkö": "mg"}]},
+}
+
+def kaanna(data):
+    return {nimi: kaanna_protokolla(nimi, d) for nimi, d in data.items()}
+
+class TestProtokollaKatalogi(unittest.TestCase):
+
+    def setUp(self):
+        self.k = ProtokollaKatalogi()
+        self.k.tuo(kaanna(DATA), "abc")
+
+    def test_haku(self):
+        self.assertEqual(self.k.tiiviste, "abc")
+        self.assertEqual(self.k.hae("gemsi"), ["GDP (Gemsitabiini-Sisplatiini)"])
+        self.assertEqual(self.k.hae("karbo auc"), ["KARE"])
+        self.assertEqual(self.k.hae("keuhko"), ["KARE"])
+        self.assertEqual(set(self.k.hae("Karbo")), {"KARE", "Karboplatiini 100_%"})
+        self.assertEqual(self.k.hae('"'), [])
+        self.assertEqual(self.k.hae("olematon"), [])
+
+    def test_laake_ja_yksikko(self):
+        self.assertEqual(self.k.protokollat_laakkeella("karboplatiini", "AUC"), ["KARE"])
+        self.assertEqual(self.k.protokollat_laakkeella("KARBOPLATIINI"), ["KARE", "Karboplatiini 100_%"])
+        self.assertEqual(self.k.protokollat_laakkeella("%"), [])
+        self.assertEqual(self.k.protokollat_diagnoosilla("lymfooma"), ["GDP (Gemsitabiini-Sisplatiini)"])
+
+    def test_tuonti_korvaa(self):
+        self.k.tuo(kaanna({"KARE": DATA["KARE"]}), "def")
+        self.assertEqual(self.k.hae("gemsi"), [])
+        self.assertEqual(self.k.protokollat_laakkeella("karbo"), ["KARE"])
+
+class TestTietokantaKatalogi(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.polku = os.path.join(self.tmp.name, "med_data.json")
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump(DATA, f, ensure_ascii=False)
+        self.vanha = {k: getattr(Tietokanta, k) for k in ("nykyinen", "data", "versio", "polku", "_tila",
+                                                          "_virhetila", "_tarkistettu")}
+        Tietokanta.polku = self.polku
+        Tietokanta._tila = Tietokanta._virhetila = None
+        Tietokanta._tarkistettu = 0.0
+
+    def tearDown(self):
+        for k, v in self.vanha.items():
+            setattr(Tietokanta, k, v)
+        Tietokanta._katalogi = None
+        Tietokanta._vanha_katalogi = (-1, None)
+        self.tmp.cleanup()
+
+    def test_katalogi_tiedosto(self):
+        Tietokanta.paivita()
+        self.assertEqual(Tietokanta.hae("karbo auc"), ["KARE"])
+        self.assertTrue(os.path.exists(self.polku + ".sqlite"))
+        self.assertIs(Tietokanta.katalogi(), Tietokanta.katalogi())
+
+        # A new process reuses the file while the hash matches
+        self.assertEqual(ProtokollaKatalogi(self.polku + ".sqlite").tiiviste, Tietokanta.data.tiiviste)
+
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump({"ABVD": {"lääkkeet": [{"nimi": "Dakarbatsiini"}]}}, f)
+        os.utime(self.polku, (1000, 1000))
+        self.assertTrue(Tietokanta.paivita())
+        self.assertEqual(Tietokanta.hae("karbo"), [])
+        self.assertEqual(Tietokanta.hae("dakar"), ["ABVD"])
+
+    def test_vanha_versio(self):
+        Tietokanta.paivita()
+        vanha = Tietokanta.nykyinen
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump({"ABVD": {"lääkkeet": [{"nimi": "Dakarbatsiini"}]}}, f)
+        os.utime(self.polku, (1000, 1000))
+        self.assertTrue(Tietokanta.paivita())
+        self.assertEqual(Tietokanta.hae("dakar"), ["ABVD"])
+        uusi = Tietokanta.katalogi()
+
+        # A session still holding the old version searches it in memory; the
+        # file and the current catalogue stay with the new version
+        self.assertEqual(Tietokanta.hae("karbo auc", kanta=vanha), ["KARE"])
+        self.assertIs(Tietokanta.katalogi(vanha), Tietokanta.katalogi(vanha))
+        self.assertIs(Tietokanta.katalogi(), uusi)
+        self.assertEqual(ProtokollaKatalogi(self.polku + ".sqlite").tiiviste, Tietokanta.data.tiiviste)
+
+if __name__ == '__main__':
+    unittest.main()
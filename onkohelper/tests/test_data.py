@@ -0,0 +1,157 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import io
+from contextlib import redirect_stdout
+from oncology_helper.data import ProtokollaVarasto, Tietokanta, Tietokantaversio, _indeksoi
+from oncology_helper.models import kaanna_protokolla
+
+DATA = {
+    "A \"lainaus\" }": {"sykli": "21 vrk", "lääkkeet": [{"nimi": "X", "annos": 1, "päivät": "D1 [x]"}]},
+    "Bendamustiini": {"sykli": "28 vrk", "kontrollit": "PVK {}", "lääkkeet": []},
+}
+
+def kaanna(data):
+    return {nimi: kaanna_protokolla(nimi, d) for nimi, d in data.items()}
+
+class TestProtokollaVarasto(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.polku = os.path.join(self.tmp.name, "med_data.json")
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump(DATA, f, ensure_ascii=False, indent=4)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_indeksi_ja_laiska_lataus(self):
+        v = ProtokollaVarasto.avaa(self.polku)
+        self.assertEqual(list(v), list(DATA))
+        self.assertIn("Bendamustiini", v)
+        self.assertEqual(v._cache, {})
+        self.assertEqual(v["Bendamustiini"], kaanna_protokolla("Bendamustiini", DATA["Bendamustiini"]))
+        self.assertEqual(list(v._cache), ["Bendamustiini"])
+        self.assertEqual(dict(v.items()), kaanna(DATA))
+        with self.assertRaises(KeyError):
+            v["Puuttuu"]
+
+    def test_sivuindeksi(self):
+        ProtokollaVarasto.avaa(self.polku)
+        self.assertTrue(os.path.exists(self.polku + ".idx"))
+        v = ProtokollaVarasto.avaa(self.polku)
+        self.assertEqual(v["A \"lainaus\" }"].laakkeet[0].paivat, "D1 [x]")
+
+        # A changed file must not be read through the stale index
+        muutettu = {"Uusi": {"lääkkeet": []}, **DATA}
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump(muutettu, f, ensure_ascii=False)
+        v = ProtokollaVarasto.avaa(self.polku)
+        self.assertEqual(dict(v.items()), kaanna(muutettu))
+
+    def test_skalaariarvot_hylataan(self):
+        with self.assertRaises(ValueError):
+            _indeksoi(b'{"a": 1}')
+
+class TestTietokantaPaivitys(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.polku = os.path.join(self.tmp.name, "med_data.json")
+        self.kirjoita(DATA)
+        self.vanha = {k: getattr(Tietokanta, k) for k in ("nykyinen", "data", "versio", "polku", "_tila",
+                                                          "_virhetila", "_tarkistettu")}
+        Tietokanta.polku = self.polku
+        Tietokanta._tila = Tietokanta._virhetila = None
+        Tietokanta._tarkistettu = 0.0
+
+    def tearDown(self):
+        for k, v in self.vanha.items():
+            setattr(Tietokanta, k, v)
+        self.tmp.cleanup()
+
+    def kirjoita(self, data, mtime=None):
+        with open(self.polku, "w", encoding="utf-8") as f:
+            f.write(data if isinstance(data, str) else json.dumps(data, ensure_ascii=False))
+        if mtime is not None:
+            os.utime(self.polku, (mtime, mtime))
+
+    def test_paivita(self):
+        self.assertTrue(Tietokanta.paivita())
+        versio = Tietokanta.versio
+        snapshot = Tietokanta.data
+        self.assertEqual(dict(snapshot.items()), kaanna(DATA))
+        self.assertFalse(Tietokanta.paivita())
+
+        # Same content, new mtime: hashed but not reloaded
+        self.kirjoita(DATA, mtime=1000)
+        self.assertFalse(Tietokanta.paivita())
+        self.assertIs(Tietokanta.data, snapshot)
+
+        uusi = {"Uusi": {"lääkkeet": []}}
+        self.kirjoita(uusi, mtime=2000)
+        self.assertTrue(Tietokanta.paivita())
+        self.assertEqual(Tietokanta.versio, versio + 1)
+        self.assertEqual(dict(Tietokanta.data.items()), kaanna(uusi))
+        # The old snapshot stays readable and unchanged
+        self.assertEqual(snapshot["Bendamustiini"].kontrollit, "PVK {}")
+
+        # Half-written file keeps the current data
+        self.kirjoita('{"Uusi": {"lääkk', mtime=3000)
+        with redirect_stdout(io.StringIO()):
+            self.assertFalse(Tietokanta.paivita())
+        self.assertEqual(dict(Tietokanta.data.items()), kaanna(uusi))
+
+    def test_versio_muuttumaton(self):
+        Tietokanta.paivita()
+        kanta = Tietokanta.nykyinen
+        self.assertIsInstance(kanta, Tietokantaversio)
+        self.assertIs(kanta.protokollat, Tietokanta.data)
+        self.assertEqual((kanta.versio, kanta.polku), (Tietokanta.versio, self.polku))
+        self.assertEqual(kanta.tiiviste, Tietokanta.data.tiiviste)
+        with self.assertRaises(AttributeError):
+            kanta.protokollat = {}
+        with self.assertRaises(TypeError):
+            kanta.protokollat["Uusi"] = None
+        with self.assertRaises(AttributeError):
+            kanta.protokollat["Bendamustiini"].laakkeet.append(None)
+
+        # Installed plain dicts are frozen too
+        Tietokanta._asenna(kaanna(DATA), None)
+        with self.assertRaises(TypeError):
+            Tietokanta.nykyinen.protokollat["Uusi"] = None
+        self.assertEqual(Tietokanta.nykyinen.versio, kanta.versio + 1)
+
+    def test_rinnakkaiset_lukijat(self):
+        Tietokanta.paivita()
+        virheet = []
+        valmis = threading.Event()
+
+        def lue():
+            while not valmis.is_set():
+                kanta = Tietokanta.nykyinen
+                # Every version is complete, and compiles a protocol once for all threads
+                if len(list(kanta.protokollat)) != len(kanta.protokollat):
+                    virheet.append(kanta.versio)
+                for nimi in kanta.protokollat:
+                    if kanta.protokollat[nimi] is not kanta.protokollat[nimi]:
+                        virheet.append(nimi)
+
+        lukijat = [threading.Thread(target=lue) for _ in range(4)]
+        for t in lukijat:
+            t.start()
+        try:
+            for i in range(20):
+                self.kirjoita({f"P{j}": {"lääkkeet": []} for j in range(i + 1)}, mtime=1000 + i)
+                self.assertTrue(Tietokanta.paivita())
+        finally:
+            valmis.set()
+            for t in lukijat:
+                t.join()
+        self.assertEqual(virheet, [])
+        self.assertEqual(len(Tietokanta.nykyinen.protokollat), 20)
+
+if __name__ == '__main__':
+    unittest.main()
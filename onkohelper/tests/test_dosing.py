@@ -0,0 +1,74 @@
+import unittest
+import numpy as np
+from oncology_helper.logic import laske_bsa, laske_cockcroft_gault, laske_annos_mg, laske_maarays
+from oncology_helper.models import kaanna_protokolla
+from oncology_helper.dosing import laske_bsa_sarja, laske_gfr_sarja, laske_mg_sarja, laske_maarays_sarja, laske_kohortti
+from oncology_helper.dosing import laske_maaraykset_sarja, laske_yhdistelmat_sarja
+
+PROTOKOLLA = kaanna_protokolla("Testi", {
+    "sykli": "21 vrk",
+    "lääkkeet": [
+        {"nimi": "Paklitakseli", "annos": 175, "yksikkö": "mg/m2", "päivät": "D1"},
+        {"nimi": "Pembrolitsumabi", "annos": 2, "yksikkö": "mg/kg", "päivät": "D1"},
+        {"nimi": "Karboplatiini", "annos": 5, "yksikkö": "AUC", "päivät": "D1"},
+        {"nimi": "Prednisoloni (PO)", "annos": 100, "yksikkö": "mg (kiinteä)", "tablettikoot": ["40 mg", "20 mg"], "päivät": "D1-5"},
+    ]
+})
+
+class TestDosing(unittest.TestCase):
+
+    def setUp(self):
+        self.pituus = np.array([180, 165, 0, 172.5])
+        self.paino = np.array([80, 62.5, 70, 90])
+        self.ika = np.array([50, 71, 40, 30])
+        self.krea = np.array([100, 85, 70, 0])
+        self.sukupuoli = np.array(["Mies", "Nainen", "Nainen", "Mies"])
+
+    def test_sarjat_vastaavat_skalaarikaavoja(self):
+        bsa = laske_bsa_sarja(self.pituus, self.paino)
+        gfr = laske_gfr_sarja(self.ika, self.paino, self.krea, self.sukupuoli)
+        for i in range(len(self.pituus)):
+            self.assertAlmostEqual(bsa[i], laske_bsa(self.pituus[i], self.paino[i]))
+            self.assertAlmostEqual(gfr[i], laske_cockcroft_gault(self.ika[i], self.paino[i], self.krea[i], self.sukupuoli[i]))
+
+    def test_mg_yksikot(self):
+        mg = laske_mg_sarja([175, 2, 5, 100], ["mg/m2", "mg/kg", "AUC", "mg (kiinteä)"], 2.0, 80, 150)
+        np.testing.assert_allclose(mg, [350, 160, 5 * (125 + 25), 100])
+
+    def test_maarays_pyoristys(self):
+        mg = np.array([89.9, 70, 100.5, 55.5])
+        for i, v in enumerate(laske_maarays_sarja(mg, "50 mg")):
+            self.assertEqual(v, laske_maarays(mg[i], "50 mg"))
+        for i, v in enumerate(laske_maarays_sarja(mg)):
+            self.assertEqual(v, laske_maarays(mg[i]))
+        vahvuudet = [50, np.nan, 0, 20]
+        odotettu = [laske_maarays(x, None if np.isnan(v) else v) for x, v in zip(mg, vahvuudet)]
+        self.assertEqual(list(laske_maarays_sarja(mg, vahvuudet)), odotettu)
+
+    def test_laske_yhdistelmat_sarja(self):
+        mg = np.concatenate([np.linspace(-10, 3000, 2000), [0, 7, 90, 100, 1e9]])
+        for vahvuudet in ((40.0, 20.0), (5.0, 3.0), (500.0, 150.0), (10.0, 5.0, 0.25)):
+            odotettu = [laske_maarays(x, vahvuudet) for x in mg]
+            self.assertEqual(list(laske_yhdistelmat_sarja(mg, vahvuudet)), odotettu)
+
+    def test_laske_maaraykset_sarja(self):
+        mg = np.array([750.0, 101.3, 89.9, 57.0, 3.3, 0.0, 12.6])
+        vahvuudet = [(), (40.0, 20.0, 5.0), (50.0,), (40.0, 20.0, 5.0), (0.0, 0.0), (40.0, 20.0), (5.0, 2.5)]
+        odotettu = [laske_maarays(x, v) for x, v in zip(mg, vahvuudet)]
+        self.assertEqual(laske_maaraykset_sarja(mg, vahvuudet).tolist(), odotettu)
+        self.assertEqual(laske_maaraykset_sarja([], []).tolist(), [])
+
+    def test_laske_kohortti(self):
+        res = laske_kohortti(self.pituus, self.paino, self.ika, self.krea, self.sukupuoli, PROTOKOLLA)
+        self.assertEqual([l["nimi"] for l in res["lääkkeet"]], [m.nimi for m in PROTOKOLLA.laakkeet])
+        for i in range(len(self.pituus)):
+            for med, l in zip(PROTOKOLLA.laakkeet, res["lääkkeet"]):
+                mg = laske_annos_mg(med.annos, med.yksikko, res["bsa"][i], self.paino[i], res["gfr"][i])
+                self.assertAlmostEqual(l["mg"][i], mg)
+                self.assertEqual(l["määräys"][i], laske_maarays(mg, med.vahvuudet_valinnalle(l["vahvuus"])))
+        # Prednisolone combines its 40 mg and 20 mg tablets
+        self.assertEqual(res["lääkkeet"][3]["vahvuus"], "Kaikki")
+        self.assertEqual(res["lääkkeet"][3]["määräys"][0], 100)
+
+if __name__ == '__main__':
+    unittest.main()
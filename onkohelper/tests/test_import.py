@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+# Import-time budget for the headless core, measured in a fresh interpreter.
+# Typically ~10 ms; the margin absorbs slow CI machines and cold caches.
+TUONTIBUDJETTI_S = 0.15
+
+RASKAAT = ("tkinter", "numpy", "pandas", "streamlit", "sqlite3")
+
+PAKETTI = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def tuo(lause):
+    """Runs `lause` in a new interpreter; returns (seconds, heavy modules loaded)."""
+    koodi = (
+        "import json, sys, time\n"
+        "t = time.perf_counter()\n"
+        f"{lause}\n"
+        "t = time.perf_counter() - t\n"
+        f"print(json.dumps([t, sorted({{m.split('.')[0] for m in sys.modules}} & set({RASKAAT!r}))]))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", koodi], cwd=PAKETTI, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.splitlines()[-1])
+
+class TestTuonti(unittest.TestCase):
+
+    def test_ydin_ilman_raskaita_moduuleja(self):
+        # Warm the bytecode cache so the measurement is import time, not compilation
+        tuo("import oncology_helper.batch")
+        kesto, raskaat = min((tuo("import oncology_helper.batch") for _ in range(3)), key=lambda r: r[0])
+        self.assertEqual(raskaat, [])
+        self.assertLess(kesto, TUONTIBUDJETTI_S)
+
+    def test_laiskat_nimet(self):
+        kesto, raskaat = tuo("import oncology_helper")
+        self.assertEqual(raskaat, [])
+        kesto, raskaat = tuo("import oncology_helper as o; assert o.laske_bsa(180, 80) == 2.0; o.Tietokanta")
+        self.assertEqual(raskaat, [])
+
+        import oncology_helper
+        from oncology_helper.report import muodosta_raportti
+        self.assertIs(oncology_helper.muodosta_raportti, muodosta_raportti)
+        self.assertIn("Tietokanta", dir(oncology_helper))
+        with self.assertRaises(AttributeError):
+            oncology_helper.olematon
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
 import unittest
-from oncology_helper.logic import laske_bsa, laske_cockcroft_gault, pyorista_tabletit, laske_stage_rintasyopa, suosittele_hoito_rintasyopa, maarita_hoitosuunnitelma_rintasyopa
+from oncology_helper.logic import laske_bsa, laske_cockcroft_gault, pyorista_tabletit, ratkaise_tabletit, laske_maarays, laske_stage_rintasyopa, suosittele_hoito_rintasyopa, maarita_hoitosuunnitelma_rintasyopa
+from oncology_helper.logic import esilaske_hoitosuunnitelmat, hoitosuunnitelma_valimuisti_tilastot, tyhjenna_hoitosuunnitelma_valimuisti, _muodosta_hoitosuunnitelma
+from oncology_helper.logic import laske_stage_rintasyopa_indeksi, laske_stage_rintasyopa_sarja, RINTA_T_KOODIT, RINTA_N_KOODIT, RINTA_M_KOODIT
+from oncology_helper.staging import STAGE_TAULUT
 
 class TestLogic(unittest.TestCase):
     
@@ -34,6 +37,27 @@ class TestLogic(unittest.TestCase):
         # Zero strength
         self.assertEqual(pyorista_tabletit(55.5, 0), 55)
 
+    def test_ratkaise_tabletit(self):
+        self.assertEqual(ratkaise_tabletit(100, [40, 20]).tabletit, ((40.0, 2), (20.0, 1)))
+        # 7 mg cannot be made; 6 and 8 are as close and take as many tablets, so the larger wins
+        self.assertEqual(ratkaise_tabletit(7, [5, 3]).tabletit, ((5.0, 1), (3.0, 1)))
+        self.assertEqual(ratkaise_tabletit(6.9, [5, 3]).tabletit, ((3.0, 2),))
+        # Fewest tablets: 1500 = 3 x 500, not 10 x 150
+        self.assertEqual(ratkaise_tabletit(1500, [500, 150]).kpl, 3)
+        self.assertEqual(ratkaise_tabletit(450, [500, 150]).tabletit, ((150.0, 3),))
+        self.assertEqual(ratkaise_tabletit(0, [40, 20]).tabletit, ())
+        self.assertEqual(ratkaise_tabletit(12.4, [5, 2.5]).mg, 12.5)
+        # A single strength rounds like pyorista_tabletit, half-way cases included
+        for mg in (25, 75, 90, 70, 124.9, 125):
+            self.assertEqual(int(ratkaise_tabletit(mg, [50]).mg), pyorista_tabletit(mg, 50))
+        with self.assertRaises(ValueError):
+            ratkaise_tabletit(10, [0])
+
+    def test_laske_maarays_vahvuudet(self):
+        self.assertEqual(laske_maarays(100, (40.0, 20.0)), 100)
+        self.assertEqual(laske_maarays(100, (40.0,)), 80)
+        self.assertEqual(laske_maarays(99.6, ()), 100)
+
     def test_laske_stage_rintasyopa(self):
         # Stage IV
         self.assertEqual(laske_stage_rintasyopa("T1", "N0", "M1"), "Stage IV")
@@ -52,6 +76,21 @@ class TestLogic(unittest.TestCase):
         # Unknown
         self.assertEqual(laske_stage_rintasyopa("Tx", "N0", "M0"), "Ei määritettävissä")
 
+    def test_stage_taulu_vastaa_saantoja(self):
+        for ti, t in enumerate(RINTA_T_KOODIT):
+            for ni, n in enumerate(RINTA_N_KOODIT):
+                for mi, m in enumerate(RINTA_M_KOODIT):
+                    odotettu = STAGE_TAULUT["Rintasyöpä"].sovella(t, n, m)
+                    self.assertEqual(laske_stage_rintasyopa(t, n, m), odotettu)
+                    self.assertEqual(laske_stage_rintasyopa_indeksi(ti, ni, mi), odotettu)
+
+    def test_laske_stage_rintasyopa_sarja(self):
+        res = laske_stage_rintasyopa_sarja(
+            ["T1c", "T2: >20-50 mm", "T1", "Tis"],
+            ["N0", "N1: 1-3 kainaloimusolmuketta", "N1mi", "N0"],
+            ["M0", "M0", "M0", "M1"])
+        self.assertEqual(res, ["Stage IA", "Stage IIB", "Stage IB", "Stage IV"])
+
     def test_suosittele_hoito_rintasyopa(self):
         # Palliatiivinen
         self.assertIn("Palliatiivinen", suosittele_hoito_rintasyopa("Stage IV", "T1", "N0", "M1"))
@@ -92,5 +131,20 @@ class TestLogic(unittest.TestCase):
         self.assertIn("Luminal A", res)
         self.assertIn("hormonihoito", res.lower())
 
+    def test_hoitosuunnitelma_valimuisti(self):
+        tyhjenna_hoitosuunnitelma_valimuisti()
+        args = ("Stage IIB", "T2", "N1", "M0", "Negatiivinen", "Negatiivinen", "Korkea")
+        eka = maarita_hoitosuunnitelma_rintasyopa(*args)
+        toka = maarita_hoitosuunnitelma_rintasyopa(*args[:-1], "Korkea (>=20%)", "-")
+        self.assertIs(eka, toka)
+        tilastot = hoitosuunnitelma_valimuisti_tilastot()
+        self.assertEqual((tilastot["osumat"], tilastot["ohitukset"]), (1, 1))
+
+        self.assertEqual(esilaske_hoitosuunnitelmat(), 13 * 9 * 2 * 2 * 2 * 2 * 3)
+        res = maarita_hoitosuunnitelma_rintasyopa("Stage IA", "T1c", "N0", "M0", "Positiivinen", "Negatiivinen", "Matala (<20%)", "Adjuvantti")
+        self.assertEqual(res, _muodosta_hoitosuunnitelma("Stage IA", "T1c", "N0", "M0", "Positiivinen", "Negatiivinen", "Matala (<20%)", "Adjuvantti"))
+        self.assertEqual(hoitosuunnitelma_valimuisti_tilastot()["taulu_osumat"], 1)
+        tyhjenna_hoitosuunnitelma_valimuisti()
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,71 @@
+import unittest
+from oncology_helper.logic import laske_maarays
+from oncology_helper.models import (KAIKKI_VAHVUUDET, Yksikko, jasenna_paivat, jasenna_sykli, kaanna_laake,
+                                    kaanna_protokolla, vahvuus_mg)
+
+class TestModels(unittest.TestCase):
+
+    def test_jasenna_paivat(self):
+        self.assertEqual(jasenna_paivat("D1"), ((1, 1),))
+        self.assertEqual(jasenna_paivat("D1-14"), ((1, 14),))
+        self.assertEqual(jasenna_paivat("D1, D2"), ((1, 1), (2, 2)))
+        self.assertEqual(jasenna_paivat("D1+D5+D15"), ((1, 1), (5, 5), (15, 15)))
+        self.assertEqual(jasenna_paivat("D1 (46h infuusio)"), ((1, 1),))
+        self.assertEqual(jasenna_paivat("Jatkuva"), ())
+        self.assertEqual(jasenna_paivat(None), ())
+
+    def test_jasenna_sykli(self):
+        self.assertEqual(jasenna_sykli("21 vuorokautta"), 21)
+        self.assertEqual(jasenna_sykli("21 vrk (14 vrk lääkettä, 7 vrk tauko)"), 21)
+        self.assertEqual(jasenna_sykli("Viikoittainen"), 7)
+        self.assertEqual(jasenna_sykli("3 viikkoa"), 21)
+        self.assertIsNone(jasenna_sykli("Jatkuva hoito"))
+        self.assertIsNone(jasenna_sykli(None))
+
+    def test_yksikko(self):
+        self.assertEqual(Yksikko.tunnista("AUC"), "AUC")
+        self.assertIs(Yksikko.tunnista(None), Yksikko.MG_M2)
+        self.assertIs(Yksikko.tunnista("mg (kiinteä)"), Yksikko.KIINTEA)
+        self.assertIs(Yksikko.tunnista("tuntematon"), Yksikko.MG)
+        self.assertEqual(f"{Yksikko.MG_KG}", "mg/kg")
+
+    def test_kaanna_protokolla(self):
+        p = kaanna_protokolla("R-CHOP", {
+            "sykli": "21 vrk",
+            "lääkkeet": [
+                {"nimi": "Vinkristiini", "annos": 1.4, "yksikkö": "mg/m2", "max_mg": 2, "päivät": "D1"},
+                {"nimi": "Prednisoloni", "annos": 100, "yksikkö": "mg (kiinteä)", "tablettikoot": ["40 mg", "2,5 mg"], "päivät": "D1-5"},
+            ]
+        })
+        self.assertEqual(p.kontrollit, "")
+        self.assertEqual(p.sykli_vrk, 21)
+        self.assertEqual(p.esilaakitys, "-")
+        vink, pred = p.laakkeet
+        self.assertEqual(vink.max_mg, 2.0)
+        self.assertEqual(vink.tablettikoot, ())
+        self.assertEqual(pred.vahvuudet, (40.0, 2.5))
+        self.assertEqual(pred.paivat_jaksot, ((1, 5),))
+        self.assertEqual(pred.vahvuus("2,5 mg"), 2.5)
+        self.assertEqual(pred.vahvuus("10 mg"), 10.0)
+        self.assertIsNone(pred.vahvuus("None"))
+        with self.assertRaises(AttributeError):
+            pred.annos = 50
+        self.assertFalse(hasattr(pred, "__dict__"))
+
+    def test_jasentymattomat_vahvuudet(self):
+        med = kaanna_laake({"nimi": "Kapesitabiini", "annos": 1000, "yksikkö": "mg/m2",
+                            "tablettikoot": ["500 mg", "x", "0 mg", "150 mg"]})
+        self.assertEqual(med.tablettikoot, ("500 mg", "150 mg"))
+        self.assertEqual(med.vahvuudet, (500.0, 150.0))
+        self.assertIsNone(med.vahvuus("x"))
+        self.assertEqual(med.vahvuudet_valinnalle("x"), ())
+        self.assertEqual(laske_maarays(1790, med.vahvuudet_valinnalle(KAIKKI_VAHVUUDET)), 1800)
+
+    def test_vahvuus_mg(self):
+        self.assertEqual(vahvuus_mg("40 mg"), 40.0)
+        self.assertEqual(vahvuus_mg(20), 20.0)
+        self.assertIsNone(vahvuus_mg("None"))
+        self.assertIsNone(vahvuus_mg("x mg"))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import unittest
+from oncology_helper.batch import kasittele
+from oncology_helper.data import Tietokanta
+from oncology_helper.parallel import kasittele_rinnakkain
+
+DATA = {
+    "R-CHOP": {"sykli": "21 vrk", "lääkkeet": [
+        {"nimi": "Rituksimabi", "annos": 375, "yksikkö": "mg/m2", "päivät": "D1"},
+        {"nimi": "Prednisoloni", "annos": 100, "yksikkö": "mg", "tablettikoot": ["40 mg", "20 mg"]}]},
+    "KARE": {"lääkkeet": [{"nimi": "Karboplatiini", "annos": 5, "yksikkö": "AUC"}]},
+}
+
+def syote(n):
+    rivit = ["id;pituus;paino;ika;krea;sukupuoli;protokolla"]
+    for i in range(n):
+        protokolla = "Tuntematon" if i % 7 == 3 else ("R-CHOP", "KARE")[i % 2]
+        rivit.append(f"{i};{150 + i % 50};{50 + i % 40},5;{30 + i % 50};{60 + i % 90};{('Mies', 'Nainen')[i % 3 == 0]};{protokolla}")
+    return "\n".join(rivit) + "\n"
+
+class TestRinnakkain(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.polku = os.path.join(self.tmp.name, "med_data.json")
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump(DATA, f, ensure_ascii=False)
+        self.vanha = {k: getattr(Tietokanta, k) for k in ("nykyinen", "data", "versio", "polku", "_tila",
+                                                          "_virhetila", "_tarkistettu")}
+        Tietokanta.lataa(self.polku)
+
+    def tearDown(self):
+        for k, v in self.vanha.items():
+            setattr(Tietokanta, k, v)
+        self.tmp.cleanup()
+
+    def aja(self, muoto, **kw):
+        sarja, rinn = io.StringIO(), io.StringIO()
+        v1, v2 = io.StringIO(), io.StringIO()
+        odotettu = kasittele(io.StringIO(syote(103)), sarja, Tietokanta.data, "csv", muoto, virheet=v1)
+        tulos = kasittele_rinnakkain(io.StringIO(syote(103)), rinn, self.polku, "csv", muoto, virheet=v2,
+                                     tyoprosessit=2, palakoko=10, **kw)
+        self.assertEqual(tulos, odotettu)
+        self.assertEqual(rinn.getvalue(), sarja.getvalue())
+        self.assertEqual(v2.getvalue(), v1.getvalue())
+        return odotettu
+
+    def test_sama_tulos_kuin_sarjassa(self):
+        self.assertEqual(self.aja("teksti"), (88, 15))
+        self.aja("jsonl")
+
+    def test_spawn_lataa_tietokannan(self):
+        self.aja("jsonl", mp_context=multiprocessing.get_context("spawn"))
+
+    def test_luokitus(self):
+        sisaan = "id,t,n,m,er,her2,ki67\n1,T2,N0,M0,,,\n2,T1c: >10-20 mm,N1,M0,Positiivinen,Negatiivinen,Matala (<20%)\n3,,N0,M0,,,\n"
+        ulos = io.StringIO()
+        ok, failed = kasittele_rinnakkain(io.StringIO(sisaan), ulos, self.polku, "csv", "jsonl",
+                                          virheet=io.StringIO(), tehtava="luokitus", tyoprosessit=2, palakoko=1)
+        self.assertEqual((ok, failed), (2, 1))
+        rivit = [json.loads(l) for l in ulos.getvalue().splitlines()]
+        self.assertEqual([r.get("stage") for r in rivit], ["Stage IIA", "Stage IIA", None])
+        self.assertIsNone(rivit[0]["suunnitelma"])
+        self.assertIn("Luminal A", rivit[1]["suunnitelma"])
+        self.assertEqual(rivit[2]["rivi"], 3)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,47 @@
+import random
+import unittest
+import numpy as np
+from oncology_helper.logic import safe_float
+from oncology_helper.parsing import jasenna_luvut, jasenna_sarakkeet
+
+class TestJasennys(unittest.TestCase):
+
+    def test_jasenna_luvut(self):
+        arvot = ["80,5", " 12.25 ", "-3", "1 234,5", "−7,5", ",5", "1e3", "0",
+                 "", "abc", "1,2,3", "5-", "+-5", "nan", "inf", None]
+        x, kelvot = jasenna_luvut(np.array(arvot, dtype=object))
+        self.assertEqual(kelvot.tolist(), [True] * 8 + [False] * 8)
+        self.assertEqual(x[:8].tolist(), [80.5, 12.25, -3.0, 1234.5, -7.5, 0.5, 1000.0, 0.0])
+        self.assertTrue(np.isnan(x[8:]).all())
+
+    def test_vertailumerkit(self):
+        # Code points above the class table must not be read as minus signs
+        x, kelvot = jasenna_luvut(["≤5", "≥5", "≈5", "5≤", "−5"])
+        self.assertEqual(kelvot.tolist(), [False, False, False, False, True])
+        self.assertTrue(np.isnan(x[:4]).all())
+        self.assertEqual(x[4], -5.0)
+
+    def test_sama_kuin_float(self):
+        rnd = random.Random(1)
+        tekstit = [f"{rnd.uniform(-1e6, 1e6):.{rnd.randint(0, 6)}f}" for _ in range(5000)]
+        x, kelvot = jasenna_luvut([t.replace(".", ",") for t in tekstit])
+        self.assertTrue(kelvot.all())
+        self.assertEqual(x.tolist(), [float(t) for t in tekstit])
+        # Valid values agree with safe_float
+        self.assertEqual(x.tolist(), [safe_float(t.replace(".", ",")) for t in tekstit])
+
+    def test_numerot_ja_muoto(self):
+        x, kelvot = jasenna_luvut(np.array([[1, 2], [0, np.nan]]))
+        self.assertEqual(kelvot.tolist(), [[True, True], [True, False]])
+        x, kelvot = jasenna_luvut(["0", "5", "-1"], vain_positiiviset=True)
+        self.assertEqual(kelvot.tolist(), [False, True, False])
+        self.assertEqual(jasenna_luvut([])[0].shape, (0,))
+
+    def test_jasenna_sarakkeet(self):
+        sarakkeet, kelvot = jasenna_sarakkeet({"paino": ["80,5", "70", "x"], "krea": ["90", "0", "100"]},
+                                              positiiviset=("krea",))
+        self.assertEqual(sarakkeet["paino"][0], 80.5)
+        self.assertEqual(np.flatnonzero(~kelvot).tolist(), [1, 2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+import csv
+import io
+import os
+import tempfile
+import unittest
+from unittest import mock
+from oncology_helper import registry
+from oncology_helper.registry import porrasta_rekisteri
+
+def syote(n):
+    rivit = ["id;tauti;t;n;m;er;her2;ki67"]
+    for i in range(n):
+        tauti = ("Rintasyöpä", "", "Keuhkosyöpä (NSCLC)", "Lymfooma (Ann Arbor)")[i % 4]
+        t = "" if i % 13 == 5 else ("pT1c: >10-20 mm", "T2", "T3", "T1b")[i % 4]
+        rivit.append(f"{i};{tauti};{t};N{i % 2};M0;{('Positiivinen', '')[i % 3 == 0]};Negatiivinen;Matala (<20%)")
+    return "\n".join(rivit) + "\n"
+
+class TestRekisteri(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.syote = os.path.join(self.tmp.name, "rekisteri.csv")
+        with open(self.syote, "w", encoding="utf-8") as f:
+            f.write(syote(200))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def aja(self, nimi, **kw):
+        polku = os.path.join(self.tmp.name, nimi)
+        tulos = porrasta_rekisteri(self.syote, polku, palakoko=16, virheet=io.StringIO(), **kw)
+        with open(polku, "rb") as f:
+            return tulos, f.read()
+
+    def test_tulos(self):
+        (ok, failed), data = self.aja("sarja.csv", tyoprosessit=1)
+        rivit = list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+        self.assertEqual(len(rivit), 200)
+        self.assertEqual((ok, failed), (sum(not r["virhe"] for r in rivit), sum(bool(r["virhe"]) for r in rivit)))
+        self.assertEqual((rivit[0]["tauti"], rivit[0]["t"], rivit[0]["stage"]), ("Rintasyöpä", "T1c", "Stage IA"))
+        self.assertIn("Luminal A", rivit[4]["suunnitelma"])
+        self.assertEqual((rivit[2]["stage"], rivit[2]["suunnitelma"]), ("Stage IIB", ""))
+        self.assertEqual(rivit[3]["virhe"], "Ei levinneisyysryhmittelyä: 'Lymfooma (Ann Arbor)'")
+        self.assertEqual(rivit[5]["virhe"], "Puuttuva kenttä: t")
+        self.assertFalse(os.path.exists(os.path.join(self.tmp.name, "sarja.csv.tila")))
+
+    def test_rinnakkain_sama(self):
+        self.assertEqual(self.aja("rinn.csv", tyoprosessit=2), self.aja("sarja.csv", tyoprosessit=1))
+
+    def test_jatkaa_keskeytyneesta(self):
+        odotettu = self.aja("kokonaan.csv", tyoprosessit=1)
+        kirjoita_tila = registry._kirjoita_tila
+        kerrat = []
+
+        def kaatuu(polku, tila):
+            kerrat.append(tila["rivi"])
+            if len(kerrat) == 5:
+                raise KeyboardInterrupt
+            kirjoita_tila(polku, tila)
+
+        polku = os.path.join(self.tmp.name, "keskeytetty.csv")
+        with mock.patch.object(registry, "_kirjoita_tila", kaatuu), self.assertRaises(KeyboardInterrupt):
+            porrasta_rekisteri(self.syote, polku, palakoko=16, tyoprosessit=1, virheet=io.StringIO())
+        # A chunk written after the last checkpoint is dropped on resume
+        with open(polku, "ab") as f:
+            f.write(b"999,keskener")
+        self.assertEqual(self.aja("keskeytetty.csv", tyoprosessit=1), odotettu)
+
+    def test_muu_merkisto(self):
+        # One Latin-1 row fails alone instead of aborting the job
+        with open(self.syote, "wb") as f:
+            f.write("id;tauti;t;n;m\n1;Rintasyöpä;T1;N0;M0\n".encode("utf-8"))
+            f.write("2;Rintasyöpä;T2;N0;M0\n".encode("latin-1"))
+        (ok, failed), data = self.aja("x.csv", tyoprosessit=1)
+        rivit = list(csv.DictReader(io.StringIO(data.decode("utf-8"))))
+        self.assertEqual((ok, failed), (1, 1))
+        self.assertEqual(rivit[0]["stage"], "Stage IA")
+        self.assertEqual((rivit[1]["stage"], rivit[1]["virhe"]), ("", "Virheellinen merkistö (ei UTF-8)"))
+
+    def test_puuttuva_sarake(self):
+        with open(self.syote, "w", encoding="utf-8") as f:
+            f.write("id,t,n\n1,T1,N0\n")
+        with self.assertRaises(ValueError):
+            self.aja("x.csv", tyoprosessit=1)
+
+if __name__ == '__main__':
+    unittest.main()
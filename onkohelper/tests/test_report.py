@@ -0,0 +1,59 @@
+import json
+import unittest
+from oncology_helper.models import kaanna_protokolla
+from oncology_helper.report import kaanna_pohja, muodosta_raportti, renderoi
+
+P = kaanna_protokolla("R-CHOP <21>", {
+    "sykli": "21 vrk",
+    "esilääkitys": "Ondansetroni 8mg.\nDeksametasoni",
+    "lääkkeet": [
+        {"nimi": "Rituksimabi", "annos": 375, "yksikkö": "mg/m2", "päivät": "D1"},
+        {"nimi": "Prednisoloni", "annos": 100, "yksikkö": "mg", "tablettikoot": ["40 mg", "20 mg"]},
+    ]
+})
+
+def rivit(p=P):
+    return [{"med": p.laakkeet[0], "maarays": "750", "vahvuus": "None"},
+            {"med": p.laakkeet[1], "maarays": "80", "vahvuus": "20 mg"}]
+
+class TestRaportti(unittest.TestCase):
+
+    def test_teksti(self):
+        self.assertEqual(muodosta_raportti("R-CHOP <21>", P, "PVK", rivit()), "\n".join([
+            "PROTOKOLLA: R-CHOP <21>", "Sykli: 21 vrk", "Labrat: PVK", "-" * 40,
+            "• Rituksimabi: 750 mg", "   Ajoitus: D1",
+            "• Prednisoloni: 80 mg", "    -> 4.0 kpl (20 mg)",
+            "-" * 40, "TUKIHOIDOT:\nOndansetroni 8mg.\nDeksametasoni"]))
+        # No protocol selected: no footer
+        self.assertEqual(muodosta_raportti("", None, "", []), "PROTOKOLLA: \nLabrat: \n" + "-" * 40)
+
+    def test_pohja_kaannetaan_kerran(self):
+        self.assertIs(kaanna_pohja("R-CHOP <21>", P), kaanna_pohja("R-CHOP <21>", P))
+        kopio = kaanna_protokolla("R-CHOP <21>", {"lääkkeet": []})
+        self.assertIsNot(kaanna_pohja("R-CHOP <21>", kopio), kaanna_pohja("R-CHOP <21>", P))
+
+    def test_html_ja_json(self):
+        r = renderoi(kaanna_pohja("R-CHOP <21>", P), "PVK & Krea", rivit())
+        self.assertIn("<h3>PROTOKOLLA: R-CHOP &lt;21&gt;</h3>", r.html)
+        self.assertIn("Labrat: PVK &amp; Krea", r.html)
+        self.assertIn("<li><b>Prednisoloni</b>: 80 mg<br>-&gt; 4.0 kpl (20 mg)</li>", r.html)
+        self.assertIn("Ondansetroni 8mg.<br>Deksametasoni", r.html)
+
+        d = json.loads(r.json)
+        self.assertEqual(d["protokolla"], "R-CHOP <21>")
+        self.assertEqual([(l["nimi"], l["määräys"], l["kpl"]) for l in d["lääkkeet"]],
+                         [("Rituksimabi", "750", None), ("Prednisoloni", "80", 4.0)])
+        self.assertEqual(d["tukihoidot"], P.esilaakitys)
+
+    def test_kaikki_vahvuudet(self):
+        med = P.laakkeet[1]
+        r = renderoi(kaanna_pohja("R-CHOP", P), "", [{"med": med, "maarays": "100", "vahvuus": "Kaikki"}])
+        self.assertIn("• Prednisoloni: 100 mg\n    -> 2 x 40 mg + 1 x 20 mg", r.teksti)
+        self.assertIn("-&gt; 2 x 40 mg + 1 x 20 mg", r.html)
+        self.assertEqual(r.tiedot["lääkkeet"][0]["tabletit"], [{"vahvuus": "40 mg", "kpl": 2}, {"vahvuus": "20 mg", "kpl": 1}])
+        # A manually entered dose the tablets cannot make shows what they give
+        r = renderoi(kaanna_pohja("R-CHOP", P), "", [{"med": med, "maarays": "90", "vahvuus": "Kaikki"}])
+        self.assertIn("-> 2 x 40 mg (= 80 mg)", r.teksti)
+
+if __name__ == '__main__':
+    unittest.main()
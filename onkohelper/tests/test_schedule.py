@@ -0,0 +1,70 @@
+import random
+import unittest
+from datetime import date, timedelta
+from oncology_helper.models import kaanna_protokolla
+from oncology_helper.schedule import AikatauluIndeksi, jasenna_pvm, kaanna_aikataulu, laajenna, laajenna_hoidot
+
+RCHOP = kaanna_protokolla("R-CHOP", {"sykli": "21 vrk", "lääkkeet": [
+    {"nimi": "Rituksimabi", "annos": 375, "päivät": "D1"},
+    {"nimi": "Prednisoloni", "annos": 100, "yksikkö": "mg", "päivät": "D1-5"},
+    {"nimi": "Ondansetroni", "annos": 8, "yksikkö": "mg"}]})
+OSIMERTINIBI = kaanna_protokolla("Osimertinibi", {"sykli": "Jatkuva hoito", "lääkkeet": [
+    {"nimi": "Osimertinibi", "annos": 80, "yksikkö": "mg", "päivät": "Jatkuva"}]})
+
+class TestAikataulu(unittest.TestCase):
+
+    def test_kaanna_aikataulu(self):
+        a = kaanna_aikataulu(RCHOP)
+        self.assertEqual(a.sykli_vrk, 21)
+        # Drugs without days are left out
+        self.assertEqual(a.jaksot, (("Rituksimabi", 0, 0), ("Prednisoloni", 0, 4)))
+        self.assertEqual(kaanna_aikataulu(OSIMERTINIBI).jaksot, (("Osimertinibi", 0, 27),))
+
+    def test_laajenna(self):
+        jaksot = list(laajenna("p1", kaanna_aikataulu(RCHOP), date(2026, 1, 1), 3))
+        pred = [(j.sykli, j.alku, j.loppu) for j in jaksot if j.laake == "Prednisoloni"]
+        self.assertEqual(pred, [(1, date(2026, 1, 1), date(2026, 1, 5)), (2, date(2026, 1, 22), date(2026, 1, 26)),
+                                (3, date(2026, 2, 12), date(2026, 2, 16))])
+        # Unknown cycle length: only the first cycle can be placed
+        tuntematon = kaanna_protokolla("X", {"lääkkeet": [{"nimi": "A", "päivät": "D1, D8"}]})
+        self.assertEqual(len(list(laajenna_hoidot([("p", tuntematon, "1.1.2026", 1)]))), 2)
+        with self.assertRaises(ValueError):
+            list(laajenna_hoidot([("p", tuntematon, "1.1.2026", 4)]))
+
+    def test_valiaikaiset_protokollat(self):
+        # Protocols freed during the loop can hand their id to the next one
+        def hoidot():
+            for i in range(20):
+                yield (f"p{i}", kaanna_protokolla(f"X{i}", {"sykli": "21 vrk", "lääkkeet": [
+                    {"nimi": f"L{i}", "päivät": "D1"}]}), "2026-01-01", 1)
+        self.assertEqual([(j.potilas, j.protokolla, j.laake) for j in laajenna_hoidot(hoidot())],
+                         [(f"p{i}", f"X{i}", f"L{i}") for i in range(20)])
+
+    def test_jasenna_pvm(self):
+        self.assertEqual(jasenna_pvm("5.3.2026"), date(2026, 3, 5))
+        self.assertEqual(jasenna_pvm("2026-03-05"), date(2026, 3, 5))
+        with self.assertRaises(ValueError):
+            jasenna_pvm("31.2.2026")
+
+    def test_indeksi_vastaa_lapikaymista(self):
+        rnd = random.Random(3)
+        hoidot = [(f"p{i}", rnd.choice([RCHOP, OSIMERTINIBI]),
+                   date(2026, 1, 1) + timedelta(days=rnd.randrange(300)), rnd.randint(1, 8)) for i in range(300)]
+        jaksot = list(laajenna_hoidot(hoidot))
+        indeksi = AikatauluIndeksi(jaksot)
+        self.assertEqual(len(indeksi), len(jaksot))
+        for _ in range(50):
+            alku = date(2026, 1, 1) + timedelta(days=rnd.randrange(500))
+            loppu = alku + timedelta(days=rnd.randrange(15))
+            odotettu = {j for j in jaksot if j.laake == "Prednisoloni" and j.alku <= loppu and j.loppu >= alku}
+            self.assertEqual(set(indeksi.hae(alku, loppu, "predni")), odotettu)
+            self.assertEqual(len(indeksi.hae(alku, loppu)), sum(1 for j in jaksot if j.alku <= loppu and j.loppu >= alku))
+
+    def test_antokerrat(self):
+        indeksi = AikatauluIndeksi(laajenna_hoidot([("p1", RCHOP, "2026-01-01", 2), ("p2", RCHOP, "2026-01-04", 1)]))
+        kerrat = indeksi.antokerrat("2026-01-04", "2026-01-06", "Prednisoloni")
+        self.assertEqual([(d.day, j.potilas) for d, j in kerrat], [(4, "p1"), (4, "p2"), (5, "p1"), (5, "p2"), (6, "p2")])
+        self.assertEqual(indeksi.laakkeet(), ["Prednisoloni", "Rituksimabi"])
+
+if __name__ == '__main__':
+    unittest.main()
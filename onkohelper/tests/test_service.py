@@ -0,0 +1,149 @@
+import asyncio
+import http.client
+import json
+import time
+import unittest
+from oncology_helper.data import Tietokanta
+from oncology_helper.models import kaanna_protokolla
+from oncology_helper.service import AnnostusPalvelu, Viivehistogrammi, Virhe
+
+PROTOKOLLAT = {
+    "R-CHOP": kaanna_protokolla("R-CHOP", {
+        "sykli": "21 vrk",
+        "lääkkeet": [{"nimi": "Rituksimabi", "annos": 375, "yksikkö": "mg/m2", "päivät": "D1"}],
+    })
+}
+
+POTILAS = {"pituus": 180, "paino": 80, "ika": 50, "krea": 100, "sukupuoli": "Mies"}
+
+class TestPalvelu(unittest.TestCase):
+
+    def setUp(self):
+        self.vanha = {k: getattr(Tietokanta, k) for k in ("nykyinen", "data", "versio", "_tila")}
+        Tietokanta._asenna(PROTOKOLLAT, None)
+        self.p = AnnostusPalvelu()
+
+    def tearDown(self):
+        for k, v in self.vanha.items():
+            setattr(Tietokanta, k, v)
+
+    def post(self, polku, runko):
+        return self.p.kasittele("POST", polku, json.dumps(runko).encode())
+
+    def test_toiminnot(self):
+        tila, v = self.post("/v1/potilas", POTILAS)
+        self.assertEqual(tila, 200)
+        self.assertAlmostEqual(v["bsa"], 2.0)
+
+        tila, v = self.post("/v1/annokset", dict(POTILAS, protokolla="R-CHOP"))
+        self.assertEqual(v["lääkkeet"][0]["määräys"], 750)
+        self.assertIn("Rituksimabi: 750 mg", v["raportti"])
+
+        self.assertEqual(self.post("/v1/luokitus", {"t": "T2: >20-50 mm", "n": "N0", "m": "M0"})[1],
+                         {"stage": "Stage IIA"})
+        self.assertEqual(self.post("/v1/luokitus", {"tauti": "Keuhkosyöpä (NSCLC)", "t": "T1c", "n": "N0", "m": "M0"})[1],
+                         {"stage": "Stage IA3"})
+        tila, v = self.post("/v1/hoitosuunnitelma", {"t": "T2", "n": "N1", "m": "M0", "er": "Negatiivinen",
+                                                      "her2": "Negatiivinen", "ki67": "Korkea (>=20%)"})
+        self.assertIn("Kolmoisnegatiivinen", v["suunnitelma"])
+
+    def test_era(self):
+        tila, v = self.post("/v1/annokset/era", {"pyynnot": [
+            dict(POTILAS, protokolla="R-CHOP"), dict(POTILAS, protokolla="Tuntematon"), []]})
+        self.assertEqual(tila, 200)
+        self.assertEqual(v["tulokset"][0]["tulos"]["lääkkeet"][0]["määräys"], 750)
+        self.assertIn("Tuntematon", v["tulokset"][1]["virhe"])
+        self.assertIn("virhe", v["tulokset"][2])
+
+    def test_virheet(self):
+        for pyynto, tila in [(("POST", "/v1/olematon", b"{}"), 404), (("GET", "/v1/potilas", b""), 405),
+                             (("POST", "/v1/potilas", b"{"), 400), (("POST", "/v1/luokitus", b'{"t": "T1"}'), 400),
+                             (("POST", "/v1/potilas/era", b'{"pyynnot": 1}'), 400)]:
+            with self.assertRaises(Virhe) as cm:
+                self.p.kasittele(*pyynto)
+            self.assertEqual(cm.exception.tila, tila)
+
+    def test_virheelliset_potilasarvot(self):
+        for polku in ("/v1/potilas", "/v1/annokset"):
+            for potilas, viesti in [(dict(POTILAS, krea="abc"), "Virheellinen arvo: krea='abc'"),
+                                    ({k: v for k, v in POTILAS.items() if k != "paino"}, "Puuttuva kenttä: paino")]:
+                with self.assertRaises(Virhe) as cm:
+                    self.p.kasittele("POST", polku, json.dumps(dict(potilas, protokolla="R-CHOP")).encode())
+                self.assertEqual(cm.exception.tila, 400)
+                self.assertEqual(str(cm.exception), viesti)
+        tila, runko = self.p._vastaa("POST", "/v1/potilas", json.dumps(dict(POTILAS, paino="")).encode())
+        self.assertEqual((tila, json.loads(runko)), (400, {"virhe": "Puuttuva kenttä: paino"}))
+
+    def test_histogrammi(self):
+        h = Viivehistogrammi((1, 10))
+        self.assertIsNone(h.kvantiili(0.5))
+        for s in (0.0005, 0.0005, 0.005, 0.5):
+            h.lisaa(s)
+        self.assertEqual(h.lukumaarat, [2, 1, 1])
+        self.assertEqual(h.kvantiili(0.5), 1)
+        # Above the last bound: no finite upper bound to report
+        self.assertIsNone(h.kvantiili(0.99))
+        self.assertIsNone(json.loads(json.dumps(h.tiedot()), parse_constant=self.fail)["p99_ms"])
+
+class TestPalveluHttp(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.vanha = {k: getattr(Tietokanta, k) for k in ("nykyinen", "data", "versio", "polku", "_tila",
+                                                          "_tarkistettu")}
+        # Installed data; the reload check is not due for an hour
+        Tietokanta.polku = "med_data.json"
+        Tietokanta._asenna(PROTOKOLLAT, None)
+        Tietokanta._tarkistettu = time.monotonic()
+        self.palvelu = AnnostusPalvelu(tarkistusvali=3600)
+        self.palvelin = await self.palvelu.kaynnista("127.0.0.1", 0)
+        self.portti = self.palvelin.sockets[0].getsockname()[1]
+
+    async def asyncTearDown(self):
+        self.palvelin.close()
+        await self.palvelin.wait_closed()
+        for k, v in self.vanha.items():
+            setattr(Tietokanta, k, v)
+
+    def asiakas(self):
+        # One keep-alive connection for every request
+        c = http.client.HTTPConnection("127.0.0.1", self.portti, timeout=5)
+        vastaukset = []
+        for _ in range(3):
+            c.request("POST", "/v1/annokset", json.dumps(dict(POTILAS, protokolla="R-CHOP")),
+                      {"Content-Type": "application/json"})
+            r = c.getresponse()
+            vastaukset.append((r.status, json.loads(r.read())))
+        c.request("GET", "/v1/olematon")
+        r = c.getresponse()
+        vastaukset.append((r.status, json.loads(r.read())))
+        c.request("GET", "/v1/tilastot")
+        r = c.getresponse()
+        vastaukset.append((r.status, json.loads(r.read())))
+        c.close()
+        return vastaukset
+
+    async def test_keep_alive(self):
+        vastaukset = await asyncio.get_running_loop().run_in_executor(None, self.asiakas)
+        self.assertEqual([s for s, _ in vastaukset], [200, 200, 200, 404, 200])
+        self.assertEqual(vastaukset[0][1]["lääkkeet"][0]["määräys"], 750)
+        tilastot = vastaukset[-1][1]
+        self.assertEqual(tilastot["/v1/annokset"]["pyynnot"], 3)
+        self.assertEqual(tilastot["(tuntematon)"]["virheet"], 1)
+
+    def paloittain(self):
+        c = http.client.HTTPConnection("127.0.0.1", self.portti, timeout=5)
+        runko = json.dumps(dict(POTILAS, protokolla="R-CHOP")).encode()
+        c.request("POST", "/v1/annokset", iter([runko]), {"Content-Type": "application/json"},
+                  encode_chunked=True)
+        r = c.getresponse()
+        tulos = r.status, json.loads(r.read()), r.getheader("Connection")
+        c.close()
+        return tulos
+
+    async def test_paloittainen_runko_hylataan(self):
+        tila, vastaus, yhteys = await asyncio.get_running_loop().run_in_executor(None, self.paloittain)
+        self.assertEqual((tila, yhteys), (411, "close"))
+        self.assertIn("Content-Length", vastaus["virhe"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from oncology_helper.data import ProtokollaVarasto, Tietokanta
+from oncology_helper.models import kaanna_protokolla
+from oncology_helper.snapshot import Tilannekuva, avaa_tuore, kirjoita, tilannekuvan_polku
+
+DATA = {
+    "R-CHOP": {"sykli": "21 vrk", "kontrollit": "PVK", "diagnoosi": "Lymfooma", "lääkkeet": [
+        {"nimi": "Vinkristiini", "annos": 1.4, "yksikkö": "mg/m2", "max_mg": 2, "päivät": "D1"},
+        {"nimi": "Prednisoloni", "annos": 100, "yksikkö": "mg", "tablettikoot": ["40 mg", "2,5 mg", "x"],
+         "päivät": "D1-5, D8"}]},
+    "Älä \"lainaa\"": {"lääkkeet": [{"nimi": "Karboplatiini", "annos": 5, "yksikkö": "AUC"}]},
+    "ABVD": {"sykli": "28 vrk", "lääkkeet": []},
+}
+
+class TestTilannekuva(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.polku = os.path.join(self.tmp.name, "med_data.json")
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump(DATA, f, ensure_ascii=False)
+        self.vanha = {k: getattr(Tietokanta, k) for k in ("nykyinen", "data", "versio", "polku", "_tila",
+                                                          "_virhetila", "_tarkistettu")}
+
+    def tearDown(self):
+        for k, v in self.vanha.items():
+            setattr(Tietokanta, k, v)
+        self.tmp.cleanup()
+
+    def kuvapolku(self):
+        st = os.stat(self.polku)
+        return tilannekuvan_polku(self.polku, (st.st_mtime_ns, st.st_size))
+
+    def test_sama_kuin_json(self):
+        odotettu = {nimi: kaanna_protokolla(nimi, d) for nimi, d in DATA.items()}
+        kirjoita(self.polku + ".snap", odotettu, "ab" * 16, (5, 6))
+        kuva = Tilannekuva.avaa(self.polku + ".snap")
+        self.assertEqual(list(kuva), list(DATA))
+        self.assertEqual(dict(kuva.items()), odotettu)
+        self.assertEqual((kuva.tiiviste, kuva.lahde), ("ab" * 16, (5, 6)))
+        self.assertIn("Älä \"lainaa\"", kuva)
+        self.assertNotIn("ABV", kuva)
+        self.assertIsNone(kuva.get(3))
+        with self.assertRaises(KeyError):
+            kuva["Puuttuu"]
+        self.assertIsNone(avaa_tuore(self.polku + ".snap", (5, 7)))
+
+    def test_tietokanta_avaa_tilannekuvan(self):
+        Tietokanta.lataa(self.polku)
+        self.assertIsInstance(Tietokanta.data, Tilannekuva)
+        self.assertEqual(Tietokanta.data.tiiviste, ProtokollaVarasto.avaa(self.polku).tiiviste)
+        self.assertEqual(Tietokanta.data["R-CHOP"].laakkeet[1].vahvuudet, (40.0, 2.5))
+
+        # The snapshot alone is enough
+        kuvapolku = self.kuvapolku()
+        os.remove(self.polku)
+        Tietokanta.lataa(kuvapolku)
+        self.assertEqual(Tietokanta.data["ABVD"].sykli_vrk, 28)
+
+    def test_vanhentunut_ja_virheellinen(self):
+        Tietokanta.lataa(self.polku)
+        vanha, vanha_polku = Tietokanta.data, self.kuvapolku()
+        with open(self.polku, "w", encoding="utf-8") as f:
+            json.dump({"Uusi": {"lääkkeet": []}}, f)
+        os.utime(self.polku, ns=(10 ** 18, 10 ** 18))
+        Tietokanta.lataa(self.polku)
+        self.assertEqual(list(Tietokanta.data), ["Uusi"])
+        # The rebuild went to a new file, so the mapped old snapshot was never
+        # replaced (Windows refuses that) and still reads
+        self.assertNotEqual(self.kuvapolku(), vanha_polku)
+        self.assertEqual(list(vanha), list(DATA))
+        self.assertEqual([n for n in os.listdir(self.tmp.name) if n.endswith(".snap")],
+                         [os.path.basename(self.kuvapolku())])
+
+        with open(self.kuvapolku(), "r+b") as f:
+            f.truncate(40)
+        with self.assertRaises(ValueError):
+            Tilannekuva.avaa(self.kuvapolku())
+        # A broken snapshot is rebuilt
+        Tietokanta.lataa(self.polku)
+        self.assertIsInstance(Tietokanta.data, Tilannekuva)
+
+    def test_kirjoitusvirhe_kayttaa_jsonia(self):
+        os.mkdir(self.kuvapolku())
+        with redirect_stdout(io.StringIO()) as tuloste:
+            Tietokanta.lataa(self.polku)
+        self.assertIsInstance(Tietokanta.data, ProtokollaVarasto)
+        self.assertIn("tilannekuvaa", tuloste.getvalue())
+        self.assertEqual(len(Tietokanta.data), 3)
+
+if __name__ == '__main__':
+    unittest.main()
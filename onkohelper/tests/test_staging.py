@@ -0,0 +1,46 @@
+import unittest
+from oncology_helper.data import STAGE_SAANNOT, TNM_DATA
+from oncology_helper.staging import StageTaulu, STAGE_TAULUT, koodi, laske_stage, laske_stage_sarja
+
+class TestStaging(unittest.TestCase):
+
+    def test_kaikki_tnm_taudit(self):
+        tnm = {t for t, d in TNM_DATA.items() if d["Type"] == "TNM"}
+        self.assertEqual(set(STAGE_SAANNOT), tnm)
+        for tauti, taulu in STAGE_TAULUT.items():
+            self.assertEqual(len(taulu.taulu), len(taulu.t_koodit) * len(taulu.n_koodit) * len(taulu.m_koodit))
+            for ti, t in enumerate(taulu.t_koodit):
+                for ni, n in enumerate(taulu.n_koodit):
+                    for mi, m in enumerate(taulu.m_koodit):
+                        self.assertEqual(taulu.indeksi(ti, ni, mi), taulu.sovella(t, n, m))
+
+    def test_nsclc(self):
+        self.assertEqual(laske_stage("Keuhkosyöpä (NSCLC)", "T1b", "N0", "M0"), "Stage IA2")
+        self.assertEqual(laske_stage("Keuhkosyöpä (NSCLC)", "T2b: >4-5cm", "N0", "M0"), "Stage IIA")
+        self.assertEqual(laske_stage("Keuhkosyöpä (NSCLC)", "T3", "N3", "M0"), "Stage IIIC")
+        self.assertEqual(laske_stage("Keuhkosyöpä (NSCLC)", "T1a", "N0", "M1b"), "Stage IVA")
+        self.assertEqual(laske_stage("Keuhkosyöpä (NSCLC)", "T1a", "N0", "M1c"), "Stage IVB")
+        self.assertEqual(laske_stage("Eturauhassyöpä", "T2a", "N1", "M0"), "Stage IVA")
+        # Grade group 5 is IIIC for any T, so N0 M0 spans up to IIIC
+        for t in ("T1c", "T2b"):
+            self.assertEqual(laske_stage("Eturauhassyöpä", t, "N0", "M0"),
+                             "Stage I-IIIC (PSA:n ja Gleason-ryhmän mukaan)")
+        self.assertEqual(laske_stage("Eturauhassyöpä", "T3a", "N0", "M0"), "Stage IIIB-IIIC (Gleason-ryhmän mukaan)")
+
+    def test_koodit_ja_virheet(self):
+        self.assertEqual(koodi("ypT1c: >10-20 mm"), "T1c")
+        self.assertEqual(laske_stage("Rintasyöpä", "pT2", "N0", "M0"), "Stage IIA")
+        self.assertEqual(laske_stage("Rintasyöpä", "Tx", "N0", "M0"), "Ei määritettävissä")
+        with self.assertRaises(ValueError):
+            laske_stage("Lymfooma (Ann Arbor)", "I", "A", "-")
+
+    def test_sarja_ja_uusi_tauti(self):
+        self.assertEqual(laske_stage_sarja("Keuhkosyöpä (NSCLC)", ["T1c", "T4", "T9"], ["N0", "N1", "N0"], ["M0"] * 3),
+                         ["Stage IA3", "Stage IIIA", "Ei määritettävissä"])
+        # A disease is rules only
+        taulu = StageTaulu("Testi", ["T1", "T2"], ["N0", "N1"], ["M0", "M1"],
+                           [{"M": ["M1"], "stage": "IV"}, {"N": ["N1"], "stage": "III"}, {"stage": "I"}])
+        self.assertEqual(taulu.sarja(["T1", "T2", "T2"], ["N0", "N1", "N1"], ["M0", "M0", "M1"]), ["I", "III", "IV"])
+
+if __name__ == '__main__':
+    unittest.main()
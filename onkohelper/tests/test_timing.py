@@ -0,0 +1,71 @@
+import json
+import os
+import tempfile
+import unittest
+from oncology_helper import timing
+
+class TestAjanotto(unittest.TestCase):
+
+    def setUp(self):
+        self.vanha = timing.kaytossa()
+        timing.nollaa()
+
+    def tearDown(self):
+        timing.ota_kayttoon(self.vanha)
+        timing.nollaa()
+
+    def test_pois_paalta(self):
+        timing.ota_kayttoon(False)
+
+        @timing.ajasta("osio")
+        def f(x):
+            return x + 1
+
+        self.assertEqual(f(1), 2)
+        with timing.mittaa("lohko"):
+            pass
+        self.assertEqual(timing.tilastot(), {})
+
+    def test_paalla(self):
+        timing.ota_kayttoon(True)
+
+        @timing.ajasta()
+        def virheellinen():
+            raise ValueError
+
+        for _ in range(3):
+            with timing.mittaa("lohko"):
+                pass
+        with self.assertRaises(ValueError):
+            virheellinen()
+        t = timing.tilastot()
+        self.assertEqual(t["lohko"]["pyynnot"], 3)
+        self.assertEqual(t["lohko"]["p50_ms"], 0.05)
+        self.assertEqual(t[virheellinen.__qualname__]["virheet"], 1)
+        self.assertIn("lohko", timing.muotoile())
+
+        with tempfile.TemporaryDirectory() as d:
+            polku = os.path.join(d, "ajat.json")
+            timing.tallenna(polku)
+            with open(polku, encoding="utf-8") as f:
+                self.assertEqual(json.load(f)["osiot"]["lohko"]["pyynnot"], 3)
+
+    def test_hitaat_ovat_json(self):
+        timing.kirjaa("hidas", 0.001)
+        timing.kirjaa("hidas", 5.0)
+        t = timing.tilastot()["hidas"]
+        self.assertEqual((t["p50_ms"], t["p99_ms"], t["max_ms"]), (1, None, 5000.0))
+        self.assertIn(">1000", timing.muotoile())
+
+        def ei_aareton(nimi):
+            raise AssertionError(f"{nimi} ei ole JSONia")
+
+        with tempfile.TemporaryDirectory() as d:
+            polku = os.path.join(d, "ajat.json")
+            timing.tallenna(polku)
+            with open(polku, encoding="utf-8") as f:
+                tiedot = json.loads(f.read(), parse_constant=ei_aareton)
+        self.assertIsNone(tiedot["osiot"]["hidas"]["p99_ms"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,4 +1,5 @@
 import streamlit as st
+import json
 import sys
 import os
 import pandas as pd
@@ -6,15 +7,23 @@ import pandas as pd
 # 1. Move set_page_config to the top
 st.set_page_config(page_title="Onkologian Työpöytä", layout="wide")
 
-# Add current directory to path so we can import oncology_helper
-current_dir = os.path.dirname(os.path.abspath(__file__))
-# Add 'onkohelper' subdirectory to path because oncology_helper package is inside it
-package_dir = os.path.join(current_dir, 'onkohelper')
-if package_dir not in sys.path:
-    sys.path.append(package_dir)
+# Use the installed package (`pip install -e .`), or the 'onkohelper'
+# subdirectory of a plain checkout
+try:
+    import oncology_helper
+except ImportError:
+    current_dir = os.path.dirname(os.path.abspath(__file__))
+    package_dir = os.path.join(current_dir, 'onkohelper')
+    if package_dir not in sys.path:
+        sys.path.append(package_dir)
 
 from oncology_helper.data import Tietokanta
-from oncology_helper.logic import safe_float, laske_bsa, laske_cockcroft_gault, pyorista_tabletit
+from oncology_helper.logic import laske_bsa, laske_cockcroft_gault
+from oncology_helper.dosing import laske_maaraykset_sarja, laske_mg_sarja
+from oncology_helper.models import KAIKKI_VAHVUUDET
+from oncology_helper.report import kaanna_pohja, renderoi
+from oncology_helper.audit import laskentamerkinta, oletusloki
+from oncology_helper import timing
 
 # Load Data
 @st.cache_resource
@@ -23,14 +32,232 @@ def load_data():
 
 try:
     load_data()
+    # Picks up edits to med_data.json; cheap stat unless the file changed
+    Tietokanta.paivita(min_vali=2.0)
 except Exception as e:
     st.error(f"Virhe ladattaessa tietokantaa: {e}")
 
+# One immutable version for the whole rerun, shared by reference with every
+# other session; a reload mid-run cannot mix versions
+kanta = Tietokanta.nykyinen
+
 st.title("Onkologian Työpöytä v2.3 (Streamlit)")
 
 # Sidebar for navigation
 view = st.sidebar.radio("Valitse näkymä", ["Laskuri", "Tietoa"])
 
+@st.cache_data(max_entries=10000)
+def laske_potilas(pituus, paino, ika, krea, sukupuoli):
+    """BSA and GFR for the patient panel inputs."""
+    return laske_bsa(pituus, paino), laske_cockcroft_gault(ika, paino, krea, sukupuoli)
+
+@st.cache_data(max_entries=10000)
+def laske_annokset(bsa, paino, gfr, annokset, yksikot, vahvuudet):
+    """
+    Doses for one patient over a protocol's drug table, column-wise.
+
+    Args:
+        annokset, yksikot: Drug table columns as tuples.
+        vahvuudet: Per drug, a tuple of the strengths in mg to combine
+            (empty for no tablet).
+
+    Returns:
+        (tulos mg array, määräys array)
+    """
+    mg = laske_mg_sarja(annokset, yksikot, bsa, paino, gfr)
+    return mg, laske_maaraykset_sarja(mg, vahvuudet)
+
+@timing.ajasta("streamlit.potilaspaneeli")
+def potilaspaneeli():
+    """Patient inputs. Changing them reruns the whole script."""
+    with st.expander("Potilas", expanded=True):
+        pituus = st.number_input("Pituus (cm)", min_value=0.0, step=1.0, format="%.1f")
+        paino = st.number_input("Paino (kg)", min_value=0.0, step=0.1, format="%.1f")
+        ika = st.number_input("Ikä", min_value=0, step=1)
+        krea = st.number_input("Krea", min_value=0, step=1)
+        sukupuoli = st.selectbox("Sukupuoli", ["Mies", "Nainen"])
+        tunniste = st.text_input("Tunniste")
+
+        # Calculations
+        bsa, gfr = laske_potilas(pituus, paino, ika, krea, sukupuoli)
+
+        st.metric("BSA", f"{bsa:.2f} m²")
+        st.metric("GFR", f"{gfr:.0f} ml/min")
+    potilas = {"tunniste": tunniste.strip(), "pituus": pituus, "paino": paino, "ika": ika, "krea": krea,
+               "sukupuoli": sukupuoli}
+    return paino, bsa, gfr, potilas
+
+YKSIKOT = ["mg/m2", "mg/kg", "AUC", "mg"]
+
+def oletusvahvuus(laake):
+    """Initial strength choice of a drug: all sizes, its only size, or none."""
+    if len(laake.tablettikoot) > 1:
+        return KAIKKI_VAHVUUDET
+    return laake.tablettikoot[0] if laake.tablettikoot else None
+
+@timing.ajasta("streamlit.laakeruudukko")
+def laakeruudukko(nimi, protokolla, paino, bsa, gfr):
+    """
+    The protocol's drugs as one editable grid.
+
+    Annos, Yks., Vahvuus and Määräys are editable. A manually edited Määräys is
+    kept until the calculated value for that drug changes, as before.
+
+    Returns:
+        One dict per drug for the report ("med", "vahvuus", "tulos_mg", "maarays"),
+        with "annos", "yksikko" and "laskettu" (calculated prescription) for the audit log.
+    """
+    laakkeet = protokolla.laakkeet
+    tila = st.session_state.get(f"laakkeet_{nimi}")
+    if tila is None or tila["protokolla"] != protokolla:
+        # New protocol, or the protocol changed in a database reload
+        tila = {"protokolla": protokolla, "versio": 0, "pohja": None, "calc": None}
+        st.session_state[f"laakkeet_{nimi}"] = tila
+    avain = f"laakkeet_{nimi}_{tila['versio']}"
+
+    if tila["pohja"] is None:
+        tila["pohja"] = {
+            "Lääke": [m.nimi for m in laakkeet],
+            "Annos": [float(m.annos) for m in laakkeet],
+            "Yks.": [m.yksikko.value for m in laakkeet],
+            "Vahvuus": [oletusvahvuus(m) for m in laakkeet],
+        }
+    df = pd.DataFrame(tila["pohja"])
+
+    # Apply the editor's pending edits before computing, so Tulos reflects them
+    muokkaukset = st.session_state.get(avain, {}).get("edited_rows", {})
+    for rivi, arvot in muokkaukset.items():
+        for sarake, arvo in arvot.items():
+            if sarake in ("Annos", "Yks.", "Vahvuus"):
+                df.at[int(rivi), sarake] = arvo
+
+    # The strength column offers every drug's sizes; a size of another drug is
+    # reset to the drug's default in a fresh editor
+    vaarat = [r for r, (m, v) in enumerate(zip(laakkeet, df["Vahvuus"]))
+              if isinstance(v, str) and v not in m.tablettikoot and not (v == KAIKKI_VAHVUUDET and len(m.tablettikoot) > 1)]
+    if vaarat:
+        for r in vaarat:
+            df.at[r, "Vahvuus"] = oletusvahvuus(laakkeet[r])
+        tila["pohja"] = df[["Lääke", "Annos", "Yks.", "Vahvuus"]].to_dict("list")
+        tila["versio"] += 1
+        avain = f"laakkeet_{nimi}_{tila['versio']}"
+        muokkaukset = {}
+
+    # Empty grid cells come back as None or NaN
+    valinnat = [v if isinstance(v, str) else None for v in df["Vahvuus"]]
+    vahvuudet = tuple(m.vahvuudet_valinnalle(v) for m, v in zip(laakkeet, valinnat))
+    mg, laskettu = laske_annokset(bsa, paino, gfr, tuple(df["Annos"].fillna(0.0)), tuple(df["Yks."].fillna("mg/m2")), vahvuudet)
+
+    kasin = {int(r): a["Määräys"] for r, a in muokkaukset.items() if a.get("Määräys") is not None}
+    if kasin and tila["calc"] is not None and any(laskettu[r] != tila["calc"][r] for r in kasin):
+        # The calculation changed under a manual prescription: start a fresh
+        # editor that keeps the dose/unit/strength edits but drops the overrides
+        tila["pohja"] = df[["Lääke", "Annos", "Yks.", "Vahvuus"]].to_dict("list")
+        tila["versio"] += 1
+        avain = f"laakkeet_{nimi}_{tila['versio']}"
+        kasin = {}
+    tila["calc"] = [int(x) for x in laskettu]
+
+    df["Tulos (mg)"] = mg.round()
+    df["Määräys"] = laskettu
+    for r, arvo in kasin.items():
+        df.at[r, "Määräys"] = arvo
+
+    koot = {t: mg for m in laakkeet for t, mg in zip(m.tablettikoot, m.vahvuudet)}
+    vahvuus_opts = sorted(koot, key=lambda t: (koot[t], t))
+    if any(len(m.tablettikoot) > 1 for m in laakkeet):
+        vahvuus_opts.insert(0, KAIKKI_VAHVUUDET)
+    yksikko_opts = YKSIKOT + sorted({m.yksikko.value for m in laakkeet} - set(YKSIKOT))
+    muokattu = st.data_editor(
+        df,
+        key=avain,
+        hide_index=True,
+        num_rows="fixed",
+        width="stretch",
+        disabled=["Lääke", "Tulos (mg)"],
+        column_config={
+            "Annos": st.column_config.NumberColumn(step=10.0),
+            "Yks.": st.column_config.SelectboxColumn(options=yksikko_opts, required=True),
+            "Vahvuus": st.column_config.SelectboxColumn(options=vahvuus_opts),
+            "Tulos (mg)": st.column_config.NumberColumn(format="%.0f"),
+            "Määräys": st.column_config.NumberColumn(step=1),
+        },
+    )
+
+    # A cleared Määräys cell falls back to the calculated prescription
+    return [
+        {"med": m, "vahvuus": v if isinstance(v, str) else "None", "tulos_mg": t,
+         "maarays": int(f) if pd.notna(f) else c, "annos": float(a), "yksikko": u, "laskettu": c}
+        for m, v, t, f, a, u, c in zip(laakkeet, muokattu["Vahvuus"], muokattu["Tulos (mg)"],
+                                       muokattu["Määräys"], muokattu["Annos"].fillna(0.0),
+                                       muokattu["Yks."], tila["calc"])
+    ]
+
+def kirjaa_laskenta(nimi, potilas, bsa, gfr, rivit):
+    """
+    Queues the calculation to the audit log when it, or its manual
+    overrides, changed since the last entry of this session.
+    """
+    loki = oletusloki()
+    if loki is None or bsa <= 0:
+        return
+    laakkeet = [{"nimi": r["med"].nimi, "annos": r["annos"], "yksikkö": r["yksikko"],
+                 "vahvuus": None if r["vahvuus"] == "None" else r["vahvuus"], "mg": float(r["tulos_mg"]),
+                 "laskettu": r["laskettu"], "määräys": r["maarays"]} for r in rivit]
+    avaimet = ("nimi", "annos", "yksikkö", "vahvuus", "laskettu")
+    laskenta = (tuple(potilas.items()), nimi, tuple(tuple(l[k] for k in avaimet) for l in laakkeet))
+    maaraykset = tuple(l["määräys"] for l in laakkeet)
+    edellinen = st.session_state.get("kirjattu_laskenta")
+    if edellinen is not None and edellinen[0] == laskenta:
+        if edellinen[1] == maaraykset:
+            return
+        tapahtuma = "muutos"
+    else:
+        tapahtuma = "laskenta"
+    st.session_state["kirjattu_laskenta"] = (laskenta, maaraykset)
+    tiedot = {k: v for k, v in potilas.items() if k != "tunniste"}
+    loki.kirjaa(laskentamerkinta("streamlit", tapahtuma, potilas["tunniste"], nimi, tiedot, bsa, gfr, laakkeet))
+
+@st.fragment
+@timing.ajasta("streamlit.hoito_osio")
+def hoito_osio(kanta, paino, bsa, gfr, potilas):
+    """Protocol, drug grid and report. Edits here rerun only this fragment."""
+    st.subheader("Hoito")
+    data = kanta.protokollat
+    haku = st.text_input("Hae protokollaa", placeholder="Nimi, lääke, diagnoosi tai yksikkö (esim. karbo auc)")
+    if haku.strip():
+        protokollat = Tietokanta.hae(haku, kanta=kanta)
+    else:
+        protokollat = list(data.keys())
+    valittu_protokolla = st.selectbox("Protokolla", [""] + protokollat)
+
+    # Labs default value
+    labrat_default = ""
+    protokolla_data = None
+    if valittu_protokolla and valittu_protokolla in data:
+        protokolla_data = data[valittu_protokolla]
+        labrat_default = protokolla_data.kontrollit
+
+    # Use key to force update when protocol changes
+    labrat = st.text_input("Labrat", value=labrat_default, key=f"labrat_{valittu_protokolla}")
+
+    if not protokolla_data:
+        return
+
+    st.subheader("Lääkkeet")
+    laske_tulokset = laakeruudukko(valittu_protokolla, protokolla_data, paino, bsa, gfr)
+    kirjaa_laskenta(valittu_protokolla, potilas, bsa, gfr, laske_tulokset)
+
+    # Report Generation
+    st.subheader("Raportti")
+
+    with timing.mittaa("streamlit.raportti"):
+        raportti = renderoi(kaanna_pohja(valittu_protokolla, protokolla_data), labrat, laske_tulokset)
+        st.text_area("Kopioitava teksti", raportti.teksti, height=300)
+    c1, c2 = st.columns(2)
+    c1.download_button("Lataa HTML", raportti.html, file_name="raportti.html", mime="text/html", on_click="ignore")
+    c2.download_button("Lataa JSON", raportti.json, file_name="raportti.json", mime="application/json", on_click="ignore")
+
 if view == "Laskuri":
     st.header("Sytostaattilaskuri")
 
@@ -38,160 +265,22 @@ if view == "Laskuri":
     col1, col2 = st.columns([1, 2])
 
     with col1:
-        with st.expander("Potilas", expanded=True):
-            pituus = st.number_input("Pituus (cm)", min_value=0.0, step=1.0, format="%.1f")
-            paino = st.number_input("Paino (kg)", min_value=0.0, step=0.1, format="%.1f")
-            ika = st.number_input("Ikä", min_value=0, step=1)
-            krea = st.number_input("Krea", min_value=0, step=1)
-            sukupuoli = st.selectbox("Sukupuoli", ["Mies", "Nainen"])
-
-            # Calculations
-            bsa = laske_bsa(pituus, paino)
-            gfr = laske_cockcroft_gault(ika, paino, krea, sukupuoli)
-
-            st.metric("BSA", f"{bsa:.2f} m²")
-            st.metric("GFR", f"{gfr:.0f} ml/min")
+        paino, bsa, gfr, potilas = potilaspaneeli()
 
     with col2:
-        st.subheader("Hoito")
-        protokollat = list(Tietokanta.data.keys())
-        valittu_protokolla = st.selectbox("Protokolla", [""] + protokollat)
-
-        # Labs default value
-        labrat_default = ""
-        protokolla_data = None
-        if valittu_protokolla and valittu_protokolla in Tietokanta.data:
-            protokolla_data = Tietokanta.data[valittu_protokolla]
-            labrat_default = protokolla_data.get('kontrollit', '')
-
-        # Use key to force update when protocol changes
-        labrat = st.text_input("Labrat", value=labrat_default, key=f"labrat_{valittu_protokolla}")
-
-        if protokolla_data:
-            st.subheader("Lääkkeet")
-
-            laske_tulokset = []
-
-            # Header
-            cols = st.columns([3, 2, 2, 2, 2, 2])
-            cols[0].markdown("**Lääke**")
-            cols[1].markdown("**Annos**")
-            cols[2].markdown("**Yks.**")
-            cols[3].markdown("**Vahvuus**")
-            cols[4].markdown("**Tulos (mg)**")
-            cols[5].markdown("**Määräys**")
-
-            for i, med in enumerate(protokolla_data['lääkkeet']):
-                c = st.columns([3, 2, 2, 2, 2, 2])
-
-                # Name
-                c[0].write(med['nimi'])
-
-                # 2. Fix sticky widget state issue by adding valittu_protokolla to keys
-
-                # Dose (Annos)
-                annos_val = med['annos']
-                annos = c[1].number_input(f"Annos {i}", value=float(annos_val), step=10.0, label_visibility="collapsed", key=f"{valittu_protokolla}_annos_{i}")
-
-                # Unit (Yksikkö)
-                yksikkö_val = med.get('yksikkö', 'mg/m2')
-                yksikkö_opts = ["mg/m2", "mg/kg", "AUC", "mg"]
-                if yksikkö_val not in yksikkö_opts:
-                    yksikkö_opts.append(yksikkö_val)
-                # Ensure default is in options
-                idx = yksikkö_opts.index(yksikkö_val) if yksikkö_val in yksikkö_opts else 0
-                yksikkö = c[2].selectbox(f"Yks {i}", yksikkö_opts, index=idx, label_visibility="collapsed", key=f"{valittu_protokolla}_yks_{i}")
-
-                # Strength (Vahvuus / Tablettikoot)
-                tablettikoot = med.get("tablettikoot", [])
-                vahvuus_str = "None"
-                if tablettikoot:
-                    vahvuus_str = c[3].selectbox(f"Vahv {i}", tablettikoot, label_visibility="collapsed", key=f"{valittu_protokolla}_vahv_{i}")
-                else:
-                    c[3].write("-")
-
-                # Calculate Result
-                mg = 0.0
-                if yksikkö == "mg/m2":
-                    mg = annos * bsa
-                elif yksikkö == "mg/kg":
-                    mg = annos * paino
-                elif yksikkö == "AUC":
-                     # Calvert formula: Dose = AUC * (GFR + 25)
-                     # GFR cap is often 125 ml/min
-                    mg = annos * (min(gfr, 125) + 25)
-                else: # mg
-                    mg = annos
-
-                c[4].write(f"{mg:.0f}")
-
-                # Final Amount (Määräys)
-                fin = int(round(mg))
-                if vahvuus_str and vahvuus_str != "None":
-                    try:
-                        strength = float(vahvuus_str.split()[0])
-                        fin = pyorista_tabletit(mg, strength)
-                    except:
-                        pass
-
-                # Use a session state key that includes the calculated value to force update if calculation changes
-                # But to allow manual edit, we need to be careful.
-                # A common pattern is:
-                # If calculated value differs from stored calculated value, update 'maarays' state.
-
-                state_key = f"{valittu_protokolla}_maar_{i}"
-                calc_key = f"{valittu_protokolla}_calc_{i}"
-
-                # Check if calculation changed since last run
-                if calc_key not in st.session_state or st.session_state[calc_key] != fin:
-                    st.session_state[state_key] = int(fin)
-                    st.session_state[calc_key] = fin
-
-                maarays = c[5].number_input(f"Määräys {i}", step=1, label_visibility="collapsed", key=state_key)
-
-                laske_tulokset.append({
-                    "med": med,
-                    "annos": annos,
-                    "yksikkö": yksikkö,
-                    "vahvuus": vahvuus_str,
-                    "tulos_mg": mg,
-                    "maarays": maarays
-                })
-
-            # Report Generation
-            st.subheader("Raportti")
-
-            report_lines = []
-            report_lines.append(f"PROTOKOLLA: {valittu_protokolla}")
-            if "sykli" in protokolla_data:
-                report_lines.append(f"Sykli: {protokolla_data['sykli']}")
-            report_lines.append(f"Labrat: {labrat}")
-            report_lines.append("-" * 40)
-
-            for item in laske_tulokset:
-                med = item['med']
-                fin_val = item['maarays']
-
-                report_lines.append(f"• {med['nimi']}: {fin_val} mg")
-
-                ts = item['vahvuus']
-                if ts and ts != "None" and fin_val > 0:
-                    try:
-                        strength = float(ts.split()[0])
-                        count = fin_val / strength
-                        report_lines.append(f"    -> {count:.1f} kpl ({ts})")
-                    except:
-                        pass
-
-                if med.get('päivät'):
-                    report_lines.append(f"   Ajoitus: {med['päivät']}")
-
-            report_lines.append("-" * 40)
-            report_lines.append(f"TUKIHOIDOT:\n{protokolla_data.get('esilääkitys', '-')}")
-
-            report_text = "\n".join(report_lines)
-            st.text_area("Kopioitava teksti", report_text, height=300)
-
+        hoito_osio(kanta, paino, bsa, gfr, potilas)
 
 elif view == "Tietoa":
     st.info("Tämä on Streamlit-versio Onkologian Työpöytä -sovelluksesta.")
+
+if timing.kaytossa():
+    # Debug panel (ONKOHELPER_AJANOTTO=1); a fragment rerun does not refresh it
+    with st.sidebar.expander("Ajanotto"):
+        tilastot = timing.tilastot()
+        if tilastot:
+            sarakkeet = ["pyynnot", "keskiarvo_ms", "p50_ms", "p90_ms", "p99_ms", "max_ms"]
+            st.dataframe(pd.DataFrame.from_dict(tilastot, orient="index")[sarakkeet])
+            st.download_button("Lataa JSON", json.dumps(tilastot, ensure_ascii=False), file_name="ajanotto.json",
+                               mime="application/json", on_click="ignore")
+        if st.button("Nollaa"):
+            timing.nollaa()